@@ -0,0 +1,76 @@
+import threading
+from contextlib import contextmanager
+
+from log_config import get_logger
+
+logger = get_logger()
+
+DEFAULT_POOL_SIZE = 8
+
+
+class DriveClientPool:
+    """Checkout/return pool of Drive API clients.
+
+    googleapiclient service objects and their httplib2 transports are not
+    thread-safe, so each concurrent worker checks out a client of its own.
+    Clients are created lazily by client_factory, reused after they are
+    returned, and keep their HTTP connections alive between calls.
+    """
+
+    def __init__(self, client_factory, size=DEFAULT_POOL_SIZE):
+        """Initialize the pool.
+
+        Args:
+            client_factory: Callable returning a new Drive client
+            size: Maximum number of clients checked out at the same time
+        """
+        if size < 1:
+            raise ValueError("Drive client pool size must be at least 1.")
+
+        self.client_factory = client_factory
+        self.size = size
+        self.created = 0
+        self.in_use = 0
+        self.idle = []
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def client(self):
+        """Check out a client for the duration of a with block.
+
+        Blocks while size clients are already checked out.
+        """
+        with self.condition:
+            while self.in_use >= self.size:
+                self.condition.wait()
+            self.in_use += 1
+            client = self.idle.pop() if self.idle else None
+
+        try:
+            if client is None:
+                client = self.client_factory()
+                with self.condition:
+                    self.created += 1
+            yield client
+        finally:
+            with self.condition:
+                self.in_use -= 1
+                if client is not None and len(self.idle) < self.size:
+                    self.idle.append(client)
+                self.condition.notify()
+
+    def resize(self, size):
+        """Change the maximum number of clients checked out at the same time.
+
+        Shrinking does not interrupt checked-out clients; new checkouts wait
+        until usage drops below the new size.
+        """
+        if size < 1:
+            raise ValueError("Drive client pool size must be at least 1.")
+
+        with self.condition:
+            self.size = size
+            del self.idle[size:]
+            self.condition.notify_all()
+
+        logger.info(f"Drive client pool resized to {size}")
@@ -1,27 +1,137 @@
 import logging
 import os
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta, timezone
 
 from dotenv import load_dotenv
 from google.cloud import firestore
 from google.oauth2 import service_account
 
 from log_config import get_logger
+from status_journal import get_status_journal
+from status_mirror import StatusMirror
+from status_writer import StatusWriter
+from token_cache import get_token_cache
 
 load_dotenv()
 
 logger = get_logger()
 
+# Documents requested per get_all call in get_file_statuses
+STATUS_LOOKUP_CHUNK_SIZE = 300
+
+# How long a processing claim is valid without a heartbeat; a machine that
+# crashes mid-file releases it once this runs out
+LEASE_DURATION = 15 * 60
+
+# How often held leases are extended while files are being processed
+HEARTBEAT_INTERVAL = LEASE_DURATION / 3
+
+# Status of uploaded files whose documents status_compaction replaced by a
+# tombstone
+ARCHIVED_STATUS = "archived"
+
+# Statuses of uploaded files
+UPLOADED_STATUSES = ("uploaded", ARCHIVED_STATUS)
+
+# Statuses of files that need no further processing and cannot be claimed
+DONE_STATUSES = UPLOADED_STATUSES + ("processed",)
+
+FIRESTORE_SCOPES = (
+    "https://www.googleapis.com/auth/cloud-platform",
+    "https://www.googleapis.com/auth/datastore",
+)
+
+# Firestore clients shared by every service in the process, keyed by the
+# resolved credentials path; collection references by (path, collection)
+_clients = {}
+_collections = {}
+_registry_lock = threading.Lock()
+
+
+def get_firestore_collection(credentials_path, collection_name):
+    """Return a collection reference on the process-wide client for a key file.
+
+    The first call for a credentials file loads it and opens the client's
+    channel; later calls, from any service, reuse them.
+
+    Returns:
+        tuple: (client, collection reference)
+    """
+    key = os.path.realpath(credentials_path)
+    with _registry_lock:
+        db = _clients.get(key)
+        if db is None:
+            credentials = service_account.Credentials.from_service_account_file(
+                credentials_path
+            )
+            token_cache = get_token_cache()
+            if token_cache:
+                # Cached tokens are keyed by scopes, so request them explicitly
+                credentials = credentials.with_scopes(FIRESTORE_SCOPES)
+                token_cache.ensure_fresh(credentials)
+            db = firestore.Client(credentials=credentials)
+            _clients[key] = db
+            logger.info(f"Opened Firestore client for {credentials_path}")
+
+        collection = _collections.get((key, collection_name))
+        if collection is None:
+            collection = db.collection(collection_name)
+            _collections[(key, collection_name)] = collection
+
+    return db, collection
+
+
+def clear_firestore_clients():
+    """Forget the shared clients, so the next service opens new ones."""
+    with _registry_lock:
+        _clients.clear()
+        _collections.clear()
+
+
+def lease_expiry(data):
+    """Return when the processing claim in a status document runs out.
+
+    Documents written before leases existed fall back to updated_at plus
+    LEASE_DURATION, so files stranded in processing become claimable again.
+
+    Returns:
+        datetime: Timezone-aware expiry, or None if the document has no timestamp
+    """
+    if data.get("lease_until"):
+        return datetime.fromisoformat(data["lease_until"])
+
+    if data.get("updated_at"):
+        updated_at = datetime.fromisoformat(data["updated_at"])
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.astimezone()
+        return updated_at + timedelta(seconds=LEASE_DURATION)
+
+    return None
+
+
+def lease_active(data):
+    """Return True if a status document holds an unexpired processing claim."""
+    if not data or data.get("status") != "processing":
+        return False
+
+    expiry = lease_expiry(data)
+    return expiry is None or expiry > datetime.now(timezone.utc)
+
 
 class FirestoreService:
     """Service for tracking file processing status in Firestore."""
 
-    def __init__(self, collection_name="processed_files", credentials_path=None):
+    def __init__(
+        self, collection_name="processed_files", credentials_path=None, mirror=False
+    ):
         """Initialize Firestore service.
 
         Args:
             collection_name: Name of the Firestore collection to use
             credentials_path: Path to Firebase credentials JSON file
+            mirror: Answer status queries from a live in-memory mirror of the
+                collection, see start_status_mirror
         """
         credentials_path = credentials_path or os.environ.get(
             "FIREBASE_CREDENTIALS_PATH"
@@ -34,68 +144,254 @@ class FirestoreService:
                 f"Firebase credentials file not found at {credentials_path}"
             )
 
-        # Create credentials and client
-        credentials = service_account.Credentials.from_service_account_file(
-            credentials_path
+        # Services in the process share one client per credentials file
+        self.db, self.collection = get_firestore_collection(
+            credentials_path, collection_name
+        )
+        self.writer = StatusWriter(self.db)
+
+        # Files claimed by this process whose leases the heartbeat extends
+        self.leases = {}
+        self.lease_lock = threading.Lock()
+        self.heartbeat_thread = None
+        self.heartbeat_stop = threading.Event()
+
+        self.status_mirror = None
+        if mirror:
+            self.start_status_mirror()
+
+        # Transitions go to a local journal first when STATUS_JOURNAL=1
+        self.journal = get_status_journal()
+        if self.journal:
+            self.journal.start(self.db, self.collection)
+
+    def start_status_mirror(self, non_terminal_only=False, max_staleness=None):
+        """Mirror the collection in memory with a snapshot listener.
+
+        Intended for long-running workers: get_file_status, get_file_statuses,
+        is_processed and is_uploaded are then answered from memory, and fall
+        back to Firestore reads whenever the listener is disconnected.
+
+        Args:
+            non_terminal_only: Only mirror files that are processing or failed
+            max_staleness: Seconds without a snapshot after which the mirror
+                is bypassed
+
+        Returns:
+            bool: True if the mirror synced and is answering queries
+        """
+        self.stop_status_mirror()
+        self.status_mirror = StatusMirror(
+            self.collection,
+            non_terminal_only=non_terminal_only,
+            max_staleness=max_staleness,
         )
-        self.db = firestore.Client(credentials=credentials)
-        self.collection = self.db.collection(collection_name)
+        return self.status_mirror.start()
 
-    def mark_as_processing(self, file_id, machine_id=None):
-        """Mark a file as currently being processed.
+    def stop_status_mirror(self):
+        """Stop the snapshot listener and read statuses from Firestore again."""
+        if self.status_mirror is not None:
+            self.status_mirror.stop()
+            self.status_mirror = None
+
+    def mirror_staleness(self):
+        """Seconds since the mirror last received a snapshot, or None without one."""
+        if self.status_mirror is None:
+            return None
+        return self.status_mirror.staleness()
+
+    def _lookup_mirror(self, file_id):
+        if self.status_mirror is not None:
+            known, status = self.status_mirror.lookup(file_id)
+            if known:
+                return known, status
+        if self.journal is not None:
+            return self.journal.lookup(self.collection.id, file_id)
+        return False, None
+
+    def _update_mirror(self, file_id, data):
+        if self.status_mirror is not None:
+            self.status_mirror.put(file_id, data)
+
+    def _write(self, file_id, data, increments=None, defer=False):
+        """Write status fields through the journal, or the batching writer."""
+        if self.journal is not None:
+            self.journal.record(self.collection.id, file_id, data, increments)
+        else:
+            self.writer.write(
+                self.collection.document(file_id),
+                data,
+                increments=increments,
+                defer=defer,
+            )
+
+    def mark_as_processing(
+        self, file_id, machine_id=None, lease_seconds=LEASE_DURATION
+    ):
+        """Claim a file for processing.
+
+        The claim is made in a transaction, so only one machine can win it, and
+        holds a lease until lease_until. Leases of claimed files are extended by
+        a heartbeat until the file is marked processed, uploaded or failed; a
+        claim whose lease ran out can be taken over.
 
         Args:
             file_id: Google Drive file ID
             machine_id: Identifier for the machine doing the processing
+            lease_seconds: Validity of the claim without a heartbeat
 
         Returns:
             bool: True if successfully marked as processing, False if already being processed
         """
         doc_ref = self.collection.document(file_id)
-        doc = doc_ref.get()
 
         # Get machine ID (hostname if not provided)
         if not machine_id:
             machine_id = os.uname().nodename
 
-        current_time = datetime.now().isoformat()
+        # Claims must see deferred status writes of this file; those of other
+        # files stay queued to share a batch
+        self.flush(file_id)
+
+        @firestore.transactional
+        def claim(transaction):
+            doc = doc_ref.get(transaction=transaction)
+            previous = doc.to_dict() if doc.exists else {}
 
-        if doc.exists:
-            data = doc.to_dict()
-            if data.get("status") == "processing":
-                processing_time = data.get("updated_at")
-                machine = data.get("machine_id")
+            # The status read before the claim may be stale; never redo a file
+            if previous.get("status") in DONE_STATUSES:
                 logger.info(
-                    f"File {file_id} is already being processed by {machine} since {processing_time}"
+                    f"File {file_id} is already {previous['status']}, not claiming it"
+                )
+                return None
+
+            if lease_active(previous):
+                logger.info(
+                    f"File {file_id} is already being processed by {previous.get('machine_id')} "
+                    f"since {previous.get('updated_at')}"
+                )
+                return None
+
+            if previous.get("status") == "processing":
+                logger.warning(
+                    f"Lease of {previous.get('machine_id')} on file {file_id} expired, taking over"
                 )
-                return False
 
-        # Set or update the document
-        doc_ref.set(
-            {
+            now = datetime.now(timezone.utc)
+            data = {
                 "status": "processing",
                 "machine_id": machine_id,
-                "updated_at": current_time,
-                "retry_count": 0,
+                "updated_at": datetime.now().isoformat(),
+                "lease_until": (now + timedelta(seconds=lease_seconds)).isoformat(),
+                # Keep the count of earlier failed attempts for the retry limit
+                "retry_count": previous.get("retry_count", 0),
             }
-        )
+            transaction.set(doc_ref, data)
+            return data
+
+        data = claim(self.db.transaction())
+        if data is None:
+            return False
+
+        if self.journal is not None:
+            self.journal.put(self.collection.id, file_id, data)
+        self._update_mirror(file_id, data)
+        self._hold_lease(file_id, machine_id, lease_seconds)
 
         logger.info(f"Marked file {file_id} as processing by {machine_id}")
         return True
 
-    def mark_as_processed(self, file_id, machine_id=None, additional_data=None):
+    def flush(self, file_id=None):
+        """Commit status writes that were deferred or journaled.
+
+        Args:
+            file_id: Only commit the writes of this file; all by default
+
+        Returns:
+            int: Number of documents written, or of journal entries pushed
+        """
+        if self.journal is not None:
+            return self.journal.sync(self.db, self.collection, file_id)
+        if file_id is not None:
+            return self.writer.flush([self.collection.document(file_id).path])
+        return self.writer.flush()
+
+    def renew_lease(self, file_id, machine_id, lease_seconds=LEASE_DURATION):
+        """Extend this machine's processing lease on a file.
+
+        Returns:
+            bool: True if the lease was extended, False if it is no longer held
+        """
+        doc_ref = self.collection.document(file_id)
+
+        @firestore.transactional
+        def renew(transaction):
+            doc = doc_ref.get(transaction=transaction)
+            data = doc.to_dict() if doc.exists else {}
+            if (
+                data.get("status") != "processing"
+                or data.get("machine_id") != machine_id
+            ):
+                return False
+
+            lease_until = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+            transaction.update(doc_ref, {"lease_until": lease_until.isoformat()})
+            return True
+
+        return renew(self.db.transaction())
+
+    def _hold_lease(self, file_id, machine_id, lease_seconds):
+        with self.lease_lock:
+            self.leases[file_id] = (machine_id, lease_seconds)
+            if self.heartbeat_thread is None or not self.heartbeat_thread.is_alive():
+                self.heartbeat_stop.clear()
+                self.heartbeat_thread = threading.Thread(
+                    target=self._heartbeat, name="lease-heartbeat", daemon=True
+                )
+                self.heartbeat_thread.start()
+
+    def _release_lease(self, file_id):
+        with self.lease_lock:
+            self.leases.pop(file_id, None)
+
+    def _heartbeat(self):
+        """Extend held leases until stop_heartbeat is called."""
+        while not self.heartbeat_stop.wait(HEARTBEAT_INTERVAL):
+            with self.lease_lock:
+                leases = dict(self.leases)
+
+            for file_id, (machine_id, lease_seconds) in leases.items():
+                try:
+                    renewed = self.renew_lease(file_id, machine_id, lease_seconds)
+                except Exception as e:
+                    logger.error(f"Error renewing lease on file {file_id}: {str(e)}")
+                    continue
+
+                if not renewed:
+                    logger.warning(f"Lost processing lease on file {file_id}")
+                    self._release_lease(file_id)
+
+    def stop_heartbeat(self):
+        """Stop extending leases, e.g. before the process exits."""
+        self.heartbeat_stop.set()
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join()
+            self.heartbeat_thread = None
+
+    def mark_as_processed(
+        self, file_id, machine_id=None, additional_data=None, defer=False
+    ):
         """Mark a file as successfully processed.
 
         Args:
             file_id: Google Drive file ID
             machine_id: Identifier for the machine that did the processing
             additional_data: Optional dictionary with additional information to store
+            defer: Commit with later writes instead of right away, see flush
 
         Returns:
             bool: True if successfully marked as processed
         """
-        doc_ref = self.collection.document(file_id)
-
         # Get machine ID (hostname if not provided)
         if not machine_id:
             machine_id = os.uname().nodename
@@ -113,24 +409,27 @@ class FirestoreService:
         if additional_data and isinstance(additional_data, dict):
             data.update(additional_data)
 
-        doc_ref.set(data)
+        self._write(file_id, data, defer=defer)
+        self._update_mirror(file_id, data)
+        self._release_lease(file_id)
 
         logger.info(f"Marked file {file_id} as processed by {machine_id}")
         return True
 
-    def mark_as_uploaded(self, file_id, machine_id=None, additional_data=None):
+    def mark_as_uploaded(
+        self, file_id, machine_id=None, additional_data=None, defer=False
+    ):
         """Mark a file as successfully uploaded.
 
         Args:
             file_id: Google Drive file ID
             machine_id: Identifier for the machine that did the processing
             additional_data: Optional dictionary with additional information to store
+            defer: Commit with later writes instead of right away, see flush
 
         Returns:
             bool: True if successfully marked as processed
         """
-        doc_ref = self.collection.document(file_id)
-
         # Get machine ID (hostname if not provided)
         if not machine_id:
             machine_id = os.uname().nodename
@@ -148,7 +447,9 @@ class FirestoreService:
         if additional_data and isinstance(additional_data, dict):
             data.update(additional_data)
 
-        doc_ref.set(data)
+        self._write(file_id, data, defer=defer)
+        self._update_mirror(file_id, data)
+        self._release_lease(file_id)
 
         logger.info(f"Marked file {file_id} as uploaded by {machine_id}")
         return True
@@ -162,6 +463,10 @@ class FirestoreService:
         Returns:
             bool: True if the file has been processed
         """
+        known, status = self._lookup_mirror(file_id)
+        if known:
+            return bool(status) and status.get("status") == "processed"
+
         doc_ref = self.collection.document(file_id)
         doc = doc_ref.get()
 
@@ -180,6 +485,10 @@ class FirestoreService:
         Returns:
             bool: True if the file has been uploaded
         """
+        known, status = self._lookup_mirror(file_id)
+        if known:
+            return bool(status) and status.get("status") in UPLOADED_STATUSES
+
         doc_ref = self.collection.document(file_id)
         doc = doc_ref.get()
 
@@ -187,7 +496,7 @@ class FirestoreService:
             return False
 
         data = doc.to_dict()
-        return data.get("status") == "uploaded"
+        return data.get("status") in UPLOADED_STATUSES
 
     def get_file_status(self, file_id):
         """Get the current status of a file.
@@ -198,6 +507,10 @@ class FirestoreService:
         Returns:
             dict: File status information or None if not found
         """
+        known, status = self._lookup_mirror(file_id)
+        if known:
+            return status
+
         doc_ref = self.collection.document(file_id)
         doc = doc_ref.get()
 
@@ -206,44 +519,74 @@ class FirestoreService:
 
         return doc.to_dict()
 
-    def mark_as_failed(self, file_id, machine_id=None, error_message=None):
+    def get_file_statuses(self, file_ids, chunk_size=STATUS_LOOKUP_CHUNK_SIZE):
+        """Get the current status of several files in a few round-trips.
+
+        Args:
+            file_ids: Google Drive file IDs
+            chunk_size: Maximum number of documents fetched per get_all call
+
+        Returns:
+            dict: Maps each file ID to its status information, or None if not found
+        """
+        statuses = {}
+        unknown_ids = []
+        for file_id in dict.fromkeys(file_ids):
+            known, status = self._lookup_mirror(file_id)
+            statuses[file_id] = status
+            if not known:
+                unknown_ids.append(file_id)
+        file_ids = unknown_ids
+
+        for start in range(0, len(file_ids), chunk_size):
+            doc_refs = [
+                self.collection.document(file_id)
+                for file_id in file_ids[start : start + chunk_size]
+            ]
+            for doc in self.db.get_all(doc_refs):
+                if doc.exists:
+                    statuses[doc.id] = doc.to_dict()
+
+        return statuses
+
+    def mark_as_failed(self, file_id, machine_id=None, error_message=None, defer=False):
         """Mark a file as failed processing.
 
         Args:
             file_id: Google Drive file ID
             machine_id: Identifier for the machine that failed processing
             error_message: Optional error message describing the failure
+            defer: Commit with later writes instead of right away, see flush
 
         Returns:
             bool: True if successfully marked as failed
         """
-        doc_ref = self.collection.document(file_id)
-
         # Get machine ID (hostname if not provided)
         if not machine_id:
             machine_id = os.uname().nodename
 
         current_time = datetime.now().isoformat()
 
-        # Get current retry count
-        doc = doc_ref.get()
-        retry_count = 0
-        if doc.exists:
-            data = doc.to_dict()
-            retry_count = data.get("retry_count", 0)
-
         data = {
             "status": "failed",
             "machine_id": machine_id,
             "updated_at": current_time,
             "failed_at": current_time,
-            "retry_count": retry_count + 1,
         }
 
         if error_message:
             data["error_message"] = error_message
 
-        doc_ref.set(data)
+        # The local copy of retry_count is only known before the write
+        known, status = self._lookup_mirror(file_id)
+
+        # retry_count is incremented on the server, no read needed
+        self._write(file_id, data, increments={"retry_count": 1}, defer=defer)
+
+        if known:
+            data["retry_count"] = (status or {}).get("retry_count", 0) + 1
+        self._update_mirror(file_id, data)
+        self._release_lease(file_id)
 
         logger.error(f"Marked file {file_id} as failed by {machine_id}")
         return True
@@ -1,15 +1,184 @@
+import hashlib
+import json
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
 
+import httplib2
 from dotenv import load_dotenv
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
 
-from firestore_service import FirestoreService
+from drive_client_pool import DEFAULT_POOL_SIZE, DriveClientPool
 from log_config import get_logger
+from rate_limiter import (
+    ConcurrencyController,
+    get_rate_limiter,
+    is_retryable,
+    is_throttled,
+)
+from status_cache import RunStatusCache
+from status_store import create_status_store
+from token_cache import get_token_cache
 
 logger = get_logger()
 
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+# Drive accepts up to 1000 results per files.list page
+LIST_PAGE_SIZE = 1000
+
+# Socket timeout in seconds for pooled Drive clients
+HTTP_TIMEOUT = 60
+
+# Number of folder IDs OR-ed together into a single files.list query
+PARENTS_PER_QUERY = 10
+
+# Metadata requested for every listed file, so later stages (scheduling,
+# dedupe, integrity checks, archiving) never need a separate files().get
+FILE_FIELDS = (
+    "id, name, mimeType, size, md5Checksum, createdTime, modifiedTime, parents"
+)
+
+# Drive's name "contains" operator only prefix-matches, so raw files cannot be
+# selected by extension server-side. Drive types raw formats inconsistently
+# (CR3 is an ISO-BMFF container), so only the common non-raw formats shot
+# alongside raws are excluded. Callers still check the extension.
+NON_RAW_MIME_TYPES = ("image/jpeg", "image/png", "image/heic", "image/heif")
+
+RAW_CANDIDATE_QUERY = " and ".join(
+    f"mimeType != '{mime_type}'" for mime_type in NON_RAW_MIME_TYPES
+)
+
+# Local state for incremental discovery through the Drive Changes API
+CHANGES_STATE_PATH = os.path.expanduser("~/UCAutomation/.drive_changes.json")
+
+# Force a full listing at least this often even when a page token is stored,
+# so files left in ingest after a failed run are picked up again
+FULL_SCAN_INTERVAL = 24 * 60 * 60
+
+# Drive accepts at most 100 calls per batch HTTP request
+BATCH_SIZE = 100
+
+# Upper bound on parent lookups when checking whether a changed file is inside
+# the ingest folder
+MAX_FOLDER_DEPTH = 20
+
+# Files at least this large are downloaded as concurrent byte ranges
+PARALLEL_DOWNLOAD_THRESHOLD = 32 * 1024 * 1024
+DOWNLOAD_PART_SIZE = 8 * 1024 * 1024
+DOWNLOAD_WORKERS = 4
+
+# Resumable upload chunk size, must be a multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_CHUNK_ALIGNMENT = 256 * 1024
+
+# Parsed Drive v3 discovery document, shared by every client in the process
+_discovery_document = None
+_discovery_lock = threading.Lock()
+
+
+def build_drive_client(credentials=None, http=None):
+    """Build a Drive v3 client from the discovery document bundled with googleapiclient.
+
+    The static document is read and parsed once per process instead of on
+    every build, so creating additional clients costs a fraction of a
+    millisecond and never touches the network.
+    """
+    global _discovery_document
+
+    with _discovery_lock:
+        if _discovery_document is None:
+            _discovery_document = json.loads(
+                discovery_cache.get_static_doc("drive", "v3")
+            )
+        # build_from_document fills in defaults on the shared document, so
+        # builds are serialized
+        return build_from_document(
+            _discovery_document, credentials=credentials, http=http
+        )
+
+
+class DownloadIntegrityError(Exception):
+    """Raised when downloaded data does not match Drive's size or md5Checksum.
+
+    Usually caused by a truncated or corrupted transfer, so it is safe to retry.
+    """
+
+    def __init__(self, file_id, field, expected, actual):
+        self.file_id = file_id
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+        super().__init__(
+            f"Integrity check failed for {file_id}: expected {field} {expected}, got {actual}"
+        )
+
+
+class _HashingWriter:
+    """File wrapper that updates a hash with every chunk written through it."""
+
+    def __init__(self, f, hash_obj):
+        self.f = f
+        self.hash_obj = hash_obj
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.hash_obj.update(data)
+        self.bytes_written += len(data)
+        return self.f.write(data)
+
+
+def upload_sidecar_path(file_path):
+    """Return the path of the sidecar that holds a file's resumable upload session."""
+    return f"{file_path}.upload.json"
+
+
+def has_pending_upload(file_path):
+    """Return True if an interrupted upload of file_path can be resumed."""
+    return os.path.exists(file_path) and os.path.exists(upload_sidecar_path(file_path))
+
+
+def build_list_query(parent_ids, raw_only=False, modified_after=None):
+    """Build a files.list query for the non-trashed children of one or more folders.
+
+    Args:
+        parent_ids: Folder IDs whose direct children should be listed
+        raw_only: If True, only return folders and raw file candidates
+        modified_after: Optional datetime or RFC 3339 string; files modified at
+            or before this time are excluded (folders are always returned so
+            the traversal can descend into them)
+
+    Returns:
+        str: Query for the files.list q parameter
+    """
+    parents = " or ".join(f"'{parent_id}' in parents" for parent_id in parent_ids)
+    clauses = [f"({parents})", "trashed = false"]
+
+    file_clauses = []
+    if raw_only:
+        file_clauses.append(f"({RAW_CANDIDATE_QUERY})")
+    if modified_after:
+        if isinstance(modified_after, datetime):
+            if modified_after.tzinfo is None:
+                modified_after = modified_after.replace(tzinfo=timezone.utc)
+            modified_after = modified_after.isoformat()
+        file_clauses.append(f"modifiedTime > '{modified_after}'")
+
+    if file_clauses:
+        clauses.append(
+            f"(mimeType = '{FOLDER_MIME_TYPE}' or ({' and '.join(file_clauses)}))"
+        )
+
+    return " and ".join(clauses)
+
 
 class GoogleDriveService:
     def __init__(
@@ -18,8 +187,12 @@ class GoogleDriveService:
         credentials_path=None,
         firebase_credentials_path=None,
         collection_name="processed_files",
+        pool_size=None,
     ):
-        load_dotenv()
+        start_time = time.perf_counter()
+
+        if not credentials_path:
+            load_dotenv()
         credentials_path = credentials_path or os.environ.get("GOOGLE_CREDENTIALS_PATH")
         if not credentials_path:
             raise ValueError("GOOGLE_CREDENTIALS_PATH environment variable not set.")
@@ -33,14 +206,71 @@ class GoogleDriveService:
         self.credentials = service_account.Credentials.from_service_account_file(
             credentials_path, scopes=["https://www.googleapis.com/auth/drive"]
         )
-        self.service = build("drive", "v3", credentials=self.credentials)
+        # Optional access-token cache shared with other runs, see token_cache
+        self.token_cache = get_token_cache()
+        # The Drive client is built on first use, see the service property
+        self._service = None
         self.folder_id = folder_id
+        # Folder listings of iter_files cut short by an error
+        self.listing_errors = 0
+        # Changes API state of the last discovery, saved by commit_changes_state
+        self.pending_changes_state = None
+
+        # googleapiclient/httplib2 objects are not thread-safe, so concurrent
+        # workers check out their own client from the pool
+        pool_size = pool_size or int(
+            os.environ.get("DRIVE_POOL_SIZE", DEFAULT_POOL_SIZE)
+        )
+        self.client_pool = DriveClientPool(self._build_client, size=pool_size)
 
-        # Initialize Firestore service for tracking processed files
-        self.firestore_service = FirestoreService(
+        # All Drive calls share the process-wide rate limit; throttling lowers
+        # the number of pooled clients in use and success raises it again
+        self.rate_limiter = get_rate_limiter()
+        self.concurrency = ConcurrencyController(
+            pool_size, on_change=self.client_pool.resize
+        )
+
+        # Status store for tracking processed files, Firestore unless
+        # STATUS_STORE selects another backend
+        self.firestore_service = create_status_store(
             collection_name=collection_name, credentials_path=firebase_credentials_path
         )
 
+        self.init_seconds = time.perf_counter() - start_time
+        logger.info(f"GoogleDriveService ready in {self.init_seconds * 1000:.1f} ms")
+
+    @property
+    def service(self):
+        """The Drive client for the calling (main) thread, built on first access."""
+        if self._service is None:
+            start_time = time.perf_counter()
+            self._ensure_token()
+            self._service = build_drive_client(credentials=self.credentials)
+            logger.info(
+                f"Built Drive client in {(time.perf_counter() - start_time) * 1000:.1f} ms"
+            )
+        return self._service
+
+    def _ensure_token(self):
+        """Load or refresh the access token through the token cache, if enabled."""
+        if self.token_cache:
+            self.token_cache.ensure_fresh(self.credentials)
+
+    def _execute(self, request, method, cost=None):
+        """Execute a Drive request under the shared rate limit with retries.
+
+        Args:
+            request: googleapiclient HttpRequest or BatchHttpRequest
+            method: Drive method name, e.g. "files.list", used for its cost
+            cost: Explicit cost overriding the method's cost
+
+        Returns:
+            The response of the request
+        """
+        return self.rate_limiter.execute(
+            request.execute, method, cost=cost, controller=self.concurrency
+        )
+
     def get_storage_quota(self):
         """Retrieves storage quota information for the service account.
 
@@ -56,7 +286,9 @@ class GoogleDriveService:
             None: If an error occurred
         """
         try:
-            about = self.service.about().get(fields="storageQuota").execute()
+            about = self._execute(
+                self.service.about().get(fields="storageQuota"), "about.get"
+            )
             storage_quota = about.get("storageQuota", {})
 
             # Extract quota information
@@ -99,113 +331,981 @@ class GoogleDriveService:
             logger.error(f"Error getting Drive storage quota: {str(e)}")
             return None
 
-    def list_files(self, folder_id=None, depth=0):
+    def iter_files(
+        self,
+        folder_id=None,
+        depth=0,
+        page_size=LIST_PAGE_SIZE,
+        raw_only=False,
+        modified_after=None,
+        cache=None,
+        modified_time=None,
+    ):
+        """Yield every file and folder under a folder, following all result pages.
+
+        Records are yielded as soon as each page arrives, so callers can start
+        working on the first files while later pages are still being fetched.
+        Subfolders are walked depth-first, with each folder yielded before its
+        contents.
+
+        Args:
+            folder_id: ID of the folder to walk (defaults to the service folder)
+            depth: Nesting level of folder_id, used to indent log output
+            page_size: Number of results requested per page (Drive caps it at 1000)
+            raw_only: If True, let Drive drop files that cannot be raw photos
+            modified_after: Optional cutoff; only files modified after it are returned
+            cache: Optional FolderListingCache; folders whose modifiedTime has not
+                moved since they were cached are not re-listed
+            modified_time: The folder's current modifiedTime, if already known
+
+        Yields:
+            dict: File records with the metadata listed in FILE_FIELDS
+        """
         if folder_id is None:
             folder_id = self.folder_id
 
+        query = build_list_query([folder_id], raw_only, modified_after)
+
+        children = None
+        subfolder_times = None
+        if cache is not None:
+            if modified_time is None:
+                modified_time = self._get_modified_time(folder_id)
+            children = cache.get(folder_id, modified_time, query)
+            if children is not None and any(
+                child["mimeType"] == FOLDER_MIME_TYPE for child in children
+            ):
+                # Cached records carry the subfolders' modifiedTime from when
+                # they were cached, which would always match their own entries
+                subfolder_times = self._get_subfolder_modified_times(
+                    folder_id, page_size
+                )
+
+        if children is None:
+            children = self._iter_folder_pages(
+                folder_id, query, page_size, cache, modified_time
+            )
+
         try:
-            results = (
-                self.service.files()
-                .list(
-                    q=f"'{folder_id}' in parents",
-                    fields="files(id, name, mimeType)",
-                    pageSize=100,
+            for file in children:
+                indent = "  " * depth
+                logger.info(f"{indent}- {file['name']} (ID: {file['id']})")
+
+                yield file
+
+                # Check if the file is a folder, then recurse
+                if file["mimeType"] == FOLDER_MIME_TYPE:
+                    if subfolder_times is None:
+                        subfolder_modified_time = file.get("modifiedTime")
+                    else:
+                        subfolder_modified_time = subfolder_times.get(file["id"])
+                    yield from self.iter_files(
+                        file["id"],
+                        depth + 1,
+                        page_size,
+                        raw_only,
+                        modified_after,
+                        cache,
+                        subfolder_modified_time,
+                    )
+        finally:
+            if cache is not None and depth == 0:
+                cache.save()
+                stats = cache.stats()
+                logger.info(
+                    f"Listing cache: {stats['hits']} hits, {stats['misses']} misses"
+                )
+
+    def _iter_folder_pages(
+        self, folder_id, query, page_size, cache=None, modified_time=None
+    ):
+        """Yield the direct children of a folder page by page.
+
+        When a cache is given, the listing is stored once every page has been
+        read successfully.
+        """
+        children = []
+        page_token = None
+        while True:
+            try:
+                results = self._execute(
+                    self.service.files().list(
+                        q=query,
+                        fields=f"nextPageToken, files({FILE_FIELDS})",
+                        pageSize=page_size,
+                        pageToken=page_token,
+                    ),
+                    "files.list",
+                )
+            except Exception as e:
+                logger.error(f"Error listing files in folder {folder_id}: {str(e)}")
+                self.listing_errors += 1
+                return
+
+            for file in results.get("files", []):
+                children.append(file)
+                yield file
+
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+
+        if cache is not None:
+            cache.put(folder_id, modified_time, query, children)
+
+    def _get_subfolder_modified_times(self, folder_id, page_size=LIST_PAGE_SIZE):
+        """Return the current modifiedTime of each direct subfolder of a folder.
+
+        Returns:
+            dict: Subfolder ID -> modifiedTime, or None if the listing failed
+        """
+        query = (
+            f"'{folder_id}' in parents and trashed = false"
+            f" and mimeType = '{FOLDER_MIME_TYPE}'"
+        )
+        modified_times = {}
+        page_token = None
+        while True:
+            try:
+                results = self._execute(
+                    self.service.files().list(
+                        q=query,
+                        fields="nextPageToken, files(id, modifiedTime)",
+                        pageSize=page_size,
+                        pageToken=page_token,
+                    ),
+                    "files.list",
+                )
+            except Exception as e:
+                logger.error(
+                    f"Error listing subfolders of folder {folder_id}: {str(e)}"
                 )
-                .execute()
+                return None
+
+            for folder in results.get("files", []):
+                modified_times[folder["id"]] = folder.get("modifiedTime")
+
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return modified_times
+
+    def _get_modified_time(self, folder_id):
+        """Return a folder's modifiedTime, or None if it cannot be fetched."""
+        try:
+            folder = self._execute(
+                self.service.files().get(fileId=folder_id, fields="modifiedTime"),
+                "files.get",
             )
+            return folder.get("modifiedTime")
         except Exception as e:
-            logger.error(f"Error listing files in folder {folder_id}: {str(e)}")
-            return []
+            logger.error(f"Error getting modifiedTime of folder {folder_id}: {str(e)}")
+            return None
 
-        files = results.get("files", [])
-        all_files = []
+    def iter_files_breadth_first(
+        self,
+        folder_id=None,
+        max_workers=4,
+        parents_per_query=PARENTS_PER_QUERY,
+        page_size=LIST_PAGE_SIZE,
+        raw_only=False,
+        modified_after=None,
+    ):
+        """Yield every file and folder under a folder using a concurrent breadth-first walk.
 
-        for file in files:
-            indent = "  " * depth
-            logger.info(f"{indent}- {file['name']} (ID: {file['id']})")
+        Folders waiting to be listed are kept on an explicit work queue rather
+        than the Python call stack, so arbitrarily deep trees are safe. Up to
+        parents_per_query folders are listed by a single files.list query and
+        up to max_workers queries run at once, each on a Drive client checked
+        out from client_pool.
 
-            all_files.append(file)
+        Args:
+            folder_id: ID of the folder to walk (defaults to the service folder)
+            max_workers: Maximum number of concurrent files.list queries
+            parents_per_query: Number of folder IDs combined into one query
+            page_size: Number of results requested per page
+            raw_only: If True, let Drive drop files that cannot be raw photos
+            modified_after: Optional cutoff; only files modified after it are returned
 
-            # Check if the file is a folder, then recurse
-            if file["mimeType"] == "application/vnd.google-apps.folder":
-                all_files.extend(self.list_files(file["id"], depth + 1))
+        Yields:
+            dict: File records with the metadata listed in FILE_FIELDS
+        """
+        if folder_id is None:
+            folder_id = self.folder_id
 
-        return all_files
+        depths = {folder_id: 0}
+        pending = deque([folder_id])
+        in_flight = set()
 
-    def download_file(self, file_id, destination):
-        try:
-            request = self.service.files().get_media(fileId=file_id)
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="drive-list"
+        ) as executor:
+            while pending or in_flight:
+                while pending and len(in_flight) < max_workers:
+                    batch = [
+                        pending.popleft()
+                        for _ in range(min(parents_per_query, len(pending)))
+                    ]
+                    in_flight.add(
+                        executor.submit(
+                            self._list_children,
+                            batch,
+                            page_size,
+                            raw_only,
+                            modified_after,
+                        )
+                    )
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for file in future.result():
+                        parent_depth = max(
+                            (
+                                depths.get(parent, 0)
+                                for parent in file.get("parents", [])
+                            ),
+                            default=0,
+                        )
+                        indent = "  " * parent_depth
+                        logger.info(f"{indent}- {file['name']} (ID: {file['id']})")
+
+                        yield file
+
+                        if (
+                            file["mimeType"] == FOLDER_MIME_TYPE
+                            and file["id"] not in depths
+                        ):
+                            depths[file["id"]] = parent_depth + 1
+                            pending.append(file["id"])
+
+    def _list_children(
+        self, parent_ids, page_size=LIST_PAGE_SIZE, raw_only=False, modified_after=None
+    ):
+        """List the direct children of several folders with one paginated query.
+
+        Runs on a worker thread, so it checks out a client from client_pool.
+        """
+        query = build_list_query(parent_ids, raw_only, modified_after)
+
+        children = []
+        page_token = None
+        while True:
+            try:
+                with self.client_pool.client() as service:
+                    results = self._execute(
+                        service.files().list(
+                            q=query,
+                            fields=f"nextPageToken, files({FILE_FIELDS})",
+                            pageSize=page_size,
+                            pageToken=page_token,
+                        ),
+                        "files.list",
+                    )
+            except Exception as e:
+                logger.error(
+                    f"Error listing files in folders {', '.join(parent_ids)}: {str(e)}"
+                )
+                return children
+
+            children.extend(results.get("files", []))
+
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return children
+
+    def _build_client(self):
+        """Build a Drive client with its own authorized keep-alive HTTP transport."""
+        self._ensure_token()
+        http = AuthorizedHttp(
+            self.credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT)
+        )
+        return build_drive_client(http=http)
 
-            # Create destination directory if it doesn't exist
-            os.makedirs(os.path.dirname(destination), exist_ok=True)
+    def list_files(self, folder_id=None, depth=0, raw_only=False, modified_after=None):
+        """Return every file and folder under a folder as a list.
 
-            with open(destination, "wb") as f:
-                downloader = MediaIoBaseDownload(f, request)
-                done = False
-                while not done:
-                    _, done = downloader.next_chunk()
+        Thin wrapper around iter_files for callers that need the whole tree.
+        """
+        return list(
+            self.iter_files(
+                folder_id, depth, raw_only=raw_only, modified_after=modified_after
+            )
+        )
+
+    def iter_changed_files(
+        self, state_path=CHANGES_STATE_PATH, full_scan_interval=FULL_SCAN_INTERVAL
+    ):
+        """Yield ingest files that changed since the previous run.
 
-            return os.path.exists(destination)
+        Uses the Drive Changes API with a page token persisted in state_path, so
+        discovery cost scales with new uploads rather than folder size. Only
+        changes to non-trashed descendants of the service folder are yielded.
+        Falls back to a full iter_files listing when no token is stored, the
+        token is rejected before any change was yielded, or the last full
+        listing is older than full_scan_interval seconds. The new token is
+        only saved by commit_changes_state, which callers invoke once every
+        yielded file was processed, so an interrupted run simply repeats its
+        discovery next time.
+
+        Args:
+            state_path: JSON file holding the page token and known ingest folders
+            full_scan_interval: Maximum age in seconds of the last full listing
+
+        Yields:
+            dict: File records with the metadata listed in FILE_FIELDS
+        """
+        self.pending_changes_state = None
+        state = self._load_changes_state(state_path)
+
+        last_full_scan = state.get("last_full_scan", 0)
+        if (
+            state.get("page_token")
+            and time.time() - last_full_scan < full_scan_interval
+        ):
+            yielded = 0
+            try:
+                for file in self._iter_changes(state, state_path):
+                    yielded += 1
+                    yield file
+                return
+            except HttpError as e:
+                # A full listing would yield those files a second time; the
+                # token is not saved, so the next run repeats this discovery
+                if yielded:
+                    logger.error(
+                        f"Drive changes listing failed after {yielded} files, "
+                        f"stopping discovery: {str(e)}"
+                    )
+                    return
+                logger.warning(
+                    f"Drive change token rejected, falling back to a full listing: {str(e)}"
+                )
+
+        # Take the token before listing so changes made during the listing are
+        # picked up by the next run
+        try:
+            page_token = self._execute(
+                self.service.changes().getStartPageToken(),
+                "changes.getStartPageToken",
+            ).get("startPageToken")
         except Exception as e:
-            logger.error(f"Error downloading file {file_id}: {str(e)}")
+            logger.error(f"Error getting Drive changes start page token: {str(e)}")
+            page_token = None
+
+        listing_errors = self.listing_errors
+        folder_ids = {self.folder_id}
+        for file in self.iter_files(raw_only=True):
+            if file["mimeType"] == FOLDER_MIME_TYPE:
+                folder_ids.add(file["id"])
+            yield file
+
+        # A partial listing must not count as a full scan
+        if self.listing_errors != listing_errors:
+            logger.warning("Full listing was incomplete, not storing a change token")
+        elif page_token:
+            self.pending_changes_state = (
+                state_path,
+                {
+                    "folder_id": self.folder_id,
+                    "page_token": page_token,
+                    "folder_ids": sorted(folder_ids),
+                    "last_full_scan": time.time(),
+                },
+            )
+
+    def commit_changes_state(self):
+        """Save the change token of the last iter_changed_files discovery.
+
+        Returns:
+            bool: True if a token was saved
+        """
+        if self.pending_changes_state is None:
             return False
 
-    def upload_file(self, file_path, folder_id=None):
-        """Uploads a file to Google Drive inside the specified folder."""
+        state_path, state = self.pending_changes_state
+        self.pending_changes_state = None
+        self._save_changes_state(state_path, state)
+        return True
+
+    def _iter_changes(self, state, state_path):
+        """Yield ingest files from the Changes API, starting at the stored token."""
+        folder_ids = set(state.get("folder_ids", [])) | {self.folder_id}
+        outside_ids = set()
+
+        page_token = state["page_token"]
+        while page_token:
+            response = self._execute(
+                self.service.changes().list(
+                    pageToken=page_token,
+                    spaces="drive",
+                    pageSize=LIST_PAGE_SIZE,
+                    fields=(
+                        "nextPageToken, newStartPageToken, "
+                        f"changes(fileId, removed, file({FILE_FIELDS}, trashed))"
+                    ),
+                ),
+                "changes.list",
+            )
+
+            for change in response.get("changes", []):
+                file = change.get("file")
+                if change.get("removed") or not file or file.get("trashed"):
+                    continue
+
+                if not self._is_ingest_descendant(file, folder_ids, outside_ids):
+                    continue
+
+                if file["mimeType"] == FOLDER_MIME_TYPE:
+                    folder_ids.add(file["id"])
+
+                logger.info(f"- {file['name']} (ID: {file['id']}) changed")
+                yield file
+
+            if response.get("newStartPageToken"):
+                state.update(
+                    {
+                        "page_token": response["newStartPageToken"],
+                        "folder_ids": sorted(folder_ids),
+                    }
+                )
+                self.pending_changes_state = (state_path, state)
+                return
+
+            page_token = response.get("nextPageToken")
+
+    def _is_ingest_descendant(self, file, folder_ids, outside_ids):
+        """Check whether a file sits somewhere below the service folder.
+
+        Walks up the parent chain with files().get until it reaches a known
+        ingest folder. Results are memoised in folder_ids and outside_ids.
+        """
+        parents = list(file.get("parents", []))
+        visited = []
+
+        for _ in range(MAX_FOLDER_DEPTH):
+            if any(parent in folder_ids for parent in parents):
+                folder_ids.update(visited)
+                return True
+
+            parents = [
+                parent
+                for parent in parents
+                if parent not in outside_ids and parent not in visited
+            ]
+            if not parents:
+                break
+
+            next_parents = []
+            for parent in parents:
+                visited.append(parent)
+                try:
+                    folder = self._execute(
+                        self.service.files().get(fileId=parent, fields="id, parents"),
+                        "files.get",
+                    )
+                except Exception as e:
+                    logger.error(f"Error getting parents of folder {parent}: {str(e)}")
+                    continue
+                next_parents.extend(folder.get("parents", []))
+            parents = next_parents
+
+        outside_ids.update(visited)
+        return False
+
+    def _load_changes_state(self, state_path):
+        """Load the persisted Changes API state for this service folder."""
+        try:
+            with open(state_path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if state.get("folder_id") != self.folder_id:
+            return {}
+        return state
+
+    def _save_changes_state(self, state_path, state):
+        """Atomically persist the Changes API state."""
+        try:
+            os.makedirs(os.path.dirname(state_path), exist_ok=True)
+            temp_path = f"{state_path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(temp_path, state_path)
+        except OSError as e:
+            logger.error(f"Error saving Drive changes state to {state_path}: {str(e)}")
+
+    def download_file(
+        self,
+        file_id,
+        destination,
+        size=None,
+        md5_checksum=None,
+        part_size=DOWNLOAD_PART_SIZE,
+        max_workers=DOWNLOAD_WORKERS,
+        parallel_threshold=PARALLEL_DOWNLOAD_THRESHOLD,
+        integrity_retries=1,
+    ):
+        """Download a Drive file to a local path, resuming an earlier partial download.
+
+        Data is written to <destination>.part, with a <destination>.part.json
+        sidecar recording the expected size and md5Checksum and which byte
+        ranges are complete. If a previous attempt for the same file revision
+        left a partial download behind, only the missing bytes are requested.
+        The .part file is atomically renamed into place once it is complete.
+
+        Files of at least parallel_threshold bytes are split into part_size
+        byte ranges fetched concurrently with HTTP Range requests and written
+        into the preallocated .part file at their offsets. Smaller files, or
+        files whose size is unknown, are streamed sequentially.
+
+        The MD5 of the data is computed while it is written and compared with
+        the Drive-reported md5Checksum and size before the file is moved into
+        place. A mismatch is treated as transient: the partial download is
+        discarded and the file is fetched again up to integrity_retries times.
+
+        Args:
+            file_id: Google Drive file ID
+            destination: Local path to write the file to
+            size: File size in bytes from the listing metadata, if known
+            md5_checksum: Drive md5Checksum from the listing metadata, if known
+            part_size: Size in bytes of each concurrently fetched range
+            max_workers: Maximum number of ranges fetched at once
+            parallel_threshold: Minimum size in bytes for a ranged download
+            integrity_retries: Number of fresh attempts after a failed integrity check
+
+        Returns:
+            bool: True if the file was downloaded successfully
+
+        Raises:
+            DownloadIntegrityError: If the data still did not match after the
+                last retry
+        """
+        part_path = f"{destination}.part"
+        sidecar_path = f"{part_path}.json"
+
+        size = int(size) if size is not None else None
+
+        for attempt in range(integrity_retries + 1):
+            try:
+                # Create destination directory if it doesn't exist
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+                sidecar = self._load_download_sidecar(
+                    sidecar_path, file_id, size, md5_checksum
+                )
+                if sidecar is None:
+                    # Nothing resumable: start over with a fresh sidecar
+                    self._discard_partial_download(part_path, sidecar_path)
+                    sidecar = {
+                        "file_id": file_id,
+                        "size": size,
+                        "md5Checksum": md5_checksum,
+                        "completed_ranges": [],
+                    }
+                    self._save_sidecar(sidecar_path, sidecar)
+
+                if size is not None and size >= parallel_threshold and max_workers > 1:
+                    md5, written = self._download_ranges(
+                        file_id,
+                        part_path,
+                        sidecar_path,
+                        sidecar,
+                        part_size,
+                        max_workers,
+                    )
+                else:
+                    md5, written = self._download_sequential(
+                        file_id, part_path, size, sidecar
+                    )
+
+                self._verify_download(file_id, md5, written, size, md5_checksum)
+
+                os.replace(part_path, destination)
+                os.remove(sidecar_path)
+
+                return os.path.exists(destination)
+            except DownloadIntegrityError as e:
+                logger.error(str(e))
+                # Corrupt data cannot be resumed, so the next attempt starts over
+                self._discard_partial_download(part_path, sidecar_path)
+                if attempt == integrity_retries:
+                    raise
+                logger.info(f"Retrying download of {file_id}")
+            except Exception as e:
+                logger.error(f"Error downloading file {file_id}: {str(e)}")
+                return False
+
+    def _verify_download(self, file_id, md5, written, size, md5_checksum):
+        """Compare a finished download with the size and md5Checksum Drive reported.
+
+        Raises:
+            DownloadIntegrityError: If either does not match
+        """
+        if size is not None and written != size:
+            raise DownloadIntegrityError(file_id, "size", size, written)
+
+        if md5_checksum and md5.hexdigest() != md5_checksum:
+            raise DownloadIntegrityError(
+                file_id, "md5Checksum", md5_checksum, md5.hexdigest()
+            )
+
+    def _discard_partial_download(self, part_path, sidecar_path):
+        """Remove a .part file and its sidecar if they exist."""
+        for path in (part_path, sidecar_path):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _download_sequential(self, file_id, part_path, size, sidecar):
+        """Stream a file into part_path, continuing from the bytes already there.
+
+        Returns:
+            tuple: (md5 hash object, number of bytes in the file)
+        """
+        md5 = hashlib.md5()
+        offset = 0
+        # A .part left by a ranged download is preallocated, so its length
+        # says nothing about how much of it has been written
+        if os.path.isfile(part_path) and not sidecar.get("part_size"):
+            offset = os.path.getsize(part_path)
+
+        if offset and size is not None:
+            logger.info(f"Resuming download of {file_id} at byte {offset} of {size}")
+            with open(part_path, "rb") as f:
+                # Bytes from the earlier attempt have to be hashed once
+                for block in iter(lambda: f.read(DOWNLOAD_PART_SIZE), b""):
+                    md5.update(block)
+
+            with open(part_path, "ab") as f:
+                while offset < size:
+                    end = min(offset + DOWNLOAD_PART_SIZE, size) - 1
+                    data = self._fetch_range(file_id, offset, end)
+                    if not data:
+                        raise IOError(f"Empty response for range {offset}-{end}")
+                    f.write(data)
+                    md5.update(data)
+                    offset += len(data)
+            return md5, offset
+
+        request = self.service.files().get_media(fileId=file_id)
+        with open(part_path, "wb") as f:
+            writer = _HashingWriter(f, md5)
+            downloader = MediaIoBaseDownload(writer, request)
+            done = False
+            while not done:
+                _, done = self.rate_limiter.execute(
+                    downloader.next_chunk,
+                    "files.get_media",
+                    controller=self.concurrency,
+                )
+        return md5, writer.bytes_written
+
+    def _download_ranges(
+        self, file_id, part_path, sidecar_path, sidecar, part_size, max_workers
+    ):
+        """Fetch the missing byte ranges of a file concurrently into part_path.
+
+        Ranges are hashed in offset order as their results are collected, so at
+        most two ranges per worker are held in memory.
+
+        Returns:
+            tuple: (md5 hash object, number of bytes in the file)
+        """
+        size = sidecar["size"]
+        completed = set(sidecar["completed_ranges"])
+        if sidecar.get("part_size") != part_size:
+            # Completed ranges are only meaningful for the same split
+            completed = set()
+            sidecar["part_size"] = part_size
+
+        ranges = [
+            (start, min(start + part_size, size) - 1)
+            for start in range(0, size, part_size)
+        ]
+        if completed:
+            logger.info(
+                f"Resuming download of {file_id}: "
+                f"{len(ranges) - len(completed)} ranges remaining"
+            )
+
+        md5 = hashlib.md5()
+        written = 0
+        sidecar_lock = threading.Lock()
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+
+            def fetch(byte_range):
+                start, end = byte_range
+                if start in completed:
+                    # Written by an earlier attempt; read it back for the hash
+                    return os.pread(fd, end - start + 1, start)
+
+                data = self._fetch_range(file_id, start, end)
+                if len(data) != end - start + 1:
+                    raise IOError(
+                        f"Expected {end - start + 1} bytes for range {start}-{end}, "
+                        f"got {len(data)}"
+                    )
+                os.pwrite(fd, data, start)
+
+                with sidecar_lock:
+                    completed.add(start)
+                    sidecar["completed_ranges"] = sorted(completed)
+                    self._save_sidecar(sidecar_path, sidecar)
+                return data
+
+            with ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="drive-download"
+            ) as executor:
+                in_flight = deque()
+                for byte_range in ranges:
+                    in_flight.append(executor.submit(fetch, byte_range))
+                    if len(in_flight) >= max_workers * 2:
+                        data = in_flight.popleft().result()
+                        md5.update(data)
+                        written += len(data)
+
+                while in_flight:
+                    data = in_flight.popleft().result()
+                    md5.update(data)
+                    written += len(data)
+        finally:
+            os.close(fd)
+
+        logger.info(
+            f"Downloaded {file_id} as {len(ranges)} ranges with {max_workers} workers"
+        )
+        return md5, written
+
+    def _load_download_sidecar(self, sidecar_path, file_id, size, md5_checksum):
+        """Return the sidecar of a resumable partial download, or None."""
+        try:
+            with open(sidecar_path, "r") as f:
+                sidecar = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Only resume a partial download of the same file revision
+        if (
+            sidecar.get("file_id") != file_id
+            or size is None
+            or sidecar.get("size") != size
+            or sidecar.get("md5Checksum") != md5_checksum
+        ):
+            return None
+        return sidecar
+
+    def _save_sidecar(self, sidecar_path, sidecar):
+        """Atomically write a download or upload sidecar."""
+        temp_path = f"{sidecar_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(sidecar, f)
+        os.replace(temp_path, sidecar_path)
+
+    def _fetch_range(self, file_id, start, end):
+        """Fetch bytes start..end (inclusive) of a file on a pooled Drive client."""
+        with self.client_pool.client() as service:
+            request = service.files().get_media(fileId=file_id)
+            request.headers["Range"] = f"bytes={start}-{end}"
+            return self._execute(request, "files.get_media")
+
+    def upload_file(self, file_path, folder_id=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        """Uploads a file to Google Drive inside the specified folder.
+
+        The file is sent in chunks over a resumable upload session. The session
+        URI is kept in a "<file_path>.upload.json" sidecar, so an upload that
+        fails part way is resumed by the next call for the same file and folder.
+
+        Args:
+            file_path: Local path of the file to upload
+            folder_id: Destination folder ID, defaults to the service's folder
+            chunk_size: Bytes sent per request, a multiple of 256 KiB
+
+        Returns:
+            str: The uploaded file ID, or None on failure
+        """
         if folder_id is None:
             folder_id = self.folder_id
 
+        if chunk_size <= 0 or chunk_size % UPLOAD_CHUNK_ALIGNMENT:
+            raise ValueError("Upload chunk size must be a multiple of 256 KiB.")
+
         if not os.path.exists(file_path):
             logger.error(f"File not found: {file_path}")
             return None
 
+        sidecar_path = upload_sidecar_path(file_path)
+
         try:
+            file_stat = os.stat(file_path)
             file_metadata = {
                 "name": os.path.basename(file_path),
                 "parents": [folder_id],
             }
 
-            media = MediaFileUpload(file_path, resumable=True)
-
-            file = (
-                self.service.files()
-                .create(body=file_metadata, media_body=media, fields="id")
-                .execute()
+            media = MediaFileUpload(file_path, chunksize=chunk_size, resumable=True)
+            request = self.service.files().create(
+                body=file_metadata, media_body=media, fields="id"
             )
 
+            sidecar = self._load_upload_sidecar(sidecar_path, folder_id, file_stat)
+            if sidecar:
+                # Ask the server how much it already has before sending more
+                try:
+                    progress, file = self._query_upload_status(
+                        request, sidecar["resumable_uri"], file_stat.st_size
+                    )
+                except HttpError as e:
+                    if e.resp.status not in (404, 410):
+                        raise
+                    logger.info(f"Upload session of {file_path} expired, restarting")
+                    self._discard_upload_sidecar(sidecar_path)
+                    sidecar = None
+                else:
+                    if file is not None:
+                        # The last chunk arrived before the previous attempt failed
+                        self._discard_upload_sidecar(sidecar_path)
+                        logger.info(
+                            f"Uploaded {file_path} to Google Drive with ID: {file.get('id')}"
+                        )
+                        return file.get("id")
+
+                    request.resumable_uri = sidecar["resumable_uri"]
+                    request.resumable_progress = progress
+                    logger.info(f"Resuming upload of {file_path} from byte {progress}")
+
+            if not sidecar:
+                sidecar = {
+                    "folder_id": folder_id,
+                    "size": file_stat.st_size,
+                    "mtime": file_stat.st_mtime,
+                }
+
+            start_progress = request.resumable_progress or 0
+            start_time = time.perf_counter()
+
+            file = None
+            while file is None:
+                try:
+                    status, file = self.rate_limiter.execute(
+                        request.next_chunk, "files.create", controller=self.concurrency
+                    )
+                except HttpError as e:
+                    if sidecar.get("resumable_uri") and e.resp.status in (404, 410):
+                        # The upload session expired, start a new one next time
+                        self._discard_upload_sidecar(sidecar_path)
+                    raise
+
+                if request.resumable_uri and (
+                    request.resumable_uri != sidecar.get("resumable_uri")
+                    or request.resumable_progress != sidecar.get("resumable_progress")
+                ):
+                    sidecar["resumable_uri"] = request.resumable_uri
+                    sidecar["resumable_progress"] = request.resumable_progress
+                    self._save_sidecar(sidecar_path, sidecar)
+
+            self._discard_upload_sidecar(sidecar_path)
+
+            elapsed = time.perf_counter() - start_time
+            sent = file_stat.st_size - start_progress
+            throughput = sent / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
             logger.info(
-                f"Uploaded {file_path} to Google Drive with ID: {file.get('id')}"
+                f"Uploaded {file_path} to Google Drive with ID: {file.get('id')} "
+                f"({sent} bytes in {elapsed:.1f}s, {throughput:.2f} MB/s)"
             )
             return file.get("id")
         except Exception as e:
             logger.error(f"Error uploading file {file_path}: {str(e)}")
             return None
 
-    def move_file(self, file_id, folder_id):
+    def _query_upload_status(self, request, resumable_uri, size):
+        """Ask Drive how much of a resumable upload session it has received.
+
+        Sends the empty "Content-Range: bytes */<size>" request of the
+        resumable upload protocol on the request's authorized http.
+
+        Returns:
+            tuple: (bytes received, None) for an open session, or
+                (size, file resource) if the upload already completed
+
+        Raises:
+            HttpError: If the session is gone (404/410) or the query failed
+        """
+
+        def query():
+            resp, content = request.http.request(
+                resumable_uri,
+                method="PUT",
+                headers={"Content-Length": "0", "Content-Range": f"bytes */{size}"},
+            )
+            if resp.status in (200, 201):
+                return size, json.loads(content)
+            if resp.status == 308:
+                # Range is "bytes=0-<last byte received>", absent if none arrived
+                received = resp.get("range")
+                return (int(received.rsplit("-", 1)[1]) + 1 if received else 0), None
+            raise HttpError(resp, content, uri=resumable_uri)
+
+        return self.rate_limiter.execute(
+            query, "files.create", controller=self.concurrency
+        )
+
+    def _load_upload_sidecar(self, sidecar_path, folder_id, file_stat):
+        """Return the sidecar of an interrupted upload session, or None."""
+        try:
+            with open(sidecar_path, "r") as f:
+                sidecar = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Only resume a session for the same destination and file contents
+        if (
+            not sidecar.get("resumable_uri")
+            or sidecar.get("folder_id") != folder_id
+            or sidecar.get("size") != file_stat.st_size
+            or sidecar.get("mtime") != file_stat.st_mtime
+        ):
+            self._discard_upload_sidecar(sidecar_path)
+            return None
+        return sidecar
+
+    def _discard_upload_sidecar(self, sidecar_path):
+        try:
+            os.remove(sidecar_path)
+        except FileNotFoundError:
+            pass
+
+    def move_file(self, file_id, folder_id, previous_parents=None):
         """
         Move the specified file to the specified folder in Google Drive.
 
         Args:
             file_id (str): The ID of the file to move.
             folder_id (str): The ID of the destination folder.
+            previous_parents (list, optional): The file's current parent IDs, e.g.
+                from the listing metadata. Fetched from Drive when not given.
 
         Returns:
             list: The new parent folder IDs if successful, None otherwise.
         """
 
         try:
-            file = self.service.files().get(fileId=file_id, fields="parents").execute()
-            previous_parents = ",".join(file.get("parents"))
+            if not previous_parents:
+                file = self._execute(
+                    self.service.files().get(fileId=file_id, fields="parents"),
+                    "files.get",
+                )
+                previous_parents = file.get("parents")
+            previous_parents = ",".join(previous_parents)
 
-            file = (
-                self.service.files()
-                .update(
+            file = self._execute(
+                self.service.files().update(
                     fileId=file_id,
                     addParents=folder_id,
                     removeParents=previous_parents,
                     fields="id, parents",
-                )
-                .execute()
+                ),
+                "files.update",
             )
             logger.info(f"File {file_id} moved to {file.get("parents")}.")
             return file.get("parents")
@@ -213,6 +1313,105 @@ class GoogleDriveService:
             logger.error(f"Error moving file {file_id}: {str(e)}")
             return None
 
+    def move_files_batch(self, files, folder_id, batch_size=BATCH_SIZE):
+        """
+        Move several files to a folder using Drive batch HTTP requests.
+
+        Up to batch_size files.update calls are sent per HTTP round-trip. The
+        current parents are taken from each file's listing metadata; files
+        without a parents entry are moved individually with move_file.
+
+        Args:
+            files (list): File records from the Drive listing.
+            folder_id (str): The ID of the destination folder.
+            batch_size (int): Maximum number of calls per batch request.
+
+        Returns:
+            dict: Maps each file ID to True if it was moved, False otherwise.
+        """
+        results = {}
+
+        batchable = []
+        for file in files:
+            if file.get("parents"):
+                batchable.append(file)
+            else:
+                results[file["id"]] = self.move_file(file["id"], folder_id) is not None
+
+        retry_ids = set()
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                results[request_id] = False
+                if is_retryable(exception):
+                    if is_throttled(exception):
+                        self.concurrency.on_throttle()
+                    retry_ids.add(request_id)
+                else:
+                    logger.error(f"Error moving file {request_id}: {str(exception)}")
+            else:
+                logger.info(f"File {request_id} moved to {response.get('parents')}.")
+                results[request_id] = True
+
+        for start in range(0, len(batchable), batch_size):
+            pending = batchable[start : start + batch_size]
+
+            # Calls that were throttled inside the batch are re-sent in a
+            # smaller batch after a backoff
+            for attempt in range(self.rate_limiter.max_retries + 1):
+                batch = self.service.new_batch_http_request(callback=callback)
+                for file in pending:
+                    batch.add(
+                        self.service.files().update(
+                            fileId=file["id"],
+                            addParents=folder_id,
+                            removeParents=",".join(file["parents"]),
+                            fields="id, parents",
+                        ),
+                        request_id=file["id"],
+                    )
+
+                try:
+                    self._execute(
+                        batch,
+                        "batch",
+                        cost=len(pending) * self.rate_limiter.cost("files.update"),
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"Error executing batch move of {len(pending)} files: {str(e)}"
+                    )
+                    for file in pending:
+                        results.setdefault(file["id"], False)
+                    break
+
+                pending = [file for file in pending if file["id"] in retry_ids]
+                retry_ids.clear()
+                if not pending:
+                    break
+                if attempt == self.rate_limiter.max_retries:
+                    for file in pending:
+                        logger.error(f"Error moving file {file['id']}: rate limited")
+                    break
+
+                delay = self.rate_limiter.backoff(attempt)
+                logger.warning(
+                    f"Retrying {len(pending)} throttled moves in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+        return results
+
+    def enable_status_cache(self):
+        """Answer status checks of this run from a shared write-through cache.
+
+        Returns:
+            RunStatusCache: The cache, to be shared with e.g. RawFileConverter
+        """
+        if not isinstance(self.firestore_service, RunStatusCache):
+            self.firestore_service = RunStatusCache(self.firestore_service)
+        return self.firestore_service
+
     def is_file_processed(self, file_id):
         """Check if a file has already been processed using Firestore."""
         return self.firestore_service.is_processed(file_id)
@@ -225,22 +1424,38 @@ class GoogleDriveService:
         """Mark a file as currently being processed in Firestore."""
         return self.firestore_service.mark_as_processing(file_id, machine_id)
 
-    def mark_file_as_processed(self, file_id, machine_id=None, additional_data=None):
+    def mark_file_as_processed(
+        self, file_id, machine_id=None, additional_data=None, defer=False
+    ):
         """Mark a file as successfully processed in Firestore."""
         return self.firestore_service.mark_as_processed(
-            file_id, machine_id, additional_data
+            file_id, machine_id, additional_data, defer=defer
         )
 
-    def mark_file_as_uploaded(self, file_id, machine_id=None, additional_data=None):
+    def mark_file_as_uploaded(
+        self, file_id, machine_id=None, additional_data=None, defer=False
+    ):
         """Mark a file as successfully uploaded in Firestore."""
         return self.firestore_service.mark_as_uploaded(
-            file_id, machine_id, additional_data
+            file_id, machine_id, additional_data, defer=defer
         )
 
-    def mark_file_as_failed(self, file_id, machine_id=None, error_message=None):
+    def mark_file_as_failed(
+        self, file_id, machine_id=None, error_message=None, defer=False
+    ):
         """Mark a file as failed processing in Firestore."""
-        return self.firestore_service.mark_as_failed(file_id, machine_id, error_message)
+        return self.firestore_service.mark_as_failed(
+            file_id, machine_id, error_message, defer=defer
+        )
+
+    def flush_status_writes(self):
+        """Commit Firestore status writes that were deferred."""
+        return self.firestore_service.flush()
 
     def get_file_status(self, file_id):
         """Get the processing status of a file from Firestore."""
         return self.firestore_service.get_file_status(file_id)
+
+    def get_file_statuses(self, file_ids):
+        """Get the processing status of several files from Firestore in bulk."""
+        return self.firestore_service.get_file_statuses(file_ids)
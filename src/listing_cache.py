@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+
+from log_config import get_logger
+
+logger = get_logger()
+
+LISTING_CACHE_PATH = os.path.expanduser("~/UCAutomation/.cache/drive_listing.json")
+
+# Entries older than this are re-listed even if the folder's modifiedTime has
+# not moved, which bounds how long a missed change can stay hidden
+DEFAULT_MAX_AGE = 6 * 60 * 60
+
+
+class FolderListingCache:
+    """On-disk cache of Drive folder listings keyed by each folder's modifiedTime."""
+
+    def __init__(self, path=LISTING_CACHE_PATH, max_age=DEFAULT_MAX_AGE):
+        """Initialize the listing cache.
+
+        Args:
+            path: JSON file the cache is persisted to
+            max_age: Maximum age in seconds of a cached listing
+        """
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable listing cache {self.path}: {str(e)}")
+            return {}
+
+        return entries if isinstance(entries, dict) else {}
+
+    def get(self, folder_id, modified_time, query):
+        """Return the cached children of a folder, or None if they must be re-listed.
+
+        Args:
+            folder_id: Drive folder ID
+            modified_time: The folder's current modifiedTime
+            query: The files.list query the listing was made with
+
+        Returns:
+            list: Cached child records, or None on a miss
+        """
+        with self.lock:
+            entry = self.entries.get(folder_id)
+            if (
+                modified_time
+                and entry
+                and entry.get("modified_time") == modified_time
+                and entry.get("query") == query
+                and time.time() - entry.get("cached_at", 0) < self.max_age
+            ):
+                self.hits += 1
+                return entry["children"]
+
+            self.misses += 1
+            return None
+
+    def put(self, folder_id, modified_time, query, children):
+        """Store the complete child listing of a folder."""
+        if not modified_time:
+            return
+
+        with self.lock:
+            self.entries[folder_id] = {
+                "modified_time": modified_time,
+                "query": query,
+                "cached_at": time.time(),
+                "children": children,
+            }
+
+    def remove_files(self, folder_id, file_ids):
+        """Drop files that were moved out of a folder from its cached listing.
+
+        Returns:
+            int: Number of records removed
+        """
+        file_ids = set(file_ids)
+        with self.lock:
+            entry = self.entries.get(folder_id)
+            if not entry:
+                return 0
+
+            children = [
+                child for child in entry["children"] if child["id"] not in file_ids
+            ]
+            removed = len(entry["children"]) - len(children)
+            entry["children"] = children
+            return removed
+
+    def invalidate(self, folder_id=None):
+        """Drop one folder's listing, or the whole cache if folder_id is None.
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self.lock:
+            if folder_id is None:
+                removed = len(self.entries)
+                self.entries = {}
+            else:
+                removed = 1 if self.entries.pop(folder_id, None) else 0
+
+        self.save()
+        return removed
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached folders."""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+            }
+
+    def save(self):
+        """Atomically write the cache to disk."""
+        with self.lock:
+            entries = dict(self.entries)
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(entries, f, separators=(",", ":"))
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Error saving listing cache to {self.path}: {str(e)}")
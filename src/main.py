@@ -2,14 +2,137 @@ import os
 
 from dotenv import load_dotenv
 
-from google_drive_service import GoogleDriveService
+from firestore_service import (
+    DONE_STATUSES,
+    UPLOADED_STATUSES,
+    get_firestore_collection,
+    lease_active,
+)
+from google_drive_service import DownloadIntegrityError, GoogleDriveService
+from listing_cache import FolderListingCache
 from log_config import get_logger
 from raw_converter import RawFileConverter
 from synology_service import SynologyService
-from utils import clean_download_directories, move_to_archive
+from utils import clean_download_directories, move_files_to_archive
+from work_partitioner import WORKERS_COLLECTION, WorkPartitioner
 
 logger = get_logger()
 
+# Number of uploaded files collected before they are moved to archive together
+ARCHIVE_BATCH_SIZE = 100
+
+# Number of listed files whose statuses are looked up in one bulk request
+STATUS_LOOKUP_SIZE = 100
+
+
+def archive_files(drive_service, files, archive_folder_id, listing_cache=None):
+    """Move uploaded files to the archive folder and log any that failed.
+
+    Moved files are dropped from the cached listings of their ingest folders,
+    so a later run served from listing_cache does not try to move them again.
+    """
+    results = move_files_to_archive(drive_service, files, archive_folder_id)
+
+    moved = {}
+    for file in files:
+        if not results.get(file["id"]):
+            logger.warning(
+                f"{file['name']}(ID: {file['id']}) was not successfully moved to archive."
+            )
+            continue
+        for parent_id in file.get("parents", []):
+            moved.setdefault(parent_id, []).append(file["id"])
+
+    if listing_cache is not None and moved:
+        for parent_id, file_ids in moved.items():
+            listing_cache.remove_files(parent_id, file_ids)
+        listing_cache.save()
+
+
+def partition_by_status(drive_service, files):
+    """Split files into those that need processing and those already handled.
+
+    Statuses are looked up with one bulk Firestore request.
+
+    Returns:
+        tuple: (pending, skipped, unarchived) lists of file records, where
+            unarchived are the skipped files that were uploaded but are still
+            in the ingest folder
+    """
+    statuses = drive_service.get_file_statuses([file["id"] for file in files])
+
+    pending = []
+    skipped = []
+    unarchived = []
+    for file in files:
+        status_info = statuses.get(file["id"])
+        status = status_info["status"] if status_info else None
+
+        # Files in processing are skipped only while their claim's lease holds
+        if status in DONE_STATUSES or lease_active(status_info):
+            logger.info(
+                f"Skipping {file['name']} (ID: {file['id']}). Status is {status}"
+            )
+            skipped.append(file)
+            if status in UPLOADED_STATUSES:
+                unarchived.append(file)
+        else:
+            pending.append(file)
+
+    return pending, skipped, unarchived
+
+
+def iter_pending_files(
+    drive_service,
+    files,
+    chunk_size=STATUS_LOOKUP_SIZE,
+    archive_queue=None,
+    on_skipped=None,
+):
+    """Yield the listed files that still need processing.
+
+    The listing is partitioned in chunks of chunk_size files, so processing
+    starts before the listing finishes and handled files cost no per-file read.
+    Uploaded files that a stopped run never moved out of the ingest folder are
+    appended to archive_queue, if given, and on_skipped is called with each
+    file that needs no processing.
+    """
+    listed_count = 0
+    pending_count = 0
+
+    chunk = []
+    for file in files:
+        chunk.append(file)
+        if len(chunk) < chunk_size:
+            continue
+
+        pending, skipped, unarchived = partition_by_status(drive_service, chunk)
+        listed_count += len(chunk)
+        pending_count += len(pending)
+        chunk = []
+        if archive_queue is not None:
+            archive_queue.extend(unarchived)
+        if on_skipped is not None:
+            for file in skipped:
+                on_skipped(file)
+        yield from pending
+
+    if chunk:
+        pending, skipped, unarchived = partition_by_status(drive_service, chunk)
+        listed_count += len(chunk)
+        pending_count += len(pending)
+        if archive_queue is not None:
+            archive_queue.extend(unarchived)
+        if on_skipped is not None:
+            for file in skipped:
+                on_skipped(file)
+        yield from pending
+
+    logger.info(
+        f"Checked {listed_count} raw files from the ingest listing, "
+        f"{pending_count} needed processing"
+    )
+
 
 def main():
     load_dotenv()
@@ -71,6 +194,15 @@ def main():
     if raw_cleaned > 0 or dng_cleaned > 0:
         logger.info(f"Cleaned up {raw_cleaned} raw files and {dng_cleaned} DNG files")
 
+    # Uploaded files waiting to be moved to the archive folder
+    archive_queue = []
+    # Jobs handed to the converter that have not been uploaded or failed yet
+    unsettled_jobs = {}
+    drive_service = None
+    converter = None
+    partitioner = None
+    listing_cache = None
+
     try:
         # Initialize Google Drive service with Firestore integration
         drive_service = GoogleDriveService(
@@ -79,78 +211,137 @@ def main():
             firebase_credentials_path=firebase_creds_path,
         )
 
-        converter = RawFileConverter(firestore_service=drive_service.firestore_service)
+        # Listing, conversion and archiving share one status cache per run
+        status_cache = drive_service.enable_status_cache()
+        converter = RawFileConverter(firestore_service=status_cache)
+        synology_service = SynologyService(firebase_creds_path)
 
         machine_id = os.uname().nodename
         logger.info(f"Running on machine: {machine_id}")
 
         # Fetch files from Google Drive
-        logger.info("Fetching file list from Google Drive")
-        files = drive_service.list_files()
+        discovery = os.environ.get("DRIVE_DISCOVERY")
+        if discovery == "changes":
+            logger.info("Fetching changed files from Google Drive")
+            files = drive_service.iter_changed_files()
+        elif discovery == "breadth_first":
+            logger.info("Fetching file list from Google Drive, folders concurrently")
+            files = drive_service.iter_files_breadth_first(raw_only=True)
+        else:
+            logger.info("Fetching file list from Google Drive")
+            listing_cache = (
+                FolderListingCache()
+                if os.environ.get("DRIVE_LISTING_CACHE") == "1"
+                else None
+            )
+            files = drive_service.iter_files(raw_only=True, cache=listing_cache)
 
-        raw_files = [
+        raw_files = (
             file
             for file in files
             if file["name"].lower().endswith((".cr3", ".arw", ".nef"))
-        ]
-        logger.info(f"Found {len(raw_files)} raw files to process")
+        )
 
-        # Process each file
-        for file in raw_files:
-            file_id = file["id"]
-            file_name = file["name"]
+        # Split the listing with the other machines instead of racing for it,
+        # before statuses are looked up so each machine only reads its share
+        if os.environ.get("WORK_PARTITIONING") == "1":
+            _, workers = get_firestore_collection(
+                firebase_creds_path, WORKERS_COLLECTION
+            )
+            partitioner = WorkPartitioner(workers, machine_id)
+            partitioner.start()
+            raw_files = partitioner.assign(raw_files)
 
-            status_info = drive_service.get_file_status(file_id)
-            status = status_info["status"] if status_info else None
+        def settle(file):
+            """Report a file as done to the partitioner, whatever the outcome."""
+            if partitioner is not None:
+                partitioner.complete(file["id"])
 
-            if status in ("uploaded", "processed", "processing"):
-                logger.info(f"Skipping {file_name} (ID: {file_id}). Status is {status}")
-                continue
+        pending_files = iter_pending_files(
+            drive_service, raw_files, archive_queue=archive_queue, on_skipped=settle
+        )
 
-            # TODO Implement retry logic
+        def mark_failed(file_id, error_msg):
+            logger.error(error_msg)
+            drive_service.mark_file_as_failed(
+                file_id=file_id,
+                machine_id=machine_id,
+                error_message=error_msg,
+                defer=True,
+            )
 
-            # Download raw file
-            drive_service.mark_file_as_processing(file_id, machine_id)
+        def conversion_jobs():
+            """Claim and download pending files, yielding those to convert."""
+            for file in pending_files:
+                file_id = file["id"]
+                file_name = file["name"]
 
-            local_path = os.path.join(download_dir, file_name)
-            if not drive_service.download_file(file_id, local_path):
-                error_msg = f"Failed to download {file_name} (ID: {file_id})"
-                logger.error(error_msg)
-                drive_service.mark_file_as_failed(
-                    file_id=file_id, machine_id=machine_id, error_message=error_msg
-                )
-                continue
+                # TODO Implement retry logic
 
-            logger.info(f"Downloaded: {file_name} to {local_path}")
+                # Claim the file, another machine may have taken it since the lookup
+                if not drive_service.mark_file_as_processing(file_id, machine_id):
+                    logger.info(
+                        f"Skipping {file_name} (ID: {file_id}), already being processed by another machine"
+                    )
+                    settle(file)
+                    continue
 
-            # Convert raw to dng
-            dng_file_name = os.path.splitext(file_name)[0] + ".dng"
-            dng_file_path = os.path.join(output_dir, dng_file_name)
+                # Download raw file
+                local_path = os.path.join(download_dir, file_name)
+                try:
+                    downloaded = drive_service.download_file(
+                        file_id,
+                        local_path,
+                        size=file.get("size"),
+                        md5_checksum=file.get("md5Checksum"),
+                    )
+                except DownloadIntegrityError as e:
+                    # Counted as a failed attempt, so the next run retries it
+                    mark_failed(file_id, f"Corrupt download of {file_name}: {str(e)}")
+                    settle(file)
+                    continue
 
-            if not os.path.exists(dng_file_path):
-                converted = converter.convert(
-                    local_path, output_dir, file_id, already_marked=True
-                )
-                if not converted:
-                    error_msg = f"Failed to convert {file_name}"
-                    logger.error(error_msg)
-                    drive_service.mark_file_as_failed(
-                        file_id=file_id, machine_id=machine_id, error_message=error_msg
+                if not downloaded:
+                    mark_failed(
+                        file_id, f"Failed to download {file_name} (ID: {file_id})"
                     )
+                    settle(file)
                     continue
-            else:
-                logger.info(f"DNG file already exists: {dng_file_path}")
 
-            # Upload to NAS
+                logger.info(f"Downloaded: {file_name} to {local_path}")
+
+                dng_file_name = os.path.splitext(file_name)[0] + ".dng"
+                dng_file_path = os.path.join(output_dir, dng_file_name)
+                job = {
+                    "file": file,
+                    "file_path": local_path,
+                    "output_dir": output_dir,
+                    "file_id": file_id,
+                    "already_marked": True,
+                    "dng_file_path": dng_file_path,
+                }
+
+                if os.path.exists(dng_file_path):
+                    logger.info(f"DNG file already exists: {dng_file_path}")
+                    upload(job)
+                    settle(file)
+                else:
+                    unsettled_jobs[file_id] = job
+                    yield job
+
+        def upload(job):
+            """Upload a converted file to the NAS and queue it for archiving."""
+            file = job["file"]
+            file_id = file["id"]
+            file_name = file["name"]
+            dng_file_path = job["dng_file_path"]
+            dng_file_name = os.path.basename(dng_file_path)
+
             if not os.path.exists(dng_file_path):
-                error_msg = f"DNG file not found after conversion: {dng_file_path}"
-                logger.error(error_msg)
-                drive_service.mark_file_as_failed(
-                    file_id=file_id, machine_id=machine_id, error_message=error_msg
+                mark_failed(
+                    file_id, f"DNG file not found after conversion: {dng_file_path}"
                 )
-                continue
-
-            synology_service = SynologyService(firebase_creds_path)
+                return
 
             base_url = f"https://{nas_ip}:{nas_port}/webapi"
             nas_sid = synology_service.get_sid(base_url, nas_user, nas_pwd)
@@ -159,12 +350,8 @@ def main():
             )
 
             if not uploaded:
-                error_msg = f"Failed to upload {dng_file_name} to NAS."
-                logger.error(error_msg)
-                drive_service.mark_file_as_failed(
-                    file_id=file_id, machine_id=machine_id, error_message=error_msg
-                )
-                continue
+                mark_failed(file_id, f"Failed to upload {dng_file_name} to NAS.")
+                return
 
             drive_service.mark_file_as_uploaded(
                 file_id,
@@ -174,6 +361,7 @@ def main():
                     "converted_filename": dng_file_name,
                     "dng_dest": dng_dest_path,
                 },
+                defer=True,
             )
 
             logged_out = synology_service.logout(base_url, nas_sid)
@@ -181,17 +369,78 @@ def main():
             if not logged_out:
                 logger.warning("There was a problem logging out of the NAS session.")
 
-            # Move to archive
-            move_successful = move_to_archive(drive_service, file, archive_folder_id)
-
-            if not move_successful:
-                logger.warning(
-                    f"{file_name}(ID: {file_id}) was not successfully moved to archive."
+            # Queue for the batched move to archive
+            archive_queue.append(file)
+            if len(archive_queue) >= ARCHIVE_BATCH_SIZE:
+                archive_files(
+                    drive_service, archive_queue, archive_folder_id, listing_cache
                 )
+                archive_queue.clear()
+
+        # Files are downloaded while earlier ones convert, and uploaded as
+        # their conversion completes
+        for job, converted, error in converter.convert_many(conversion_jobs()):
+            file_name = job["file"]["name"]
+            if error is not None:
+                # convert marks the file as failed before raising
+                logger.error(f"Failed to convert {file_name}: {str(error)}")
+            elif not converted:
+                mark_failed(job["file_id"], f"Failed to convert {file_name}")
+            else:
+                upload(job)
+            unsettled_jobs.pop(job["file_id"], None)
+            settle(job["file"])
+
+        # Only now are all discovered files handled; an interrupted run
+        # repeats its discovery instead
+        if discovery == "changes":
+            drive_service.commit_changes_state()
+
+        stats = status_cache.stats()
+        logger.info(
+            f"Status cache answered {stats['hits']} lookups locally, "
+            f"read {stats['misses']} from Firestore"
+        )
 
     except Exception as e:
         logger.error(f"An error occurred in the main script: {str(e)}")
 
+    finally:
+        if converter is not None:
+            converter.shutdown()
+
+        # Conversions that finished after the loop stopped are marked
+        # processed, which cannot be claimed again; fail them so the next run
+        # retries them
+        for file_id, job in unsettled_jobs.items():
+            error_msg = f"Run stopped before {job['file']['name']} was uploaded"
+            logger.error(error_msg)
+            try:
+                drive_service.mark_file_as_failed(
+                    file_id=file_id,
+                    machine_id=machine_id,
+                    error_message=error_msg,
+                    defer=True,
+                )
+            except Exception as e:
+                logger.error(f"Failed to mark {file_id} as failed: {str(e)}")
+
+        if partitioner is not None:
+            partitioner.stop()
+
+        # Uploaded files must still be archived if the loop stopped early
+        if archive_queue:
+            archive_files(
+                drive_service, archive_queue, archive_folder_id, listing_cache
+            )
+
+        # Final statuses are committed in batches, write out the rest
+        if drive_service is not None:
+            try:
+                drive_service.flush_status_writes()
+            except Exception as e:
+                logger.error(f"Failed to write file statuses to Firestore: {str(e)}")
+
     logger.info("Script execution completed")
 
 
@@ -0,0 +1,276 @@
+import json
+import os
+import random
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+from log_config import get_logger
+
+logger = get_logger()
+
+# Sustained Drive request budget in cost units per second, shared by every
+# Drive client in the process. Override with DRIVE_RATE_LIMIT.
+DEFAULT_RATE = 20.0
+
+# Cost of one call per Drive method; writes are throttled much sooner than
+# reads, so they draw more from the bucket
+METHOD_COSTS = {
+    "about.get": 1,
+    "changes.getStartPageToken": 1,
+    "changes.list": 1,
+    "files.get": 1,
+    "files.get_media": 1,
+    "files.list": 1,
+    "files.create": 5,
+    "files.update": 5,
+}
+DEFAULT_COST = 1
+
+MAX_RETRIES = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 32.0
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide DriveRateLimiter."""
+    global _rate_limiter
+
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            rate = float(os.environ.get("DRIVE_RATE_LIMIT", DEFAULT_RATE))
+            _rate_limiter = DriveRateLimiter(rate=rate)
+        return _rate_limiter
+
+
+def is_throttled(error):
+    """Return True if an error means Google is throttling our requests."""
+    if not isinstance(error, HttpError):
+        return False
+
+    status = error.resp.status
+    if status == 429:
+        return True
+    if status != 403:
+        return False
+
+    try:
+        content = json.loads(error.content)
+        reasons = {
+            detail.get("reason") for detail in content["error"].get("errors", [])
+        }
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return False
+    return bool(reasons & RATE_LIMIT_REASONS)
+
+
+def is_retryable(error):
+    """Return True if a failed Drive call should be retried after a backoff."""
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUSES or is_throttled(error)
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire blocks until enough tokens are available."""
+
+    def __init__(self, rate, capacity=None):
+        """Initialize the bucket.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum burst size, defaults to two seconds of tokens
+        """
+        if rate <= 0:
+            raise ValueError("Rate limit must be positive.")
+
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate * 2)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        """Take cost tokens, waiting for the bucket to refill if needed.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        # A call costing more than the bucket holds still goes through once full
+        cost = min(cost, self.capacity)
+        waited = 0.0
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return waited
+
+                delay = (cost - self.tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+
+class ConcurrencyController:
+    """AIMD limit on the number of concurrent Drive calls.
+
+    The limit is halved when Google throttles a call and grows by one after a
+    full window of successful calls, so workers settle just below the point
+    where throttling starts.
+    """
+
+    def __init__(
+        self, limit, min_limit=1, max_limit=None, on_change=None, cooldown=1.0
+    ):
+        """Initialize the controller.
+
+        Args:
+            limit: Initial concurrency limit
+            min_limit: Lowest limit the controller backs off to
+            max_limit: Highest limit the controller grows to, defaults to limit
+            on_change: Callable receiving the new limit whenever it changes
+            cooldown: Seconds after a decrease during which further throttles
+                are treated as part of the same congestion event
+        """
+        self.limit = limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit or limit
+        self.on_change = on_change
+        self.cooldown = cooldown
+        self.successes = 0
+        self.last_decrease = None
+        self.lock = threading.Lock()
+
+    def on_success(self):
+        """Record a successful call; grows the limit after limit successes."""
+        with self.lock:
+            self.successes += 1
+            if self.successes < self.limit or self.limit >= self.max_limit:
+                return
+            self.successes = 0
+            self.limit += 1
+            limit = self.limit
+
+        self._changed(limit)
+
+    def on_throttle(self):
+        """Record a throttled call; halves the limit at most once per cooldown."""
+        with self.lock:
+            now = time.monotonic()
+            if (
+                self.last_decrease is not None
+                and now - self.last_decrease < self.cooldown
+            ):
+                return
+            self.last_decrease = now
+            self.successes = 0
+
+            limit = max(self.min_limit, self.limit // 2)
+            if limit == self.limit:
+                return
+            self.limit = limit
+
+        logger.warning(f"Drive API throttling, lowering concurrency to {limit}")
+        self._changed(limit)
+
+    def _changed(self, limit):
+        if self.on_change:
+            self.on_change(limit)
+
+
+class DriveRateLimiter:
+    """Rate limits Drive calls and retries transient failures with backoff."""
+
+    def __init__(
+        self,
+        rate=DEFAULT_RATE,
+        capacity=None,
+        max_retries=MAX_RETRIES,
+        base_delay=BASE_DELAY,
+        max_delay=MAX_DELAY,
+        method_costs=None,
+    ):
+        """Initialize the rate limiter.
+
+        Args:
+            rate: Cost units allowed per second
+            capacity: Maximum burst in cost units
+            max_retries: Retries of a call after its first attempt
+            base_delay: Backoff ceiling in seconds for the first retry
+            max_delay: Maximum backoff in seconds
+            method_costs: Cost per Drive method name, defaults to METHOD_COSTS
+        """
+        self.bucket = TokenBucket(rate, capacity)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.method_costs = method_costs or METHOD_COSTS
+
+    def cost(self, method):
+        """Return the bucket cost of one call to a Drive method."""
+        return self.method_costs.get(method, DEFAULT_COST)
+
+    def backoff(self, attempt, error=None):
+        """Return the delay before retry number attempt (0-based).
+
+        Uses full jitter, and honours a Retry-After header when Google sends one.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+        retry_after = None
+        if isinstance(error, HttpError):
+            retry_after = error.resp.get("retry-after")
+        try:
+            return max(delay, min(self.max_delay, float(retry_after)))
+        except (TypeError, ValueError):
+            return delay
+
+    def execute(self, call, method, cost=None, controller=None):
+        """Run a Drive call under the rate limit, retrying transient failures.
+
+        Args:
+            call: Callable performing the request, e.g. request.execute
+            method: Drive method name used to look up the call's cost
+            cost: Explicit cost, e.g. for batch requests
+            controller: ConcurrencyController notified of successes and throttles
+
+        Returns:
+            The result of call()
+        """
+        cost = self.cost(method) if cost is None else cost
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire(cost)
+            try:
+                result = call()
+            except Exception as e:
+                if controller and is_throttled(e):
+                    controller.on_throttle()
+                if not is_retryable(e) or attempt == self.max_retries:
+                    raise
+
+                delay = self.backoff(attempt, e)
+                logger.warning(
+                    f"Drive {method} failed ({str(e)}), retrying in {delay:.1f}s "
+                    f"({attempt + 1}/{self.max_retries})"
+                )
+                time.sleep(delay)
+                continue
+
+            if controller:
+                controller.on_success()
+            return result
@@ -1,12 +1,16 @@
 import os
 import subprocess
 import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-from firestore_service import FirestoreService
 from log_config import get_logger
+from status_store import create_status_store
 
 logger = get_logger()
 
+# Converter subprocesses run at once; override with CONVERT_WORKERS
+DEFAULT_CONVERT_WORKERS = os.cpu_count() or 1
+
 
 class RawFileConverter:
     def __init__(
@@ -14,21 +18,31 @@ class RawFileConverter:
         firestore_service=None,
         firebase_credentials_path=None,
         collection_name="processed_files",
+        max_workers=None,
     ):
         """Initialize the RawFileConverter
 
         Args:
-            firestore_service: An existing FirestoreService instance or None to create a new one
+            firestore_service: An existing status store (see status_store) or None to create a new one
             firebase_credentials_path: Path to Firebase credentials file (if creating a new service)
             collection_name: Name of the Firestore collection to use
+            max_workers: Conversions run at once by submit and convert_many
         """
         if firestore_service:
             self.firestore_service = firestore_service
         else:
-            self.firestore_service = FirestoreService(
+            self.firestore_service = create_status_store(
                 collection_name=collection_name,
                 credentials_path=firebase_credentials_path,
             )
+        self.max_workers = max_workers or int(
+            os.environ.get("CONVERT_WORKERS", DEFAULT_CONVERT_WORKERS)
+        )
+        self.executor = None
+
+        # Status of each submitted conversion by file ID; status stores are
+        # thread-safe, so the lock only guards this and the executor
+        self.jobs = {}
         self.lock = threading.Lock()
 
     def is_processed(self, file_id):
@@ -45,22 +59,19 @@ class RawFileConverter:
         Returns:
             bool: True if successfully marked as processing, False if already being processed
         """
-        with self.lock:
-            return self.firestore_service.mark_as_processing(file_id, machine_id)
+        return self.firestore_service.mark_as_processing(file_id, machine_id)
 
     def mark_as_processed(self, file_id, machine_id=None, additional_data=None):
         """Mark a file as processed and update Firestore."""
-        with self.lock:
-            return self.firestore_service.mark_as_processed(
-                file_id, machine_id, additional_data
-            )
+        return self.firestore_service.mark_as_processed(
+            file_id, machine_id, additional_data
+        )
 
     def mark_as_failed(self, file_id, error_message=None, machine_id=None):
         """Mark a file as failed and update Firestore."""
-        with self.lock:
-            return self.firestore_service.mark_as_failed(
-                file_id, error_message, machine_id
-            )
+        return self.firestore_service.mark_as_failed(
+            file_id, machine_id=machine_id, error_message=error_message
+        )
 
     def convert(self, file_path, output_dir, file_id=None, already_marked=False):
         """Convert a raw file to DNG format
@@ -151,3 +162,109 @@ class RawFileConverter:
                 self.mark_as_failed(file_id, error_message)
 
             raise
+
+    def job_status(self, file_id):
+        """Return the status of a submitted conversion.
+
+        Returns:
+            str: queued, converting, converted, skipped or failed; None if the
+                file was never submitted
+        """
+        with self.lock:
+            return self.jobs.get(file_id)
+
+    def _set_job_status(self, file_id, status):
+        with self.lock:
+            self.jobs[file_id] = status
+
+    def _run_job(self, file_path, output_dir, file_id, already_marked):
+        self._set_job_status(file_id, "converting")
+        try:
+            converted = self.convert(file_path, output_dir, file_id, already_marked)
+        except Exception:
+            self._set_job_status(file_id, "failed")
+            raise
+
+        self._set_job_status(file_id, "converted" if converted else "skipped")
+        return converted
+
+    def submit(self, file_path, output_dir, file_id=None, already_marked=False):
+        """Queue a conversion on the converter pool.
+
+        Up to max_workers converter subprocesses run at once.
+
+        Returns:
+            Future: Resolves to the result of convert, or raises its exception
+        """
+        if file_id is None:
+            file_id = os.path.basename(file_path)
+
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="dng-convert"
+                )
+            self.jobs[file_id] = "queued"
+            executor = self.executor
+
+        return executor.submit(
+            self._run_job, file_path, output_dir, file_id, already_marked
+        )
+
+    def convert_many(self, jobs):
+        """Convert files concurrently, yielding each one as it completes.
+
+        Jobs are taken from the iterable only as pool slots free up, so it can
+        be a generator that downloads the next files while earlier ones convert.
+        If the iterable raises, no more jobs are taken; the conversions already
+        running are still yielded before the exception is re-raised.
+
+        Args:
+            jobs: Iterable of dicts with file_path, output_dir and optionally
+                file_id and already_marked; other keys are passed through
+
+        Yields:
+            tuple: (job, converted, error) where converted is the result of
+                convert and error the exception it raised, or None
+        """
+        jobs = iter(jobs)
+        in_flight = {}
+        source_error = None
+
+        def fill():
+            nonlocal source_error
+            while source_error is None and len(in_flight) < self.max_workers:
+                try:
+                    job = next(jobs, None)
+                except Exception as e:
+                    source_error = e
+                    return
+                if job is None:
+                    return
+                future = self.submit(
+                    job["file_path"],
+                    job["output_dir"],
+                    job.get("file_id"),
+                    job.get("already_marked", False),
+                )
+                in_flight[future] = job
+
+        fill()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = in_flight.pop(future)
+                error = future.exception()
+                yield job, future.result() if error is None else False, error
+            fill()
+
+        if source_error is not None:
+            raise source_error
+
+    def shutdown(self, wait=True):
+        """Stop the converter pool, letting running conversions finish."""
+        with self.lock:
+            executor = self.executor
+            self.executor = None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,138 @@
+import threading
+
+from firestore_service import UPLOADED_STATUSES
+from log_config import get_logger
+
+logger = get_logger()
+
+
+class RunStatusCache:
+    """Per-run cache of file status documents in front of a FirestoreService.
+
+    Each status document is read at most once per run; later checks are
+    answered locally. Status changes made through the cache are written to
+    Firestore and applied to the cached copy (write-through). Claims are
+    always made against Firestore itself.
+
+    The cache offers the status methods of FirestoreService, so it can be
+    handed to GoogleDriveService and RawFileConverter in its place.
+    """
+
+    def __init__(self, firestore_service):
+        """Initialize the cache.
+
+        Args:
+            firestore_service: FirestoreService the cache reads and writes through
+        """
+        self.firestore_service = firestore_service
+        self.statuses = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_file_status(self, file_id):
+        """Get the status of a file, reading Firestore only on the first lookup."""
+        with self.lock:
+            if file_id in self.statuses:
+                self.hits += 1
+                status = self.statuses[file_id]
+                return dict(status) if status is not None else None
+            self.misses += 1
+
+        status = self.firestore_service.get_file_status(file_id)
+        with self.lock:
+            self.statuses[file_id] = status
+        return dict(status) if status is not None else None
+
+    def get_file_statuses(self, file_ids):
+        """Get the statuses of several files, bulk-reading only uncached ones."""
+        with self.lock:
+            missing = [file_id for file_id in file_ids if file_id not in self.statuses]
+            self.hits += len(file_ids) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            fetched = self.firestore_service.get_file_statuses(missing)
+            with self.lock:
+                for file_id in missing:
+                    self.statuses[file_id] = fetched.get(file_id)
+
+        with self.lock:
+            return {
+                file_id: (
+                    dict(self.statuses[file_id])
+                    if self.statuses.get(file_id) is not None
+                    else None
+                )
+                for file_id in file_ids
+            }
+
+    def is_processed(self, file_id):
+        """Check if a file has already been processed."""
+        status = self.get_file_status(file_id)
+        return bool(status) and status.get("status") == "processed"
+
+    def is_uploaded(self, file_id):
+        """Check if a file has already been uploaded."""
+        status = self.get_file_status(file_id)
+        return bool(status) and status.get("status") in UPLOADED_STATUSES
+
+    def _update(self, file_id, fields):
+        with self.lock:
+            self.statuses[file_id] = {**(self.statuses.get(file_id) or {}), **fields}
+
+    def mark_as_processing(self, file_id, machine_id=None, **kwargs):
+        """Claim a file in Firestore and cache the claim if it succeeded."""
+        claimed = self.firestore_service.mark_as_processing(
+            file_id, machine_id, **kwargs
+        )
+        if claimed:
+            self._update(file_id, {"status": "processing", "machine_id": machine_id})
+        else:
+            # Another machine holds the file; its status is no longer known
+            with self.lock:
+                self.statuses.pop(file_id, None)
+        return claimed
+
+    def mark_as_processed(
+        self, file_id, machine_id=None, additional_data=None, defer=False
+    ):
+        """Mark a file as processed in Firestore and in the cache."""
+        result = self.firestore_service.mark_as_processed(
+            file_id, machine_id, additional_data, defer=defer
+        )
+        self._update(file_id, {"status": "processed", **(additional_data or {})})
+        return result
+
+    def mark_as_uploaded(
+        self, file_id, machine_id=None, additional_data=None, defer=False
+    ):
+        """Mark a file as uploaded in Firestore and in the cache."""
+        result = self.firestore_service.mark_as_uploaded(
+            file_id, machine_id, additional_data, defer=defer
+        )
+        self._update(file_id, {"status": "uploaded", **(additional_data or {})})
+        return result
+
+    def mark_as_failed(self, file_id, machine_id=None, error_message=None, defer=False):
+        """Mark a file as failed in Firestore and in the cache."""
+        result = self.firestore_service.mark_as_failed(
+            file_id, machine_id, error_message, defer=defer
+        )
+        with self.lock:
+            retry_count = (self.statuses.get(file_id) or {}).get("retry_count", 0)
+        self._update(file_id, {"status": "failed", "retry_count": retry_count + 1})
+        return result
+
+    def flush(self):
+        """Commit deferred status writes of the underlying service."""
+        return self.firestore_service.flush()
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached documents."""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.statuses),
+            }
@@ -0,0 +1,162 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from google.cloud.firestore import FieldFilter
+
+from firestore_service import ARCHIVED_STATUS
+from log_config import get_logger
+
+logger = get_logger()
+
+# Uploaded documents older than this many days are compacted
+COMPACT_AFTER_DAYS = 30
+
+# Days a compacted document's tombstone is kept before Firestore's TTL
+# policy deletes it. Files are moved out of the ingest folder once uploaded,
+# so only the tombstone's dedupe role is lost when it expires.
+TOMBSTONE_TTL_DAYS = 365
+
+# Summary documents per day; each holds a map of the files archived that day
+ARCHIVE_SHARDS = 4
+
+# Documents read per page and compacted per batch; each costs a tombstone
+# write plus at most one summary write, within Firestore's 500 writes per batch
+COMPACTION_BATCH_SIZE = 200
+
+# Fields copied from a status document into its archive summary
+SUMMARY_FIELDS = (
+    "original_filename",
+    "converted_filename",
+    "dng_dest",
+    "machine_id",
+    "processed_at",
+    "retry_count",
+)
+
+
+def archive_collection_name(collection_name):
+    """Return the collection holding the archive summaries of a collection."""
+    return f"{collection_name}_archive"
+
+
+def archive_shard(file_id, day):
+    """Return the summary document ID a file archived on day belongs to."""
+    digest = hashlib.md5(file_id.encode()).hexdigest()
+    return f"{day}-{int(digest[:8], 16) % ARCHIVE_SHARDS}"
+
+
+def _processed_at(data):
+    timestamp = data.get("processed_at") or data.get("updated_at")
+    if not timestamp:
+        return None
+
+    processed_at = datetime.fromisoformat(timestamp)
+    if processed_at.tzinfo is None:
+        processed_at = processed_at.astimezone()
+    return processed_at
+
+
+def compact_uploaded_statuses(
+    db,
+    collection,
+    older_than_days=COMPACT_AFTER_DAYS,
+    tombstone_ttl_days=TOMBSTONE_TTL_DAYS,
+    dry_run=False,
+):
+    """Move old uploaded status documents into date-sharded summaries.
+
+    Each compacted document is summarized in a document of the archive
+    collection, keyed by the day it was processed, and replaced by a small
+    tombstone with the archived status. Archived files count as uploaded, so
+    the status lookup used to skip handled files keeps working, while the
+    tombstones drop out of the uploaded query of later runs. Tombstones carry
+    an expire_at timestamp for a Firestore TTL policy. The summary write and
+    the tombstone of a document are committed in the same batch.
+
+    Uploaded documents are read in pages of COMPACTION_BATCH_SIZE, so no
+    query stream stays open while batches are committed.
+
+    Args:
+        db: Firestore client
+        collection: Status collection reference
+        older_than_days: Compact documents processed at least this many days ago
+        tombstone_ttl_days: Days until a tombstone's expire_at
+        dry_run: Only count the documents that would be compacted
+
+    Returns:
+        int: Number of documents compacted (or that would be)
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=older_than_days)
+    expire_at = now + timedelta(days=tombstone_ttl_days)
+    archive = db.collection(archive_collection_name(collection.id))
+
+    query = (
+        collection.where(filter=FieldFilter("status", "==", "uploaded"))
+        .order_by("__name__")
+        .limit(COMPACTION_BATCH_SIZE)
+    )
+
+    compacted = 0
+    last_doc = None
+    while True:
+        page_query = query if last_doc is None else query.start_after(last_doc)
+        page = list(page_query.stream())
+        if not page:
+            break
+        last_doc = page[-1]
+
+        chunk = []
+        for doc in page:
+            data = doc.to_dict()
+            processed_at = _processed_at(data)
+            if processed_at is not None and processed_at < cutoff:
+                chunk.append((doc, data, processed_at))
+
+        if chunk:
+            compacted += _compact_chunk(db, archive, chunk, expire_at, dry_run)
+        if len(page) < COMPACTION_BATCH_SIZE:
+            break
+
+    logger.info(
+        f"{'Would compact' if dry_run else 'Compacted'} {compacted} uploaded "
+        f"documents of {collection.id} older than {older_than_days} days"
+    )
+    return compacted
+
+
+def _compact_chunk(db, archive, chunk, expire_at, dry_run):
+    if dry_run:
+        return len(chunk)
+
+    archived_at = datetime.now(timezone.utc)
+    summaries = {}
+    batch = db.batch()
+    for doc, data, processed_at in chunk:
+        day = processed_at.date().isoformat()
+        shard = archive_shard(doc.id, day)
+        summaries.setdefault(shard, {})[doc.id] = {
+            field: data[field] for field in SUMMARY_FIELDS if field in data
+        }
+
+        batch.set(
+            doc.reference,
+            {
+                "status": ARCHIVED_STATUS,
+                "processed_at": data.get("processed_at") or data.get("updated_at"),
+                "archived_at": archived_at,
+                "archive_shard": shard,
+                "expire_at": expire_at,
+            },
+        )
+
+    for shard, files in summaries.items():
+        # merge=True adds the files to the map already in the summary
+        batch.set(
+            archive.document(shard),
+            {"day": shard.rsplit("-", 1)[0], "files": files},
+            merge=True,
+        )
+
+    batch.commit()
+    return len(chunk)
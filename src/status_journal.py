@@ -0,0 +1,333 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+
+from google.cloud import firestore
+
+from log_config import get_logger
+from status_writer import MAX_BATCH_WRITES
+
+logger = get_logger()
+
+JOURNAL_PATH = os.path.expanduser("~/UCAutomation/status_journal.db")
+
+# How often the background syncer pushes journaled transitions to Firestore
+SYNC_INTERVAL = 10
+
+# Statuses that no longer change; once pushed they are dropped from the
+# journal, so it (and the reconcile on startup) only covers files in flight
+SETTLED_STATUSES = ("uploaded", "archived", "processed")
+
+_status_journal = None
+_status_journal_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS statuses (
+    collection TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, file_id)
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    increments TEXT NOT NULL
+);
+"""
+
+
+def get_status_journal():
+    """Return the process-wide StatusJournal, or None if it is not enabled.
+
+    The journal is opt-in: set STATUS_JOURNAL=1 to enable it.
+    """
+    global _status_journal
+
+    if os.environ.get("STATUS_JOURNAL") != "1":
+        return None
+
+    with _status_journal_lock:
+        if _status_journal is None:
+            _status_journal = StatusJournal()
+        return _status_journal
+
+
+class StatusJournal:
+    """Local write-ahead journal of file status transitions.
+
+    Transitions are committed to a SQLite database (in WAL mode) right away
+    and answer status queries for the files they touch. A background syncer
+    pushes them to Firestore in batches, so a slow or unreachable Firestore
+    does not hold up processing. Entries stay in the journal until Firestore
+    accepted them, and are pushed on the next start if the process exits first.
+    Files whose final status was pushed are dropped from the journal.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, sync_interval=SYNC_INTERVAL):
+        """Initialize the journal.
+
+        Args:
+            path: SQLite database the journal is kept in
+            sync_interval: Seconds between background pushes to Firestore
+        """
+        self.path = path
+        self.sync_interval = sync_interval
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+        # Serializes pushes so an entry is never sent twice
+        self.sync_lock = threading.Lock()
+        self.collections = {}
+        self.sync_thread = None
+        self.sync_stop = threading.Event()
+
+        atexit.register(self.stop)
+
+    def record(self, collection_name, file_id, fields, increments=None):
+        """Journal a status transition and apply it to the local status.
+
+        Args:
+            collection_name: Firestore collection of the status document
+            file_id: Google Drive file ID
+            fields: Fields set on the status document
+            increments: Maps numeric fields to the amount to add to them
+        """
+        increments = increments or {}
+        with self.lock, self.conn:
+            status = self._get(collection_name, file_id) or {}
+            status.update(fields)
+            for field, amount in increments.items():
+                status[field] = status.get(field, 0) + amount
+
+            self._put(collection_name, file_id, status)
+            self.conn.execute(
+                "INSERT INTO outbox (collection, file_id, fields, increments) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    collection_name,
+                    file_id,
+                    json.dumps(fields, default=str),
+                    json.dumps(increments),
+                ),
+            )
+
+    def put(self, collection_name, file_id, data):
+        """Store a status read from or written directly to Firestore.
+
+        The local status is kept if it has transitions not yet pushed.
+        """
+        with self.lock, self.conn:
+            if not self._has_pending(collection_name, file_id):
+                self._put(collection_name, file_id, data)
+
+    def lookup(self, collection_name, file_id):
+        """Look a file's status up in the journal.
+
+        Returns:
+            tuple: (known, status). known is False for files the journal has
+                not seen, which must be read from Firestore.
+        """
+        with self.lock:
+            status = self._get(collection_name, file_id)
+        return status is not None, status
+
+    def pending_count(self, collection_name=None):
+        """Return the number of transitions not yet pushed to Firestore."""
+        query = "SELECT COUNT(*) FROM outbox"
+        params = ()
+        if collection_name is not None:
+            query += " WHERE collection = ?"
+            params = (collection_name,)
+        with self.lock:
+            return self.conn.execute(query, params).fetchone()[0]
+
+    def _get(self, collection_name, file_id):
+        row = self.conn.execute(
+            "SELECT data FROM statuses WHERE collection = ? AND file_id = ?",
+            (collection_name, file_id),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, collection_name, file_id, data):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO statuses (collection, file_id, data) "
+            "VALUES (?, ?, ?)",
+            (collection_name, file_id, json.dumps(data, default=str)),
+        )
+
+    def _has_pending(self, collection_name, file_id):
+        row = self.conn.execute(
+            "SELECT 1 FROM outbox WHERE collection = ? AND file_id = ? LIMIT 1",
+            (collection_name, file_id),
+        ).fetchone()
+        return row is not None
+
+    def sync(self, db, collection, file_id=None):
+        """Push journaled transitions of a collection to Firestore.
+
+        Transitions of a document are coalesced into one merge write, with
+        counters sent as Increment transforms. Entries are removed from the
+        journal only after their batch was committed.
+
+        Args:
+            db: Firestore client
+            collection: Firestore collection reference
+            file_id: Only push the transitions of this file; all by default
+
+        Returns:
+            int: Number of journal entries pushed
+        """
+        where = "collection = ?"
+        params = (collection.id,)
+        if file_id is not None:
+            where += " AND file_id = ?"
+            params += (file_id,)
+
+        pushed = 0
+        with self.sync_lock:
+            while True:
+                with self.lock:
+                    rows = self.conn.execute(
+                        "SELECT seq, file_id, fields, increments FROM outbox "
+                        f"WHERE {where} ORDER BY seq LIMIT ?",
+                        (*params, MAX_BATCH_WRITES),
+                    ).fetchall()
+                if not rows:
+                    if file_id is None:
+                        self._prune(collection.id)
+                    return pushed
+
+                writes = {}
+                for _, doc_id, fields, increments in rows:
+                    data, counters = writes.setdefault(doc_id, ({}, {}))
+                    data.update(json.loads(fields))
+                    for field, amount in json.loads(increments).items():
+                        counters[field] = counters.get(field, 0) + amount
+
+                batch = db.batch()
+                for doc_id, (data, counters) in writes.items():
+                    for field, amount in counters.items():
+                        data[field] = firestore.Increment(amount)
+                    batch.set(collection.document(doc_id), data, merge=True)
+                batch.commit()
+
+                with self.lock, self.conn:
+                    self.conn.execute(
+                        f"DELETE FROM outbox WHERE {where} AND seq <= ?",
+                        (*params, rows[-1][0]),
+                    )
+                pushed += len(rows)
+
+    def _prune(self, collection_name):
+        """Drop settled statuses that have no transitions left to push."""
+        placeholders = ", ".join("?" * len(SETTLED_STATUSES))
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM statuses WHERE collection = ? "
+                f"AND json_extract(data, '$.status') IN ({placeholders}) "
+                "AND file_id NOT IN "
+                "(SELECT file_id FROM outbox WHERE collection = ?)",
+                (collection_name, *SETTLED_STATUSES, collection_name),
+            )
+
+    def reconcile(self, db, collection):
+        """Push pending transitions, then refresh journaled statuses from Firestore.
+
+        Statuses other machines changed since this journal last saw them are
+        replaced by the remote documents.
+        """
+        self.sync(db, collection)
+
+        with self.lock:
+            file_ids = [
+                row[0]
+                for row in self.conn.execute(
+                    "SELECT file_id FROM statuses WHERE collection = ?",
+                    (collection.id,),
+                )
+            ]
+
+        for start in range(0, len(file_ids), MAX_BATCH_WRITES):
+            doc_refs = [
+                collection.document(file_id)
+                for file_id in file_ids[start : start + MAX_BATCH_WRITES]
+            ]
+            for doc in db.get_all(doc_refs):
+                with self.lock, self.conn:
+                    if self._has_pending(collection.id, doc.id):
+                        continue
+                    if doc.exists:
+                        self._put(collection.id, doc.id, doc.to_dict())
+                    else:
+                        self.conn.execute(
+                            "DELETE FROM statuses WHERE collection = ? AND file_id = ?",
+                            (collection.id, doc.id),
+                        )
+
+        logger.info(
+            f"Status journal reconciled {len(file_ids)} files of {collection.id}"
+        )
+
+    def start(self, db, collection):
+        """Reconcile a collection and keep pushing its transitions in the background.
+
+        Failing to reach Firestore here is not fatal; the syncer keeps retrying.
+        """
+        with self.lock:
+            if collection.id in self.collections:
+                return
+            self.collections[collection.id] = (db, collection)
+
+        try:
+            self.reconcile(db, collection)
+        except Exception as e:
+            logger.warning(f"Could not reconcile status journal: {str(e)}")
+
+        with self.lock:
+            if self.sync_thread is None or not self.sync_thread.is_alive():
+                self.sync_stop.clear()
+                self.sync_thread = threading.Thread(
+                    target=self._run, name="status-journal-sync", daemon=True
+                )
+                self.sync_thread.start()
+
+    def sync_all(self):
+        """Push the pending transitions of every started collection."""
+        with self.lock:
+            collections = list(self.collections.values())
+
+        pushed = 0
+        for db, collection in collections:
+            pushed += self.sync(db, collection)
+        return pushed
+
+    def _run(self):
+        while not self.sync_stop.wait(self.sync_interval):
+            try:
+                self.sync_all()
+            except Exception as e:
+                logger.warning(f"Status journal sync failed, will retry: {str(e)}")
+
+    def stop(self):
+        """Stop the background syncer and make a last attempt to push."""
+        self.sync_stop.set()
+        if self.sync_thread is not None:
+            self.sync_thread.join()
+            self.sync_thread = None
+
+        try:
+            self.sync_all()
+        except Exception as e:
+            logger.warning(
+                f"{self.pending_count()} status changes left in the journal: {str(e)}"
+            )
@@ -0,0 +1,141 @@
+import threading
+import time
+
+from google.cloud.firestore import FieldFilter
+
+from log_config import get_logger
+
+logger = get_logger()
+
+# Statuses that can still change; a mirror limited to these stays small
+NON_TERMINAL_STATUSES = ["processing", "failed"]
+
+# Seconds start() waits for the listener to deliver the initial snapshot
+INITIAL_SYNC_TIMEOUT = 30
+
+
+class StatusMirror:
+    """In-memory copy of the status collection kept current by a snapshot listener.
+
+    Lookups are answered from memory while the listener is connected. When it
+    is not (or the mirror is older than max_staleness), lookup reports the
+    status as unknown so callers fall back to reading Firestore directly.
+    """
+
+    def __init__(self, collection, non_terminal_only=False, max_staleness=None):
+        """Initialize the mirror.
+
+        Args:
+            collection: Firestore collection reference to mirror
+            non_terminal_only: Only mirror documents whose status can still
+                change; other files are read from Firestore
+            max_staleness: Seconds since the last snapshot after which the
+                mirror is no longer trusted. Firestore only delivers snapshots
+                on changes, so leave as None for quiet collections.
+        """
+        self.collection = collection
+        self.non_terminal_only = non_terminal_only
+        self.max_staleness = max_staleness
+        self.statuses = {}
+        self.lock = threading.Lock()
+        self.synced = threading.Event()
+        self.watch = None
+        self.last_snapshot = None
+        self.read_time = None
+        self.disconnected = False
+
+    def start(self, timeout=INITIAL_SYNC_TIMEOUT):
+        """Subscribe to the collection and wait for the initial snapshot.
+
+        Returns:
+            bool: True if the mirror is in sync and will answer lookups
+        """
+        query = self.collection
+        if self.non_terminal_only:
+            query = self.collection.where(
+                filter=FieldFilter("status", "in", NON_TERMINAL_STATUSES)
+            )
+
+        self.watch = query.on_snapshot(self._on_snapshot)
+        if not self.synced.wait(timeout):
+            logger.warning(
+                "Status mirror did not sync in time, reading statuses directly"
+            )
+            return False
+
+        logger.info(f"Status mirror in sync with {len(self.statuses)} documents")
+        return True
+
+    def stop(self):
+        """Unsubscribe from the collection."""
+        if self.watch is not None:
+            self.watch.unsubscribe()
+            self.watch = None
+        self.synced.clear()
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self.lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == "REMOVED":
+                    self.statuses.pop(doc.id, None)
+                else:
+                    self.statuses[doc.id] = doc.to_dict()
+
+            self.last_snapshot = time.monotonic()
+            self.read_time = read_time
+
+        self.synced.set()
+
+    def staleness(self):
+        """Return seconds since the last snapshot, or None before the first one."""
+        with self.lock:
+            if self.last_snapshot is None:
+                return None
+            return time.monotonic() - self.last_snapshot
+
+    def is_live(self):
+        """Return True if lookups can be answered from memory."""
+        if not self.synced.is_set() or self.watch is None:
+            return False
+
+        if not self.watch.is_active:
+            if not self.disconnected:
+                self.disconnected = True
+                logger.warning(
+                    "Status mirror listener disconnected, reading statuses directly"
+                )
+            return False
+
+        if self.max_staleness is not None and self.staleness() > self.max_staleness:
+            return False
+        return True
+
+    def lookup(self, file_id):
+        """Look a file's status up in memory.
+
+        Returns:
+            tuple: (known, status). known is False when the caller must read
+                Firestore; otherwise status is the document data, or None if
+                the file has no status document.
+        """
+        if not self.is_live():
+            return False, None
+
+        with self.lock:
+            status = self.statuses.get(file_id)
+
+        if status is not None:
+            return True, dict(status)
+        if self.non_terminal_only:
+            return False, None
+        return True, None
+
+    def put(self, file_id, data):
+        """Record fields written by this process before the listener echoes them."""
+        terminal = data.get("status") not in NON_TERMINAL_STATUSES
+        with self.lock:
+            if self.non_terminal_only and terminal:
+                self.statuses.pop(file_id, None)
+            else:
+                self.statuses[file_id] = {**self.statuses.get(file_id, {}), **data}
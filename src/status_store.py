@@ -0,0 +1,310 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Protocol
+
+from firestore_service import (
+    DONE_STATUSES,
+    LEASE_DURATION,
+    UPLOADED_STATUSES,
+    FirestoreService,
+    lease_active,
+)
+from log_config import get_logger
+
+logger = get_logger()
+
+STATUS_STORE_BACKENDS = ("firestore", "sqlite", "memory")
+
+SQLITE_STORE_PATH = os.path.expanduser("~/UCAutomation/status_store.db")
+
+
+class StatusStore(Protocol):
+    """Operations the services need from a file status store.
+
+    FirestoreService is the production store; InMemoryStatusStore and
+    SQLiteStatusStore behave the same without Google credentials.
+    """
+
+    def mark_as_processing(
+        self, file_id, machine_id=None, lease_seconds=LEASE_DURATION
+    ): ...
+
+    def renew_lease(self, file_id, machine_id, lease_seconds=LEASE_DURATION): ...
+
+    def mark_as_processed(
+        self, file_id, machine_id=None, additional_data=None, defer=False
+    ): ...
+
+    def mark_as_uploaded(
+        self, file_id, machine_id=None, additional_data=None, defer=False
+    ): ...
+
+    def mark_as_failed(
+        self, file_id, machine_id=None, error_message=None, defer=False
+    ): ...
+
+    def is_processed(self, file_id): ...
+
+    def is_uploaded(self, file_id): ...
+
+    def get_file_status(self, file_id): ...
+
+    def get_file_statuses(self, file_ids): ...
+
+    def flush(self): ...
+
+
+def create_status_store(
+    collection_name="processed_files", credentials_path=None, backend=None
+):
+    """Create the status store selected by configuration.
+
+    Args:
+        collection_name: Firestore collection, or namespace of a local store
+        credentials_path: Path to Firebase credentials JSON file
+        backend: firestore, sqlite or memory; defaults to the STATUS_STORE
+            environment variable, then firestore. The sqlite store is kept in
+            STATUS_STORE_PATH if set.
+
+    Returns:
+        StatusStore: The configured store
+    """
+    backend = backend or os.environ.get("STATUS_STORE", "firestore")
+
+    if backend == "firestore":
+        return FirestoreService(
+            collection_name=collection_name, credentials_path=credentials_path
+        )
+    if backend == "sqlite":
+        return SQLiteStatusStore(
+            path=os.environ.get("STATUS_STORE_PATH", SQLITE_STORE_PATH),
+            collection_name=collection_name,
+        )
+    if backend == "memory":
+        return InMemoryStatusStore()
+
+    raise ValueError(
+        f"Unknown status store {backend!r}, expected one of "
+        f"{', '.join(STATUS_STORE_BACKENDS)}"
+    )
+
+
+class LocalStatusStore(ABC):
+    """Status store logic shared by the stores that keep documents locally.
+
+    Subclasses provide _read, which returns the documents of several files,
+    and _update, which applies a change to one document atomically.
+    """
+
+    @abstractmethod
+    def _read(self, file_ids):
+        """Return the documents of the given files that exist, by file ID."""
+
+    @abstractmethod
+    def _update(self, file_id, change):
+        """Replace a document with change(previous); None leaves it untouched."""
+
+    def mark_as_processing(
+        self, file_id, machine_id=None, lease_seconds=LEASE_DURATION
+    ):
+        """Claim a file for processing, unless it is done or another claim's lease holds."""
+        machine_id = machine_id or os.uname().nodename
+
+        def claim(previous):
+            if previous.get("status") in DONE_STATUSES or lease_active(previous):
+                return None
+
+            now = datetime.now(timezone.utc)
+            return {
+                "status": "processing",
+                "machine_id": machine_id,
+                "updated_at": datetime.now().isoformat(),
+                "lease_until": (now + timedelta(seconds=lease_seconds)).isoformat(),
+                "retry_count": previous.get("retry_count", 0),
+            }
+
+        return self._update(file_id, claim) is not None
+
+    def renew_lease(self, file_id, machine_id, lease_seconds=LEASE_DURATION):
+        """Extend this machine's processing lease on a file."""
+
+        def renew(previous):
+            if (
+                previous.get("status") != "processing"
+                or previous.get("machine_id") != machine_id
+            ):
+                return None
+            lease_until = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+            return {**previous, "lease_until": lease_until.isoformat()}
+
+        return self._update(file_id, renew) is not None
+
+    def _mark(self, file_id, status, machine_id, fields, increments=None):
+        machine_id = machine_id or os.uname().nodename
+        current_time = datetime.now().isoformat()
+        data = {
+            "status": status,
+            "machine_id": machine_id,
+            "updated_at": current_time,
+            **fields,
+        }
+
+        def merge(previous):
+            merged = {**previous, **data}
+            for field, amount in (increments or {}).items():
+                merged[field] = previous.get(field, 0) + amount
+            return merged
+
+        self._update(file_id, merge)
+        return True
+
+    def mark_as_processed(
+        self, file_id, machine_id=None, additional_data=None, defer=False
+    ):
+        """Mark a file as successfully processed."""
+        processed_at = datetime.now().isoformat()
+        return self._mark(
+            file_id,
+            "processed",
+            machine_id,
+            {"processed_at": processed_at, **(additional_data or {})},
+        )
+
+    def mark_as_uploaded(
+        self, file_id, machine_id=None, additional_data=None, defer=False
+    ):
+        """Mark a file as successfully uploaded."""
+        processed_at = datetime.now().isoformat()
+        return self._mark(
+            file_id,
+            "uploaded",
+            machine_id,
+            {"processed_at": processed_at, **(additional_data or {})},
+        )
+
+    def mark_as_failed(self, file_id, machine_id=None, error_message=None, defer=False):
+        """Mark a file as failed processing and count the attempt."""
+        fields = {"failed_at": datetime.now().isoformat()}
+        if error_message:
+            fields["error_message"] = error_message
+        return self._mark(
+            file_id, "failed", machine_id, fields, increments={"retry_count": 1}
+        )
+
+    def is_processed(self, file_id):
+        """Check if a file has already been processed."""
+        status = self.get_file_status(file_id)
+        return bool(status) and status.get("status") == "processed"
+
+    def is_uploaded(self, file_id):
+        """Check if a file has already been uploaded."""
+        status = self.get_file_status(file_id)
+        return bool(status) and status.get("status") in UPLOADED_STATUSES
+
+    def get_file_status(self, file_id):
+        """Get the current status of a file, or None if it has none."""
+        return self._read([file_id]).get(file_id)
+
+    def get_file_statuses(self, file_ids):
+        """Get the current status of several files."""
+        file_ids = list(dict.fromkeys(file_ids))
+        statuses = self._read(file_ids)
+        return {file_id: statuses.get(file_id) for file_id in file_ids}
+
+    def flush(self):
+        """Writes are applied immediately, there is nothing to commit."""
+        return 0
+
+
+class InMemoryStatusStore(LocalStatusStore):
+    """Status store kept in a dictionary, for tests and single-process runs."""
+
+    def __init__(self):
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def _read(self, file_ids):
+        with self.lock:
+            return {
+                file_id: dict(self.documents[file_id])
+                for file_id in file_ids
+                if file_id in self.documents
+            }
+
+    def _update(self, file_id, change):
+        with self.lock:
+            data = change(dict(self.documents.get(file_id, {})))
+            if data is not None:
+                self.documents[file_id] = data
+            return data
+
+
+class SQLiteStatusStore(LocalStatusStore):
+    """Status store kept in a SQLite database.
+
+    Claims take the database's write lock, so processes on one machine
+    sharing the database cannot claim the same file.
+    """
+
+    def __init__(self, path=SQLITE_STORE_PATH, collection_name="processed_files"):
+        """Initialize the store.
+
+        Args:
+            path: SQLite database file
+            collection_name: Namespace of the documents in the database
+        """
+        self.path = path
+        self.collection_name = collection_name
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Transactions are managed explicitly, see _update
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS statuses ("
+            "collection TEXT NOT NULL, file_id TEXT NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (collection, file_id))"
+        )
+        self.lock = threading.Lock()
+
+    def _read(self, file_ids):
+        statuses = {}
+        with self.lock:
+            # Stay below SQLite's limit on query parameters
+            for start in range(0, len(file_ids), 500):
+                chunk = file_ids[start : start + 500]
+                rows = self.conn.execute(
+                    "SELECT file_id, data FROM statuses WHERE collection = ? "
+                    f"AND file_id IN ({', '.join('?' * len(chunk))})",
+                    (self.collection_name, *chunk),
+                )
+                statuses.update((file_id, json.loads(data)) for file_id, data in rows)
+        return statuses
+
+    def _update(self, file_id, change):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT data FROM statuses WHERE collection = ? AND file_id = ?",
+                    (self.collection_name, file_id),
+                ).fetchone()
+                data = change(json.loads(row[0]) if row else {})
+                if data is not None:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO statuses (collection, file_id, data) "
+                        "VALUES (?, ?, ?)",
+                        (self.collection_name, file_id, json.dumps(data, default=str)),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            return data
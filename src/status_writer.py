@@ -0,0 +1,141 @@
+import atexit
+import threading
+
+from google.cloud import firestore
+
+from log_config import get_logger
+
+logger = get_logger()
+
+# Firestore allows at most 500 writes in one batch commit
+MAX_BATCH_WRITES = 500
+
+# Seconds a deferred write waits for other writes to share its commit
+FLUSH_DELAY = 5.0
+
+
+class StatusWriter:
+    """Coalesces status document writes into WriteBatch commits.
+
+    Writes are merged into existing documents, so only the given fields are
+    sent. Several writes to the same document before a commit collapse into
+    one, and counters are sent as Increment transforms instead of being read
+    first.
+    """
+
+    def __init__(self, db, flush_delay=FLUSH_DELAY):
+        """Initialize the writer.
+
+        Args:
+            db: Firestore client
+            flush_delay: Seconds after which deferred writes are committed
+        """
+        self.db = db
+        self.flush_delay = flush_delay
+        self.pending = {}
+        self.lock = threading.Lock()
+        # Serializes commits so writes to a document are applied in order
+        self.commit_lock = threading.Lock()
+        self.timer = None
+
+        atexit.register(self._flush_quietly)
+
+    def write(self, doc_ref, fields, increments=None, defer=False):
+        """Queue a merge write of a status document.
+
+        Args:
+            doc_ref: Firestore document reference
+            fields: Fields to set on the document
+            increments: Maps numeric fields to the amount to add to them
+            defer: Leave the write queued to share a later commit; otherwise
+                the document is committed right away, leaving the writes of
+                other documents queued
+        """
+        with self.lock:
+            entry = self.pending.get(doc_ref.path)
+            if entry is None:
+                self.pending[doc_ref.path] = (
+                    doc_ref,
+                    dict(fields),
+                    dict(increments or {}),
+                )
+            else:
+                entry[1].update(fields)
+                for field, amount in (increments or {}).items():
+                    entry[2][field] = entry[2].get(field, 0) + amount
+            full = len(self.pending) >= MAX_BATCH_WRITES
+
+        if full:
+            self.flush()
+        elif not defer:
+            self.flush([doc_ref.path])
+        else:
+            self._schedule_flush()
+
+    def flush(self, paths=None):
+        """Commit queued writes.
+
+        Args:
+            paths: Only commit the writes of these document paths; all queued
+                writes by default
+
+        Returns:
+            int: Number of documents written
+        """
+        with self.commit_lock:
+            with self.lock:
+                if paths is None:
+                    pending = list(self.pending.values())
+                    self.pending = {}
+                else:
+                    pending = [
+                        self.pending.pop(path)
+                        for path in paths
+                        if path in self.pending
+                    ]
+                if not self.pending and self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+
+            for start in range(0, len(pending), MAX_BATCH_WRITES):
+                chunk = pending[start : start + MAX_BATCH_WRITES]
+                batch = self.db.batch()
+                for doc_ref, fields, increments in chunk:
+                    data = dict(fields)
+                    for field, amount in increments.items():
+                        data[field] = firestore.Increment(amount)
+                    batch.set(doc_ref, data, merge=True)
+
+                try:
+                    batch.commit()
+                except Exception:
+                    # Keep the uncommitted writes for the next flush
+                    self._requeue(pending[start:])
+                    raise
+
+            return len(pending)
+
+    def _requeue(self, entries):
+        with self.lock:
+            for doc_ref, fields, increments in entries:
+                newer = self.pending.get(doc_ref.path)
+                if newer is not None:
+                    fields = {**fields, **newer[1]}
+                    for field, amount in newer[2].items():
+                        increments[field] = increments.get(field, 0) + amount
+                self.pending[doc_ref.path] = (doc_ref, fields, increments)
+
+    def _schedule_flush(self):
+        with self.lock:
+            if self.timer is not None or not self.pending:
+                return
+            self.timer = threading.Timer(self.flush_delay, self._flush_quietly)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error committing status writes: {str(e)}")
+            self._schedule_flush()
@@ -4,8 +4,8 @@ import shutil
 import requests
 from synology_api.filestation import FileStation
 
-from firestore_service import FirestoreService
 from log_config import get_logger
+from status_store import create_status_store
 
 logger = get_logger()
 
@@ -14,7 +14,7 @@ class SynologyService:
     def __init__(
         self, fire_base_credentials_path=None, collection_name="processed_files"
     ):
-        self.firestore_service = FirestoreService(
+        self.firestore_service = create_status_store(
             collection_name=collection_name,
             credentials_path=fire_base_credentials_path,
         )
@@ -0,0 +1,209 @@
+import fcntl
+import json
+import os
+import stat
+import threading
+from datetime import datetime, timezone
+
+import google.auth.transport.requests
+
+from log_config import get_logger
+
+logger = get_logger()
+
+TOKEN_CACHE_PATH = os.path.expanduser("~/UCAutomation/.token_cache.json")
+
+# Cached tokens are only reused, and tracked tokens are refreshed, while at
+# least this many seconds of validity remain
+REFRESH_MARGIN = 5 * 60
+
+# How often the background refresher checks tracked credentials
+REFRESH_INTERVAL = 60
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """Return the process-wide TokenCache, or None if caching is not enabled.
+
+    The cache is opt-in: set TOKEN_CACHE=1 to enable it.
+    """
+    global _token_cache
+
+    if os.environ.get("TOKEN_CACHE") != "1":
+        return None
+
+    with _token_cache_lock:
+        if _token_cache is None:
+            _token_cache = TokenCache()
+        return _token_cache
+
+
+class TokenCache:
+    """Cache of service account access tokens shared across processes.
+
+    Tokens are stored in a JSON file readable only by the current user, keyed
+    by service account email and scopes, so every run on the machine can reuse
+    an unexpired token instead of minting a new one.
+    """
+
+    def __init__(self, path=TOKEN_CACHE_PATH, refresh_margin=REFRESH_MARGIN):
+        """Initialize the token cache.
+
+        Args:
+            path: JSON file the tokens are stored in
+            refresh_margin: Minimum remaining validity in seconds of a usable token
+        """
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self.tracked = []
+        self.lock = threading.Lock()
+        self.refresh_thread = None
+        self.stop_event = threading.Event()
+
+    @staticmethod
+    def _key(credentials):
+        scopes = " ".join(sorted(credentials.scopes or []))
+        return f"{credentials.service_account_email}|{scopes}"
+
+    def _read(self):
+        try:
+            file_stat = os.stat(self.path)
+        except FileNotFoundError:
+            return {}
+
+        if file_stat.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+            logger.warning(
+                f"Ignoring token cache {self.path}: it is accessible by other users"
+            )
+            return {}
+
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable token cache {self.path}: {str(e)}")
+            return {}
+
+        return entries if isinstance(entries, dict) else {}
+
+    def _remaining(self, expiry):
+        """Seconds until a naive UTC expiry datetime, as used by google-auth."""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds()
+
+    def apply(self, credentials):
+        """Load a cached token into credentials if it is still usable.
+
+        Returns:
+            bool: True if a cached token was applied
+        """
+        entry = self._read().get(self._key(credentials))
+        if not entry:
+            return False
+
+        expiry = datetime.fromtimestamp(entry["expiry"], timezone.utc).replace(
+            tzinfo=None
+        )
+        if self._remaining(expiry) <= self.refresh_margin:
+            return False
+
+        credentials.token = entry["token"]
+        credentials.expiry = expiry
+        return True
+
+    def store(self, credentials):
+        """Save the current token of credentials to the cache file."""
+        if not credentials.token or not credentials.expiry:
+            return
+
+        expiry = credentials.expiry.replace(tzinfo=timezone.utc).timestamp()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        # Serialize read-modify-write cycles between processes
+        lock_fd = os.open(f"{self.path}.lock", os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+
+            entries = self._read()
+            entries[self._key(credentials)] = {
+                "token": credentials.token,
+                "expiry": expiry,
+            }
+
+            temp_path = f"{self.path}.tmp"
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.chmod(temp_path, 0o600)
+            os.replace(temp_path, self.path)
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+    def ensure_fresh(self, credentials):
+        """Make sure credentials hold a token valid for at least refresh_margin.
+
+        Reuses the cached token when possible and otherwise refreshes it and
+        writes the new token back. The credentials are also tracked for the
+        background refresher.
+        """
+        with self.lock:
+            if not any(tracked is credentials for tracked in self.tracked):
+                self.tracked.append(credentials)
+
+        if (
+            credentials.token
+            and credentials.expiry
+            and self._remaining(credentials.expiry) > self.refresh_margin
+        ):
+            return
+
+        if self.apply(credentials):
+            logger.info(
+                f"Reusing cached access token for {credentials.service_account_email}"
+            )
+            return
+
+        try:
+            credentials.refresh(google.auth.transport.requests.Request())
+            self.store(credentials)
+            logger.info(
+                f"Refreshed access token for {credentials.service_account_email}"
+            )
+        except Exception as e:
+            logger.error(
+                f"Error refreshing access token for {credentials.service_account_email}: {str(e)}"
+            )
+
+    def start_background_refresh(self, interval=REFRESH_INTERVAL):
+        """Refresh tracked credentials ahead of expiry on a daemon thread.
+
+        Intended for long-running workers, so requests never block on a token
+        refresh.
+        """
+        if self.refresh_thread and self.refresh_thread.is_alive():
+            return self.refresh_thread
+
+        self.stop_event.clear()
+
+        def run():
+            while not self.stop_event.wait(interval):
+                with self.lock:
+                    tracked = list(self.tracked)
+                for credentials in tracked:
+                    self.ensure_fresh(credentials)
+
+        self.refresh_thread = threading.Thread(
+            target=run, name="token-refresh", daemon=True
+        )
+        self.refresh_thread.start()
+        return self.refresh_thread
+
+    def stop_background_refresh(self):
+        """Stop the background refresher started by start_background_refresh."""
+        self.stop_event.set()
+        if self.refresh_thread:
+            self.refresh_thread.join()
+            self.refresh_thread = None
@@ -12,8 +12,19 @@ from datetime import datetime, timedelta
 
 from dotenv import load_dotenv
 
-from google_drive_service import GoogleDriveService
+from firestore_service import UPLOADED_STATUSES, FirestoreService
+from google_drive_service import (
+    DownloadIntegrityError,
+    GoogleDriveService,
+    has_pending_upload,
+)
+from listing_cache import LISTING_CACHE_PATH, FolderListingCache
 from log_config import get_logger
+from status_compaction import (
+    COMPACT_AFTER_DAYS,
+    TOMBSTONE_TTL_DAYS,
+    compact_uploaded_statuses,
+)
 
 logger = get_logger()
 
@@ -96,6 +107,58 @@ def get_quota():
         return None
 
 
+def invalidate_listing_cache(folder_id=None, cache_path=LISTING_CACHE_PATH):
+    """Clear the on-disk Drive folder listing cache.
+
+    Args:
+        folder_id: Only drop this folder's listing. Clears everything if None.
+        cache_path: Path of the listing cache file
+
+    Returns:
+        int: Number of cached folder listings removed
+    """
+    cache = FolderListingCache(cache_path)
+    removed = cache.invalidate(folder_id)
+
+    if folder_id:
+        print(f"Removed {removed} cached listing for folder {folder_id}.")
+    else:
+        print(f"Removed {removed} cached folder listings.")
+
+    return removed
+
+
+def compact_statuses(
+    older_than_days=COMPACT_AFTER_DAYS,
+    tombstone_ttl_days=TOMBSTONE_TTL_DAYS,
+    dry_run=False,
+    collection_name="processed_files",
+):
+    """Compact old uploaded documents of the Firestore status collection.
+
+    See status_compaction.compact_uploaded_statuses.
+
+    Returns:
+        int: Number of documents compacted
+    """
+    load_dotenv()
+    firestore_service = FirestoreService(collection_name=collection_name)
+    compacted = compact_uploaded_statuses(
+        firestore_service.db,
+        firestore_service.collection,
+        older_than_days=older_than_days,
+        tombstone_ttl_days=tombstone_ttl_days,
+        dry_run=dry_run,
+    )
+
+    if dry_run:
+        print(f"{compacted} uploaded documents would be compacted.")
+    else:
+        print(f"Compacted {compacted} uploaded documents.")
+
+    return compacted
+
+
 def get_quota_threshold(quota_info, threshold=90.0):
     """
     Check if the storage quota usage exceeds a threshold and log appropriate messages.
@@ -164,33 +227,43 @@ def process_file(
         )
         return False
 
-    # Download the file
-    local_path = os.path.join(download_dir, file_name)
-    if not drive_service.download_file(file_id, local_path):
-        error_msg = f"Failed to download {file_name} (ID: {file_id})"
-        logger.error(error_msg)
-        drive_service.mark_file_as_failed(
-            file_id=file_id, machine_id=machine_id, error_message=error_msg
-        )
-        return False
+    dng_file_name = os.path.splitext(file_name)[0] + ".dng"
+    dng_file_path = os.path.join(output_dir, dng_file_name)
 
-    logger.info(f"Downloaded: {file_name} to {local_path}")
-
-    # Convert the file
     try:
-        converted = converter.convert(
-            local_path, output_dir, file_id, already_marked=True
-        )
-        if not converted:
-            error_msg = f"Failed to convert {file_name}"
-            logger.error(error_msg)
-            drive_service.mark_file_as_failed(
-                file_id=file_id, machine_id=machine_id, error_message=error_msg
+        # A DNG whose upload was interrupted is resumed as is; converting it
+        # again would invalidate the saved upload session
+        if has_pending_upload(dng_file_path):
+            logger.info(f"Resuming interrupted upload of {dng_file_name}")
+        else:
+            # Download the file
+            local_path = os.path.join(download_dir, file_name)
+            if not drive_service.download_file(
+                file_id,
+                local_path,
+                size=file.get("size"),
+                md5_checksum=file.get("md5Checksum"),
+            ):
+                error_msg = f"Failed to download {file_name} (ID: {file_id})"
+                logger.error(error_msg)
+                drive_service.mark_file_as_failed(
+                    file_id=file_id, machine_id=machine_id, error_message=error_msg
+                )
+                return False
+
+            logger.info(f"Downloaded: {file_name} to {local_path}")
+
+            # Convert the file
+            converted = converter.convert(
+                local_path, output_dir, file_id, already_marked=True
             )
-            return False
-
-        dng_file_name = os.path.splitext(file_name)[0] + ".dng"
-        dng_file_path = os.path.join(output_dir, dng_file_name)
+            if not converted:
+                error_msg = f"Failed to convert {file_name}"
+                logger.error(error_msg)
+                drive_service.mark_file_as_failed(
+                    file_id=file_id, machine_id=machine_id, error_message=error_msg
+                )
+                return False
 
         # Upload the converted file to Google Drive
         uploaded_id = drive_service.upload_file(dng_file_path, dng_folder_id)
@@ -213,6 +286,14 @@ def process_file(
         )
         return True
 
+    except DownloadIntegrityError as e:
+        error_msg = f"Corrupt download of {file_name}: {str(e)}"
+        logger.error(error_msg)
+        drive_service.mark_file_as_failed(
+            file_id=file_id, machine_id=machine_id, error_message=error_msg
+        )
+        return False
+
     except Exception as e:
         error_msg = f"Failed to process {file_name}: {str(e)}"
         logger.error(error_msg)
@@ -336,14 +417,16 @@ def move_to_archive(drive_service, file, archive_folder_id):
     file_name = file["name"]
 
     status = drive_service.get_file_status(file_id)
-    if not status or status.get("status") != "uploaded":
+    if not status or status.get("status") not in UPLOADED_STATUSES:
         logger.error(
             f"Did not move {file_name}({file_id}) to archive. Status is {status.get("status") if status else 'None'}"
         )
         return False
 
     try:
-        drive_service.move_file(file_id, archive_folder_id)
+        drive_service.move_file(
+            file_id, archive_folder_id, previous_parents=file.get("parents")
+        )
         return True
 
     except Exception as e:
@@ -351,3 +434,94 @@ def move_to_archive(drive_service, file, archive_folder_id):
             f"Error when trying to move {file_name}({file_id}) to archive: {str(e)}"
         )
         return False
+
+
+def move_files_to_archive(drive_service, files, archive_folder_id):
+    """
+    Move a batch of uploaded files from the ingest folder to the archive folder.
+
+    Callers must only pass files they have just marked as uploaded; unlike
+    move_to_archive, the Firestore status is not read again. Moves are sent
+    through Drive batch requests, and any file whose move failed is retried
+    on its own once.
+
+    Args:
+        drive_service: Instance of GoogleDriveService class
+        files (list): Uploaded files from Google Drive
+        archive_folder_id (str): The ID of the destination folder.
+
+    Returns:
+        dict: Maps each file ID to True if it was moved, False otherwise
+    """
+    if not files:
+        return {}
+
+    try:
+        results = drive_service.move_files_batch(files, archive_folder_id)
+    except Exception as e:
+        logger.error(f"Error when trying to batch move files to archive: {str(e)}")
+        results = {}
+
+    for file in files:
+        file_id = file["id"]
+        if results.get(file_id):
+            continue
+
+        logger.info(f"Retrying archive move of {file['name']}({file_id})")
+        try:
+            moved = drive_service.move_file(
+                file_id, archive_folder_id, previous_parents=file.get("parents")
+            )
+            results[file_id] = moved is not None
+        except Exception as e:
+            logger.error(
+                f"Error when trying to move {file['name']}({file_id}) to archive: {str(e)}"
+            )
+            results[file_id] = False
+
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="UCAutomation maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("quota", help="Show the Drive storage quota")
+
+    invalidate_parser = subparsers.add_parser(
+        "invalidate-listing-cache", help="Clear the Drive folder listing cache"
+    )
+    invalidate_parser.add_argument(
+        "folder_id", nargs="?", help="Only clear this folder's cached listing"
+    )
+
+    compact_parser = subparsers.add_parser(
+        "compact-statuses",
+        help="Archive old uploaded documents of the Firestore status collection",
+    )
+    compact_parser.add_argument(
+        "--older-than",
+        type=int,
+        default=COMPACT_AFTER_DAYS,
+        help="Compact documents uploaded at least this many days ago",
+    )
+    compact_parser.add_argument(
+        "--tombstone-ttl",
+        type=int,
+        default=TOMBSTONE_TTL_DAYS,
+        help="Days until Firestore's TTL policy deletes the compacted documents",
+    )
+    compact_parser.add_argument(
+        "--dry-run", action="store_true", help="Only count the documents"
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "quota":
+        get_quota()
+    elif args.command == "invalidate-listing-cache":
+        invalidate_listing_cache(args.folder_id)
+    elif args.command == "compact-statuses":
+        compact_statuses(args.older_than, args.tombstone_ttl, args.dry_run)
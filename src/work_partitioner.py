@@ -0,0 +1,225 @@
+import bisect
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+
+from log_config import get_logger
+
+logger = get_logger()
+
+WORKERS_COLLECTION = "workers"
+
+# How often a worker refreshes its heartbeat and its view of the other workers
+WORKER_HEARTBEAT_INTERVAL = 30
+
+# A worker whose heartbeat is older than this is dropped from the ring and
+# its files are reassigned
+WORKER_STALE_AFTER = 120
+
+# Points per worker on the hash ring; more points spread files more evenly
+VIRTUAL_NODES = 64
+
+# Files of another worker are only stolen once it has finished its listing
+# and still has more than this many of its own files left
+STEAL_MIN_BACKLOG = 2
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """Consistent hash ring assigning file IDs to workers.
+
+    Adding or removing a worker only moves the files of the ring segments it
+    takes or gives up; every other file keeps its worker.
+    """
+
+    def __init__(self, workers, virtual_nodes=VIRTUAL_NODES):
+        self.workers = sorted(set(workers))
+        self.points = sorted(
+            (_hash(f"{worker}#{i}"), worker)
+            for worker in self.workers
+            for i in range(virtual_nodes)
+        )
+        self.keys = [point for point, _ in self.points]
+
+    def owner(self, file_id):
+        """Return the worker a file is assigned to, or None without workers."""
+        if not self.points:
+            return None
+        index = bisect.bisect(self.keys, _hash(file_id)) % len(self.points)
+        return self.points[index][1]
+
+
+class WorkPartitioner:
+    """Splits the ingest listing between worker machines.
+
+    Each worker registers in the workers collection and refreshes a heartbeat
+    with the number of its own files still to process and whether its listing
+    has ended. Files are assigned by consistent hashing of the file ID over
+    the live workers, so machines no longer race for the same files. Workers
+    whose heartbeat went stale drop out of the ring and their files move to
+    the others. A worker that has finished its listing steals from workers
+    that have finished theirs but still have a backlog, starting at the end
+    of the listing. Claims in the status store remain the guard against two
+    machines processing a file.
+    """
+
+    def __init__(
+        self,
+        collection,
+        machine_id,
+        heartbeat_interval=WORKER_HEARTBEAT_INTERVAL,
+        stale_after=WORKER_STALE_AFTER,
+    ):
+        """Initialize the partitioner.
+
+        Args:
+            collection: Firestore collection reference of the worker registry
+            machine_id: Identifier of this worker
+            heartbeat_interval: Seconds between heartbeats
+            stale_after: Seconds without a heartbeat after which a worker is
+                considered gone
+        """
+        self.collection = collection
+        self.machine_id = machine_id
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+
+        self.lock = threading.Lock()
+        self.ring = HashRing([machine_id])
+        self.backlogs = {}
+        self.listed_workers = set()
+        # Own files handed out by assign that the caller has not completed
+        self.unfinished = set()
+        self.listing_done = False
+        self.heartbeat_thread = None
+        self.heartbeat_stop = threading.Event()
+
+    def start(self):
+        """Register this worker and keep its heartbeat fresh."""
+        self.heartbeat()
+        self.heartbeat_stop.clear()
+        self.heartbeat_thread = threading.Thread(
+            target=self._run, name="worker-heartbeat", daemon=True
+        )
+        self.heartbeat_thread.start()
+
+    def stop(self):
+        """Stop the heartbeat and deregister, handing the partition back."""
+        self.heartbeat_stop.set()
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join()
+            self.heartbeat_thread = None
+
+        try:
+            self.collection.document(self.machine_id).delete()
+        except Exception as e:
+            logger.warning(f"Could not deregister worker {self.machine_id}: {str(e)}")
+
+    def _run(self):
+        while not self.heartbeat_stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning(f"Worker heartbeat failed: {str(e)}")
+
+    def heartbeat(self):
+        """Publish this worker's heartbeat and reload the live workers."""
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            backlog = len(self.unfinished)
+            listing_done = self.listing_done
+        self.collection.document(self.machine_id).set(
+            {
+                "machine_id": self.machine_id,
+                "heartbeat_at": now,
+                "backlog": backlog,
+                "listing_done": listing_done,
+            }
+        )
+
+        cutoff = now - timedelta(seconds=self.stale_after)
+        backlogs = {}
+        listed_workers = set()
+        for doc in self.collection.stream():
+            data = doc.to_dict()
+            heartbeat_at = data.get("heartbeat_at")
+            if heartbeat_at is not None and heartbeat_at >= cutoff:
+                backlogs[doc.id] = data.get("backlog", 0)
+                if data.get("listing_done"):
+                    listed_workers.add(doc.id)
+        backlogs[self.machine_id] = backlog
+
+        with self.lock:
+            if set(backlogs) != set(self.ring.workers):
+                logger.info(f"Live workers: {', '.join(sorted(backlogs))}")
+                self.ring = HashRing(backlogs)
+            self.backlogs = backlogs
+            self.listed_workers = listed_workers
+
+    def owner(self, file_id):
+        """Return the worker a file is currently assigned to."""
+        with self.lock:
+            return self.ring.owner(file_id)
+
+    def complete(self, file_id):
+        """Record that a file handed out by assign was processed or dropped."""
+        with self.lock:
+            self.unfinished.discard(file_id)
+
+    def _steal(self, file_id):
+        with self.lock:
+            owner = self.ring.owner(file_id)
+            if owner == self.machine_id:
+                return True
+            # A worker still listing may reach the file itself at any moment
+            return (
+                owner in self.listed_workers
+                and self.backlogs.get(owner, 0) > STEAL_MIN_BACKLOG
+            )
+
+    def assign(self, files):
+        """Yield the files this worker should process.
+
+        Files assigned to this worker are yielded as the listing arrives, in
+        listing order; only the files of other workers are kept. Once the
+        listing ends, those are offered from its end: the ones reassigned to
+        this worker in the meantime, and those of workers that have finished
+        their listing with more than STEAL_MIN_BACKLOG files left.
+
+        The published backlog is the number of own files yielded that the
+        caller has not passed to complete yet.
+        """
+        with self.lock:
+            self.unfinished = set()
+            self.listing_done = False
+
+        own = 0
+        others = []
+        for file in files:
+            if self.owner(file["id"]) == self.machine_id:
+                own += 1
+                with self.lock:
+                    self.unfinished.add(file["id"])
+                yield file
+            else:
+                others.append(file)
+
+        with self.lock:
+            self.listing_done = True
+
+        logger.info(
+            f"{own} pending files assigned to {self.machine_id}, "
+            f"{len(others)} to other workers"
+        )
+
+        stolen = 0
+        for file in reversed(others):
+            if self._steal(file["id"]):
+                stolen += 1
+                yield file
+
+        if stolen:
+            logger.info(f"Took over {stolen} files from other workers")
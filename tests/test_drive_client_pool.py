@@ -0,0 +1,79 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from drive_client_pool import DriveClientPool
+
+
+def test_client_is_reused_after_return():
+    factory = MagicMock(side_effect=lambda: object())
+    pool = DriveClientPool(factory, size=2)
+
+    with pool.client() as first:
+        pass
+    with pool.client() as second:
+        pass
+
+    assert first is second
+    assert factory.call_count == 1
+    assert pool.created == 1
+
+
+def test_concurrent_checkouts_get_distinct_clients():
+    pool = DriveClientPool(lambda: object(), size=2)
+
+    with pool.client() as first, pool.client() as second:
+        assert first is not second
+        assert pool.in_use == 2
+
+    assert pool.in_use == 0
+
+
+def test_checkout_blocks_when_pool_is_exhausted():
+    pool = DriveClientPool(lambda: object(), size=1)
+    acquired = threading.Event()
+
+    def worker():
+        with pool.client():
+            acquired.set()
+
+    with pool.client():
+        thread = threading.Thread(target=worker)
+        thread.start()
+        assert not acquired.wait(0.1)
+
+    assert acquired.wait(1)
+    thread.join()
+
+
+def test_resize_unblocks_waiting_workers():
+    pool = DriveClientPool(lambda: object(), size=1)
+    acquired = threading.Event()
+
+    def worker():
+        with pool.client():
+            acquired.set()
+
+    with pool.client():
+        thread = threading.Thread(target=worker)
+        thread.start()
+        pool.resize(2)
+        assert acquired.wait(1)
+
+    thread.join()
+
+
+def test_factory_error_releases_slot():
+    pool = DriveClientPool(MagicMock(side_effect=Exception("build failed")), size=1)
+
+    with pytest.raises(Exception, match="build failed"):
+        with pool.client():
+            pass
+
+    assert pool.in_use == 0
+
+
+def test_invalid_size():
+    with pytest.raises(ValueError):
+        DriveClientPool(lambda: object(), size=0)
@@ -1,17 +1,26 @@
 import os
+import threading
+from datetime import datetime, timedelta, timezone
 from unittest.mock import MagicMock, patch
 
 import pytest
+from google.cloud import firestore
 
-from firestore_service import FirestoreService
+from firestore_service import FirestoreService, clear_firestore_clients
+from status_journal import StatusJournal
 
 
 @pytest.fixture
 def mock_firestore():
     """Setup mock Firestore client"""
+    clear_firestore_clients()
     with patch(
         "firestore_service.service_account.Credentials.from_service_account_file"
-    ) as mock_creds, patch("firestore_service.firestore.Client") as mock_client_cls:
+    ) as mock_creds, patch(
+        "firestore_service.firestore.Client"
+    ) as mock_client_cls, patch(
+        "firestore_service.firestore.transactional", side_effect=lambda func: func
+    ):
 
         # Setup mock document handling
         mock_doc = MagicMock()
@@ -27,10 +36,14 @@ def mock_firestore():
             "creds": mock_creds,
             "client_cls": mock_client_cls,
             "db": mock_db,
+            "transaction": mock_db.transaction.return_value,
+            "batch": mock_db.batch.return_value,
             "collection": mock_collection,
             "doc": mock_doc,
         }
 
+    clear_firestore_clients()
+
 
 def test_init_with_env_var(mock_firestore):
     """Test initializing FirestoreService with environment variable"""
@@ -54,6 +67,22 @@ def test_init_with_param(mock_firestore):
         mock_firestore["client_cls"].assert_called_once()
 
 
+def test_services_share_one_client_per_credentials_file(mock_firestore):
+    """Services built from the same key file reuse the client and collection"""
+    with patch("os.path.exists", return_value=True):
+        first = FirestoreService(credentials_path="/custom/path.json")
+        second = FirestoreService(credentials_path="/custom/path.json")
+        other = FirestoreService("other_files", credentials_path="/custom/path.json")
+
+    mock_firestore["creds"].assert_called_once_with("/custom/path.json")
+    mock_firestore["client_cls"].assert_called_once()
+    assert first.db is second.db is other.db
+    assert first.collection is second.collection
+    mock_firestore["db"].collection.assert_any_call("processed_files")
+    mock_firestore["db"].collection.assert_any_call("other_files")
+    assert mock_firestore["db"].collection.call_count == 2
+
+
 def test_init_missing_credentials():
     """Test error when credentials are missing"""
     with patch.dict(os.environ, {}, clear=True):
@@ -82,18 +111,29 @@ def test_mark_as_processing_new_file(mock_firestore):
     mock_snapshot.exists = False
     mock_firestore["doc"].get.return_value = mock_snapshot
 
-    with patch("os.uname") as mock_uname, patch("os.path.exists", return_value=True):
+    with patch("os.uname") as mock_uname, patch(
+        "os.path.exists", return_value=True
+    ), patch.object(FirestoreService, "_hold_lease") as mock_hold_lease:
         mock_uname.return_value.nodename = "test-machine"
 
         service = FirestoreService(credentials_path="/fake/path.json")
         result = service.mark_as_processing("file123")
 
         assert result is True
-        mock_firestore["doc"].set.assert_called_once()
-        args = mock_firestore["doc"].set.call_args[0][0]
+        mock_firestore["doc"].get.assert_called_once_with(
+            transaction=mock_firestore["transaction"]
+        )
+        mock_firestore["transaction"].set.assert_called_once()
+        doc_ref, args = mock_firestore["transaction"].set.call_args[0]
+        assert doc_ref == mock_firestore["doc"]
         assert args["status"] == "processing"
         assert args["machine_id"] == "test-machine"
+        assert args["retry_count"] == 0
         assert "updated_at" in args
+        assert datetime.fromisoformat(args["lease_until"]) > datetime.now(
+            timezone.utc
+        ) + timedelta(minutes=14)
+        mock_hold_lease.assert_called_once_with("file123", "test-machine", 15 * 60)
 
 
 def test_mark_as_processing_already_processing(mock_firestore):
@@ -105,6 +145,7 @@ def test_mark_as_processing_already_processing(mock_firestore):
         "status": "processing",
         "machine_id": "other-machine",
         "updated_at": "2023-01-01T12:00:00",
+        "lease_until": (datetime.now(timezone.utc) + timedelta(minutes=5)).isoformat(),
     }
     mock_firestore["doc"].get.return_value = mock_snapshot
 
@@ -113,9 +154,99 @@ def test_mark_as_processing_already_processing(mock_firestore):
         result = service.mark_as_processing("file123")
 
         assert result is False  # Should return False as already processing
+        mock_firestore["transaction"].set.assert_not_called()
         mock_firestore["doc"].set.assert_not_called()
 
 
+@pytest.mark.parametrize("status", ["uploaded", "archived", "processed"])
+def test_mark_as_processing_refuses_done_file(mock_firestore, status):
+    """Test a file that is already done is not claimed again"""
+    mock_snapshot = MagicMock()
+    mock_snapshot.exists = True
+    mock_snapshot.to_dict.return_value = {"status": status, "machine_id": "other"}
+    mock_firestore["doc"].get.return_value = mock_snapshot
+
+    with patch("os.path.exists", return_value=True):
+        service = FirestoreService(credentials_path="/fake/path.json")
+
+        assert service.mark_as_processing("file123") is False
+        mock_firestore["transaction"].set.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "previous",
+    [
+        {"lease_until": "2023-01-01T12:00:00+00:00"},
+        # Claims written before leases existed expire after updated_at
+        {"updated_at": "2023-01-01T12:00:00"},
+    ],
+)
+def test_mark_as_processing_takes_over_expired_lease(mock_firestore, previous):
+    """Test that a claim whose lease ran out can be taken over"""
+    mock_snapshot = MagicMock()
+    mock_snapshot.exists = True
+    mock_snapshot.to_dict.return_value = {
+        "status": "processing",
+        "machine_id": "crashed-machine",
+        "retry_count": 2,
+        **previous,
+    }
+    mock_firestore["doc"].get.return_value = mock_snapshot
+
+    with patch("os.path.exists", return_value=True), patch.object(
+        FirestoreService, "_hold_lease"
+    ):
+        service = FirestoreService(credentials_path="/fake/path.json")
+        result = service.mark_as_processing("file123", "test-machine")
+
+        assert result is True
+        args = mock_firestore["transaction"].set.call_args[0][1]
+        assert args["machine_id"] == "test-machine"
+        assert args["retry_count"] == 2
+
+
+def test_renew_lease(mock_firestore):
+    """Test extending a held lease and detecting a lost one"""
+    mock_snapshot = MagicMock()
+    mock_snapshot.exists = True
+    mock_snapshot.to_dict.return_value = {
+        "status": "processing",
+        "machine_id": "test-machine",
+    }
+    mock_firestore["doc"].get.return_value = mock_snapshot
+
+    with patch("os.path.exists", return_value=True):
+        service = FirestoreService(credentials_path="/fake/path.json")
+
+        assert service.renew_lease("file123", "test-machine") is True
+        doc_ref, update = mock_firestore["transaction"].update.call_args[0]
+        assert set(update) == {"lease_until"}
+
+        assert service.renew_lease("file123", "other-machine") is False
+        mock_firestore["transaction"].update.assert_called_once()
+
+
+def test_heartbeat_extends_and_releases_leases(mock_firestore):
+    """Test the heartbeat renews held leases until the file reaches a final state"""
+    with patch("os.path.exists", return_value=True), patch(
+        "firestore_service.HEARTBEAT_INTERVAL", 0.01
+    ):
+        service = FirestoreService(credentials_path="/fake/path.json")
+        renewed = threading.Event()
+
+        def renew_lease(file_id, machine_id, lease_seconds):
+            renewed.set()
+            return True
+
+        with patch.object(service, "renew_lease", side_effect=renew_lease):
+            service._hold_lease("file123", "test-machine", 60)
+            assert renewed.wait(5)
+
+            service.mark_as_uploaded("file123", "test-machine")
+            assert service.leases == {}
+            service.stop_heartbeat()
+
+
 def test_mark_as_processed(mock_firestore):
     """Test marking a file as processed"""
     with patch("os.uname") as mock_uname, patch("os.path.exists", return_value=True):
@@ -127,8 +258,10 @@ def test_mark_as_processed(mock_firestore):
         )
 
         assert result is True
-        mock_firestore["doc"].set.assert_called_once()
-        args = mock_firestore["doc"].set.call_args[0][0]
+        mock_firestore["batch"].set.assert_called_once()
+        doc_ref, args = mock_firestore["batch"].set.call_args[0]
+        assert mock_firestore["batch"].set.call_args[1] == {"merge": True}
+        mock_firestore["batch"].commit.assert_called_once()
         assert args["status"] == "processed"
         assert args["machine_id"] == "test-machine"
         assert args["filename"] == "test.mp4"
@@ -189,8 +322,10 @@ def test_mark_as_uploaded(mock_firestore):
         )
 
         assert result is True
-        mock_firestore["doc"].set.assert_called_once()
-        args = mock_firestore["doc"].set.call_args[0][0]
+        mock_firestore["batch"].set.assert_called_once()
+        doc_ref, args = mock_firestore["batch"].set.call_args[0]
+        assert mock_firestore["batch"].set.call_args[1] == {"merge": True}
+        mock_firestore["batch"].commit.assert_called_once()
         assert args["status"] == "uploaded"
         assert args["machine_id"] == "test-machine"
         assert args["filename"] == "test.nef"
@@ -198,12 +333,14 @@ def test_mark_as_uploaded(mock_firestore):
         assert "processed_at" in args
 
 
-def test_is_uploaded_true(mock_firestore):
+# Compacted documents keep an archived tombstone
+@pytest.mark.parametrize("status", ["uploaded", "archived"])
+def test_is_uploaded_true(mock_firestore, status):
     """Test checking if a file is processed (when it is)"""
     # Setup document snapshot behavior
     mock_snapshot = MagicMock()
     mock_snapshot.exists = True
-    mock_snapshot.to_dict.return_value = {"status": "uploaded"}
+    mock_snapshot.to_dict.return_value = {"status": status}
     mock_firestore["doc"].get.return_value = mock_snapshot
 
     with patch("os.path.exists", return_value=True):
@@ -260,6 +397,39 @@ def test_get_file_status_not_found(mock_firestore):
         assert result is None
 
 
+def test_get_file_statuses_in_chunks(mock_firestore):
+    """Test bulk status lookup fetches documents in chunks with get_all"""
+    mock_firestore["collection"].document.side_effect = lambda file_id: file_id
+
+    def get_all(doc_refs):
+        for file_id in doc_refs:
+            snapshot = MagicMock()
+            snapshot.id = file_id
+            snapshot.exists = file_id != "missing"
+            snapshot.to_dict.return_value = {"status": f"status-{file_id}"}
+            yield snapshot
+
+    mock_firestore["db"].get_all.side_effect = get_all
+
+    with patch("os.path.exists", return_value=True):
+        service = FirestoreService(credentials_path="/fake/path.json")
+        result = service.get_file_statuses(
+            ["a", "b", "missing", "a", "c"], chunk_size=2
+        )
+
+    assert result == {
+        "a": {"status": "status-a"},
+        "b": {"status": "status-b"},
+        "missing": None,
+        "c": {"status": "status-c"},
+    }
+    assert [call.args[0] for call in mock_firestore["db"].get_all.call_args_list] == [
+        ["a", "b"],
+        ["missing", "c"],
+    ]
+    mock_firestore["doc"].get.assert_not_called()
+
+
 def test_mark_as_failed_new_file(mock_firestore):
     """Test marking a new file as failed"""
     # Setup document snapshot behavior for a new file
@@ -274,29 +444,20 @@ def test_mark_as_failed_new_file(mock_firestore):
         result = service.mark_as_failed("file123", error_message="Conversion failed")
 
         assert result is True
-        mock_firestore["doc"].set.assert_called_once()
-        args = mock_firestore["doc"].set.call_args[0][0]
+        mock_firestore["batch"].set.assert_called_once()
+        doc_ref, args = mock_firestore["batch"].set.call_args[0]
+        assert mock_firestore["batch"].set.call_args[1] == {"merge": True}
+        mock_firestore["batch"].commit.assert_called_once()
         assert args["status"] == "failed"
         assert args["machine_id"] == "test-machine"
         assert args["error_message"] == "Conversion failed"
-        assert args["retry_count"] == 1
+        assert args["retry_count"] == firestore.Increment(1)
         assert "updated_at" in args
         assert "failed_at" in args
 
 
 def test_mark_as_failed_with_retry_increment(mock_firestore):
-    """Test marking a file as failed increments retry count"""
-    # Setup document snapshot behavior for a file with existing retry count
-    mock_snapshot = MagicMock()
-    mock_snapshot.exists = True
-    mock_snapshot.to_dict.return_value = {
-        "status": "failed",
-        "retry_count": 2,
-        "machine_id": "test-machine",
-        "updated_at": "2023-01-01T12:00:00",
-    }
-    mock_firestore["doc"].get.return_value = mock_snapshot
-
+    """Test marking a file as failed increments retry count without reading it"""
     with patch("os.uname") as mock_uname, patch("os.path.exists", return_value=True):
         mock_uname.return_value.nodename = "test-machine"
 
@@ -304,13 +465,132 @@ def test_mark_as_failed_with_retry_increment(mock_firestore):
         result = service.mark_as_failed("file123", error_message="Still failing")
 
         assert result is True
-        mock_firestore["doc"].set.assert_called_once()
-        args = mock_firestore["doc"].set.call_args[0][0]
+        mock_firestore["doc"].get.assert_not_called()
+        args = mock_firestore["batch"].set.call_args[0][1]
         assert args["status"] == "failed"
-        assert args["retry_count"] == 3  # Should increment from 2 to 3
+        assert args["retry_count"] == firestore.Increment(1)
         assert args["error_message"] == "Still failing"
 
 
+def test_transitions_go_through_the_journal(mock_firestore, tmp_path):
+    """Test transitions are journaled locally and pushed to Firestore on flush"""
+    journal = StatusJournal(path=str(tmp_path / "journal.db"), sync_interval=3600)
+    mock_firestore["collection"].id = "processed_files"
+
+    with patch("os.path.exists", return_value=True), patch(
+        "firestore_service.get_status_journal", return_value=journal
+    ):
+        service = FirestoreService(credentials_path="/fake/path.json")
+        service.mark_as_failed("file123", "test-machine", "Conversion failed")
+
+        mock_firestore["batch"].commit.assert_not_called()
+        assert service.get_file_status("file123")["retry_count"] == 1
+        mock_firestore["doc"].get.assert_not_called()
+
+        assert service.flush() == 1
+        args = mock_firestore["batch"].set.call_args[0][1]
+        assert args["status"] == "failed"
+        assert args["retry_count"] == firestore.Increment(1)
+        assert journal.pending_count() == 0
+
+    journal.stop()
+
+
+def test_deferred_writes_are_coalesced_into_one_batch(mock_firestore):
+    """Test deferred status writes share one batch commit"""
+    documents = {}
+
+    def document(file_id):
+        return documents.setdefault(
+            file_id, MagicMock(path=f"processed_files/{file_id}")
+        )
+
+    mock_firestore["collection"].document.side_effect = document
+
+    with patch("os.path.exists", return_value=True):
+        service = FirestoreService(credentials_path="/fake/path.json")
+        service.mark_as_failed("a", "machine", "first", defer=True)
+        service.mark_as_failed("a", "machine", "second", defer=True)
+        service.mark_as_uploaded("b", "machine", defer=True)
+
+        mock_firestore["batch"].commit.assert_not_called()
+        assert service.flush() == 2
+
+    mock_firestore["batch"].commit.assert_called_once()
+    writes = {
+        call.args[0].path: call.args[1]
+        for call in mock_firestore["batch"].set.call_args_list
+    }
+    assert writes["processed_files/a"]["error_message"] == "second"
+    assert writes["processed_files/a"]["retry_count"] == firestore.Increment(2)
+    assert writes["processed_files/b"]["status"] == "uploaded"
+
+
+def test_claim_commits_deferred_writes_first(mock_firestore):
+    """Test a claim sees the deferred status writes of its own file only"""
+    documents = {}
+
+    def document(file_id):
+        if file_id not in documents:
+            doc_ref = MagicMock(path=f"processed_files/{file_id}")
+            doc_ref.get.return_value.exists = False
+            documents[file_id] = doc_ref
+        return documents[file_id]
+
+    mock_firestore["collection"].document.side_effect = document
+
+    with patch("os.path.exists", return_value=True), patch.object(
+        FirestoreService, "_hold_lease"
+    ):
+        service = FirestoreService(credentials_path="/fake/path.json")
+        service.mark_as_uploaded("other", "machine", defer=True)
+        service.mark_as_failed("file123", "machine", defer=True)
+        service.mark_as_processing("file123", "machine")
+
+        mock_firestore["batch"].commit.assert_called_once()
+        doc_ref, _ = mock_firestore["batch"].set.call_args[0]
+        assert doc_ref.path == "processed_files/file123"
+        # The unrelated deferred write still waits for a shared batch
+        assert service.flush() == 1
+
+
+def test_sync_write_leaves_other_deferred_writes_queued(mock_firestore):
+    """Test a non-deferred write only commits its own document"""
+    documents = {}
+
+    def document(file_id):
+        return documents.setdefault(
+            file_id, MagicMock(path=f"processed_files/{file_id}")
+        )
+
+    mock_firestore["collection"].document.side_effect = document
+
+    with patch("os.path.exists", return_value=True):
+        service = FirestoreService(credentials_path="/fake/path.json")
+        service.mark_as_uploaded("a", "machine", defer=True)
+        service.mark_as_uploaded("b", "machine", defer=True)
+        service.mark_as_processed("c", "machine")
+
+        mock_firestore["batch"].commit.assert_called_once()
+        assert [
+            call.args[0].path for call in mock_firestore["batch"].set.call_args_list
+        ] == ["processed_files/c"]
+
+        assert service.flush() == 2
+
+
+def test_failed_commit_keeps_writes_queued(mock_firestore):
+    """Test writes of a failed commit are retried by the next flush"""
+    mock_firestore["batch"].commit.side_effect = [Exception("unavailable"), None]
+
+    with patch("os.path.exists", return_value=True):
+        service = FirestoreService(credentials_path="/fake/path.json")
+        with pytest.raises(Exception):
+            service.mark_as_uploaded("file123", "machine")
+
+        assert service.flush() == 1
+
+
 def test_mark_as_failed_custom_machine_id(mock_firestore):
     """Test marking a file as failed with custom machine ID"""
     mock_snapshot = MagicMock()
@@ -324,10 +604,42 @@ def test_mark_as_failed_custom_machine_id(mock_firestore):
         )
 
         assert result is True
-        mock_firestore["doc"].set.assert_called_once()
-        args = mock_firestore["doc"].set.call_args[0][0]
+        mock_firestore["batch"].set.assert_called_once()
+        doc_ref, args = mock_firestore["batch"].set.call_args[0]
+        assert mock_firestore["batch"].set.call_args[1] == {"merge": True}
+        mock_firestore["batch"].commit.assert_called_once()
         assert args["status"] == "failed"
         assert (
             args["machine_id"] == "custom-machine"
         )  # Should use the custom machine ID
         assert args["error_message"] == "Upload failed"
+
+
+def test_status_reads_use_mirror(mock_firestore):
+    """Test status queries are answered by the mirror while it is live"""
+    with patch("os.path.exists", return_value=True), patch(
+        "firestore_service.StatusMirror"
+    ) as mock_mirror_cls:
+        mirror = mock_mirror_cls.return_value
+        mirror.lookup.side_effect = lambda file_id: {
+            "a": (True, {"status": "uploaded"}),
+            "b": (True, None),
+        }.get(file_id, (False, None))
+
+        service = FirestoreService(credentials_path="/fake/path.json", mirror=True)
+
+        mirror.start.assert_called_once()
+        assert service.is_uploaded("a") is True
+        assert service.is_processed("a") is False
+        assert service.get_file_status("b") is None
+        mock_firestore["doc"].get.assert_not_called()
+
+        mock_snapshot = MagicMock()
+        mock_snapshot.exists = True
+        mock_snapshot.to_dict.return_value = {"status": "failed"}
+        mock_firestore["doc"].get.return_value = mock_snapshot
+        assert service.get_file_status("c") == {"status": "failed"}
+
+        service.mark_as_processed("c", "machine")
+        mirror.put.assert_called_once()
+        assert mirror.put.call_args.args[0] == "c"
@@ -1,16 +1,38 @@
+import hashlib
+import json
 import os
-from unittest.mock import MagicMock, mock_open, patch
+from datetime import datetime
+from unittest.mock import MagicMock, patch
 
+import httplib2
 import pytest
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 
-from google_drive_service import GoogleDriveService
+import google_drive_service as google_drive_service_module
+from google_drive_service import (
+    FILE_FIELDS,
+    FOLDER_MIME_TYPE,
+    DownloadIntegrityError,
+    GoogleDriveService,
+    build_drive_client,
+    build_list_query,
+)
+from listing_cache import FolderListingCache
+from rate_limiter import DriveRateLimiter
+
+
+@pytest.fixture(autouse=True)
+def unthrottled_rate_limiter():
+    """Give each test its own rate limiter that never waits."""
+    limiter = DriveRateLimiter(rate=1e9, base_delay=0)
+    with patch("google_drive_service.get_rate_limiter", return_value=limiter):
+        yield limiter
 
 
 @pytest.fixture
 def mock_firestore_service():
-    with patch("google_drive_service.FirestoreService") as mock_firestore_cls:
+    with patch("google_drive_service.create_status_store") as mock_firestore_cls:
         mock_firestore = MagicMock()
         mock_firestore_cls.return_value = mock_firestore
         yield mock_firestore
@@ -33,10 +55,12 @@ def test_list_files():
     with patch(
         "google_drive_service.service_account.Credentials.from_service_account_file",
         return_value=mock_credentials,
-    ), patch("google_drive_service.build", return_value=mock_service), patch(
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
         "os.path.exists", return_value=True
     ), patch(
-        "google_drive_service.FirestoreService"
+        "google_drive_service.create_status_store"
     ):
 
         google_drive_service = GoogleDriveService(
@@ -66,9 +90,127 @@ def test_list_files():
 
         assert files == expected_files
         mock_service.files.return_value.list.assert_any_call(
-            q=f"'{folder_id}' in parents", fields="files(id, name, mimeType)"
+            q=f"('{folder_id}' in parents) and trashed = false",
+            fields=f"nextPageToken, files({FILE_FIELDS})",
+            pageSize=1000,
+            pageToken=None,
+        )
+
+
+def test_iter_files_follows_next_page_token():
+    folder_id = "test_folder_id"
+    mock_credentials = MagicMock()
+    mock_service = MagicMock()
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file",
+        return_value=mock_credentials,
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "os.path.exists", return_value=True
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+
+        google_drive_service = GoogleDriveService(
+            folder_id, credentials_path="mock/path.json"
         )
 
+        mock_service.files.return_value.list.return_value.execute.side_effect = [
+            {
+                "files": [
+                    {"id": "1", "name": "a.cr3", "mimeType": "image/x-canon-cr3"}
+                ],
+                "nextPageToken": "page_2",
+            },
+            {"files": [{"id": "2", "name": "b.cr3", "mimeType": "image/x-canon-cr3"}]},
+        ]
+
+        files = google_drive_service.iter_files()
+
+        # The first record is available before the second page is requested
+        assert next(files)["id"] == "1"
+        assert mock_service.files.return_value.list.call_count == 1
+
+        assert [file["id"] for file in files] == ["2"]
+        mock_service.files.return_value.list.assert_called_with(
+            q=f"('{folder_id}' in parents) and trashed = false",
+            fields=f"nextPageToken, files({FILE_FIELDS})",
+            pageSize=1000,
+            pageToken="page_2",
+        )
+
+
+def test_iter_files_breadth_first_batches_parent_ids():
+    folder_id = "root"
+    mock_credentials = MagicMock()
+    mock_service = MagicMock()
+
+    listings = {
+        "('root' in parents) and trashed = false": [
+            {"id": "a", "name": "a", "mimeType": FOLDER_MIME_TYPE, "parents": ["root"]},
+            {"id": "b", "name": "b", "mimeType": FOLDER_MIME_TYPE, "parents": ["root"]},
+        ],
+        "('a' in parents or 'b' in parents) and trashed = false": [
+            {
+                "id": "1",
+                "name": "1.cr3",
+                "mimeType": "image/x-canon-cr3",
+                "parents": ["a"],
+            },
+            {"id": "c", "name": "c", "mimeType": FOLDER_MIME_TYPE, "parents": ["b"]},
+        ],
+        "('c' in parents) and trashed = false": [
+            {
+                "id": "2",
+                "name": "2.arw",
+                "mimeType": "image/x-sony-arw",
+                "parents": ["c"],
+            },
+        ],
+    }
+
+    def list_side_effect(q, **kwargs):
+        request = MagicMock()
+        request.execute.return_value = {"files": listings[q]}
+        return request
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file",
+        return_value=mock_credentials,
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "os.path.exists", return_value=True
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+
+        google_drive_service = GoogleDriveService(
+            folder_id, credentials_path="mock/path.json"
+        )
+        mock_service.files.return_value.list.side_effect = list_side_effect
+
+        files = list(google_drive_service.iter_files_breadth_first(max_workers=2))
+
+        assert [file["id"] for file in files] == ["a", "b", "1", "c", "2"]
+        assert mock_service.files.return_value.list.call_count == 3
+
+
+def test_build_list_query_filters_server_side():
+    query = build_list_query(
+        ["a", "b"], raw_only=True, modified_after=datetime(2025, 1, 1)
+    )
+
+    assert query.startswith("('a' in parents or 'b' in parents) and trashed = false")
+    # Folders are kept regardless of the file predicates so traversal can descend
+    assert f"(mimeType = '{FOLDER_MIME_TYPE}' or (" in query
+    assert "mimeType != 'image/jpeg'" in query
+    # Raw files Drive does not type as images must not be filtered out
+    assert "mimeType contains" not in query
+    assert "modifiedTime > '2025-01-01T00:00:00+00:00'" in query
+
 
 def test_list_files_error():
     folder_id = "test_folder_id"
@@ -78,10 +220,12 @@ def test_list_files_error():
     with patch(
         "google_drive_service.service_account.Credentials.from_service_account_file",
         return_value=mock_credentials,
-    ), patch("google_drive_service.build", return_value=mock_service), patch(
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
         "os.path.exists", return_value=True
     ), patch(
-        "google_drive_service.FirestoreService"
+        "google_drive_service.create_status_store"
     ):
 
         google_drive_service = GoogleDriveService(
@@ -99,41 +243,42 @@ def test_list_files_error():
         assert files == []
 
 
-def test_download_file():
+def test_download_file(tmp_path):
     folder_id = "test_folder_id"
     mock_credentials = MagicMock()
     mock_service = MagicMock()
 
     file_id = "test_file_id"
-    destination = "downloads/test_file.txt"
+    destination = str(tmp_path / "downloads" / "test_file.txt")
 
     with patch(
         "google_drive_service.service_account.Credentials.from_service_account_file",
         return_value=mock_credentials,
-    ), patch("google_drive_service.build", return_value=mock_service), patch(
-        "builtins.open", mock_open()
-    ) as mock_file, patch(
-        "os.makedirs"
-    ) as mock_makedirs, patch(
-        "os.path.exists", return_value=True
-    ) as mock_exists, patch(
-        "google_drive_service.FirestoreService"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
     ):
 
-        google_drive_service = GoogleDriveService(
-            folder_id, credentials_path="mock/path.json"
-        )
+        google_drive_service = GoogleDriveService(folder_id, credentials_path=__file__)
 
         mock_request = MagicMock()
         mock_service.files.return_value.get_media.return_value = mock_request
-        mock_downloader = MagicMock()
-        mock_downloader.next_chunk.side_effect = [
-            (None, False),
-            (None, True),
-        ]
+
+        def downloader_factory(f, request):
+            chunks = iter([(b"hello ", False), (b"world", True)])
+            mock_downloader = MagicMock()
+
+            def next_chunk():
+                data, done = next(chunks)
+                f.write(data)
+                return None, done
+
+            mock_downloader.next_chunk.side_effect = next_chunk
+            return mock_downloader
 
         with patch(
-            "google_drive_service.MediaIoBaseDownload", return_value=mock_downloader
+            "google_drive_service.MediaIoBaseDownload", side_effect=downloader_factory
         ):
             success = google_drive_service.download_file(file_id, destination)
 
@@ -142,27 +287,30 @@ def test_download_file():
             fileId=file_id
         )
 
+    with open(destination, "rb") as f:
+        assert f.read() == b"hello world"
+    # The .part file and its sidecar are gone once the file is in place
+    assert os.listdir(tmp_path / "downloads") == ["test_file.txt"]
 
-def test_download_file_failure():
+
+def test_download_file_failure(tmp_path):
     folder_id = "test_folder_id"
     mock_credentials = MagicMock()
     mock_service = MagicMock()
 
     file_id = "invalid_file_id"
-    destination = "downloads/invalid_file.txt"
+    destination = str(tmp_path / "downloads" / "invalid_file.txt")
 
     with patch(
         "google_drive_service.service_account.Credentials.from_service_account_file",
         return_value=mock_credentials,
-    ), patch("google_drive_service.build", return_value=mock_service), patch(
-        "os.path.exists", return_value=True
     ), patch(
-        "google_drive_service.FirestoreService"
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
     ):
 
-        google_drive_service = GoogleDriveService(
-            folder_id, credentials_path="mock/path.json"
-        )
+        google_drive_service = GoogleDriveService(folder_id, credentials_path=__file__)
 
         mock_service.files.return_value.get_media.side_effect = Exception(
             "File not found"
@@ -171,80 +319,282 @@ def test_download_file_failure():
         success = google_drive_service.download_file(file_id, destination)
 
         assert success is False
+        assert not os.path.exists(destination)
 
 
-def test_upload_file():
-    folder_id = "test_folder_id"
-    mock_credentials = MagicMock()
+def test_download_file_resumes_partial_part_file(tmp_path):
+    content = b"0123456789" * 10
+    destination = str(tmp_path / "resume.cr3")
     mock_service = MagicMock()
 
-    file_path = "test_file.txt"
-    file_id = "uploaded_file_id"
+    # A previous run wrote the first 40 bytes before being interrupted
+    with open(f"{destination}.part", "wb") as f:
+        f.write(content[:40])
+    with open(f"{destination}.part.json", "w") as f:
+        json.dump(
+            {
+                "file_id": "file_id",
+                "size": len(content),
+                "md5Checksum": hashlib.md5(content).hexdigest(),
+                "completed_ranges": [],
+            },
+            f,
+        )
+
+    requested_ranges = []
+
+    def get_media(fileId):
+        request = MagicMock()
+        request.headers = {}
+
+        def execute():
+            start, end = request.headers["Range"][len("bytes=") :].split("-")
+            requested_ranges.append((int(start), int(end)))
+            return content[int(start) : int(end) + 1]
+
+        request.execute.side_effect = execute
+        return request
 
     with patch(
-        "google_drive_service.service_account.Credentials.from_service_account_file",
-        return_value=mock_credentials,
-    ), patch("google_drive_service.build", return_value=mock_service), patch(
-        "google_drive_service.MediaFileUpload"
-    ) as mock_media_file_upload, patch(
-        "os.path.exists", return_value=True
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
     ), patch(
-        "google_drive_service.FirestoreService"
+        "google_drive_service.create_status_store"
     ):
-
-        google_drive_service = GoogleDriveService(
-            folder_id, credentials_path="mock/path.json"
+        google_drive_service = GoogleDriveService("ingest", credentials_path=__file__)
+        mock_service.files.return_value.get_media.side_effect = get_media
+
+        success = google_drive_service.download_file(
+            "file_id",
+            destination,
+            size=len(content),
+            md5_checksum=hashlib.md5(content).hexdigest(),
         )
 
+    assert success is True
+    assert requested_ranges == [(40, 99)]
+    with open(destination, "rb") as f:
+        assert f.read() == content
+    assert not os.path.exists(f"{destination}.part")
+    assert not os.path.exists(f"{destination}.part.json")
+
+
+def make_service(mock_service):
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+        service = GoogleDriveService("test_folder_id", credentials_path=__file__)
+        assert service.service is mock_service
+        return service
+
+
+def test_upload_file(tmp_path):
+    folder_id = "test_folder_id"
+    mock_service = MagicMock()
+    file_path = tmp_path / "test_file.dng"
+    file_path.write_bytes(b"x" * 10)
+    file_id = "uploaded_file_id"
+
+    google_drive_service = make_service(mock_service)
+
+    with patch("google_drive_service.MediaFileUpload") as mock_media_file_upload:
         mock_media = MagicMock()
         mock_media_file_upload.return_value = mock_media
+        request = mock_service.files.return_value.create.return_value
+        request.resumable_uri = None
+        request.resumable_progress = 0
+        request.next_chunk.return_value = (None, {"id": file_id})
 
-        mock_service.files.return_value.create.return_value.execute.return_value = {
-            "id": file_id
-        }
+        uploaded_file_id = google_drive_service.upload_file(
+            str(file_path), folder_id, chunk_size=256 * 1024
+        )
 
-        uploaded_file_id = google_drive_service.upload_file(file_path, folder_id)
+    assert uploaded_file_id == file_id
+    mock_media_file_upload.assert_called_once_with(
+        str(file_path), chunksize=256 * 1024, resumable=True
+    )
+    mock_service.files.return_value.create.assert_called_once_with(
+        body={"name": file_path.name, "parents": [folder_id]},
+        media_body=mock_media,
+        fields="id",
+    )
+    assert not os.path.exists(f"{file_path}.upload.json")
 
-        assert uploaded_file_id == file_id
-        mock_service.files.return_value.create.assert_called_once_with(
-            body={"name": os.path.basename(file_path), "parents": [folder_id]},
-            media_body=mock_media,
-            fields="id",
+
+def test_upload_file_failure(tmp_path):
+    mock_service = MagicMock()
+    file_path = tmp_path / "test_file.dng"
+    file_path.write_bytes(b"x" * 10)
+
+    google_drive_service = make_service(mock_service)
+
+    with patch("google_drive_service.MediaFileUpload"):
+        request = mock_service.files.return_value.create.return_value
+        request.next_chunk.side_effect = Exception("Upload error")
+
+        uploaded_file_id = google_drive_service.upload_file(
+            str(file_path), "test_folder_id"
         )
 
+    assert uploaded_file_id is None
 
-def test_upload_file_failure():
-    folder_id = "test_folder_id"
-    mock_credentials = MagicMock()
+
+def test_upload_file_rejects_unaligned_chunk_size(tmp_path):
+    google_drive_service = make_service(MagicMock())
+
+    with pytest.raises(ValueError):
+        google_drive_service.upload_file(__file__, "folder", chunk_size=1000)
+
+
+def test_upload_file_persists_session_and_resumes(tmp_path):
+    mock_service = MagicMock()
+    file_path = tmp_path / "large.dng"
+    file_path.write_bytes(b"x" * 1000)
+    sidecar_path = f"{file_path}.upload.json"
+
+    google_drive_service = make_service(mock_service)
+    request = mock_service.files.return_value.create.return_value
+    request.resumable_uri = None
+    request.resumable_progress = 0
+
+    def next_chunk():
+        if request.resumable_uri:
+            raise Exception("Connection reset")
+        request.resumable_uri = "https://upload/session-1"
+        request.resumable_progress = 400
+        return MagicMock(), None
+
+    request.next_chunk.side_effect = next_chunk
+
+    with patch("google_drive_service.MediaFileUpload"):
+        assert google_drive_service.upload_file(str(file_path), "folder") is None
+
+    with open(sidecar_path) as f:
+        sidecar = json.load(f)
+    assert sidecar["resumable_uri"] == "https://upload/session-1"
+    assert sidecar["resumable_progress"] == 400
+
+    # A later attempt picks the session up instead of starting over
+    request = MagicMock()
+    mock_service.files.return_value.create.return_value = request
+    request.http.request.return_value = (
+        httplib2.Response({"status": 308, "range": "bytes=0-523"}),
+        b"",
+    )
+    request.next_chunk.return_value = (None, {"id": "uploaded"})
+
+    with patch("google_drive_service.MediaFileUpload"):
+        assert google_drive_service.upload_file(str(file_path), "folder") == "uploaded"
+
+    request.http.request.assert_called_once_with(
+        "https://upload/session-1",
+        method="PUT",
+        headers={"Content-Length": "0", "Content-Range": "bytes */1000"},
+    )
+    assert request.resumable_uri == "https://upload/session-1"
+    assert request.resumable_progress == 524
+    assert not os.path.exists(sidecar_path)
+
+
+def test_upload_file_finishes_session_completed_before_failure(tmp_path):
     mock_service = MagicMock()
+    file_path = tmp_path / "large.dng"
+    file_path.write_bytes(b"x" * 1000)
+    sidecar_path = f"{file_path}.upload.json"
+    with open(sidecar_path, "w") as f:
+        json.dump(
+            {
+                "folder_id": "folder",
+                "size": 1000,
+                "mtime": os.stat(file_path).st_mtime,
+                "resumable_uri": "https://upload/done",
+                "resumable_progress": 768,
+            },
+            f,
+        )
 
-    file_path = "test_file.txt"
+    google_drive_service = make_service(mock_service)
+    request = mock_service.files.return_value.create.return_value
+    request.http.request.return_value = (
+        httplib2.Response({"status": 200}),
+        b'{"id": "uploaded"}',
+    )
 
-    with patch(
-        "google_drive_service.service_account.Credentials.from_service_account_file",
-        return_value=mock_credentials,
-    ), patch("google_drive_service.build", return_value=mock_service), patch(
-        "google_drive_service.MediaFileUpload"
-    ) as mock_media_file_upload, patch(
-        "os.path.exists", return_value=True
-    ), patch(
-        "google_drive_service.FirestoreService"
-    ):
+    with patch("google_drive_service.MediaFileUpload"):
+        assert google_drive_service.upload_file(str(file_path), "folder") == "uploaded"
 
-        google_drive_service = GoogleDriveService(
-            folder_id, credentials_path="mock/path.json"
+    request.next_chunk.assert_not_called()
+    assert not os.path.exists(sidecar_path)
+
+
+def test_upload_file_ignores_session_for_changed_file(tmp_path):
+    mock_service = MagicMock()
+    file_path = tmp_path / "large.dng"
+    file_path.write_bytes(b"x" * 1000)
+    sidecar_path = f"{file_path}.upload.json"
+    with open(sidecar_path, "w") as f:
+        json.dump(
+            {
+                "folder_id": "folder",
+                "size": 999,
+                "mtime": os.stat(file_path).st_mtime,
+                "resumable_uri": "https://upload/stale",
+                "resumable_progress": 256,
+            },
+            f,
         )
 
-        mock_media = MagicMock()
-        mock_media_file_upload.return_value = mock_media
+    google_drive_service = make_service(mock_service)
+    request = mock_service.files.return_value.create.return_value
+    request.resumable_uri = None
+    request.resumable_progress = 0
+    request.next_chunk.return_value = (None, {"id": "uploaded"})
+
+    with patch("google_drive_service.MediaFileUpload"):
+        assert google_drive_service.upload_file(str(file_path), "folder") == "uploaded"
 
-        mock_service.files.return_value.create.return_value.execute.side_effect = (
-            Exception("Upload error")
+    assert request.resumable_uri is None
+    assert not os.path.exists(sidecar_path)
+
+
+def test_upload_file_drops_expired_session(tmp_path):
+    mock_service = MagicMock()
+    file_path = tmp_path / "large.dng"
+    file_path.write_bytes(b"x" * 1000)
+    sidecar_path = f"{file_path}.upload.json"
+    with open(sidecar_path, "w") as f:
+        json.dump(
+            {
+                "folder_id": "folder",
+                "size": 1000,
+                "mtime": os.stat(file_path).st_mtime,
+                "resumable_uri": "https://upload/expired",
+                "resumable_progress": 256,
+            },
+            f,
         )
 
-        uploaded_file_id = google_drive_service.upload_file(file_path, folder_id)
+    google_drive_service = make_service(mock_service)
+    request = mock_service.files.return_value.create.return_value
+    request.resumable_uri = None
+    request.resumable_progress = 0
+    request.http.request.return_value = (
+        httplib2.Response({"status": 404}),
+        b"Session not found",
+    )
+    request.next_chunk.return_value = (None, {"id": "uploaded"})
 
-        assert uploaded_file_id is None
+    # The expired session is dropped and the upload starts over
+    with patch("google_drive_service.MediaFileUpload"):
+        assert google_drive_service.upload_file(str(file_path), "folder") == "uploaded"
+
+    assert request.resumable_uri is None
+    assert not os.path.exists(sidecar_path)
 
 
 def test_upload_nonexistent_file():
@@ -262,10 +612,10 @@ def test_upload_nonexistent_file():
     with patch(
         "google_drive_service.service_account.Credentials.from_service_account_file",
         return_value=mock_credentials,
-    ), patch("google_drive_service.build"), patch(
+    ), patch("google_drive_service.build_drive_client"), patch(
         "os.path.exists", side_effect=path_exists_side_effect
     ), patch(
-        "google_drive_service.FirestoreService"
+        "google_drive_service.create_status_store"
     ), patch(
         "google_drive_service.load_dotenv"
     ):
@@ -285,7 +635,9 @@ def test_file_status_methods(mock_firestore_service):
 
     with patch(
         "google_drive_service.service_account.Credentials.from_service_account_file"
-    ), patch("google_drive_service.build"), patch("os.path.exists", return_value=True):
+    ), patch("google_drive_service.build_drive_client"), patch(
+        "os.path.exists", return_value=True
+    ):
 
         google_drive_service = GoogleDriveService(
             folder_id, credentials_path="mock/path.json"
@@ -313,7 +665,7 @@ def test_file_status_methods(mock_firestore_service):
         )
         assert result is True
         mock_firestore_service.mark_as_processed.assert_called_with(
-            file_id, "test-machine", data
+            file_id, "test-machine", data, defer=False
         )
 
         # Test mark_file_as_failed
@@ -323,7 +675,7 @@ def test_file_status_methods(mock_firestore_service):
         )
         assert result is True
         mock_firestore_service.mark_as_failed.assert_called_with(
-            file_id, "test-machine", "Conversion error"
+            file_id, "test-machine", "Conversion error", defer=False
         )
 
         # Test get_file_status
@@ -343,10 +695,12 @@ def test_move_file():
     with patch(
         "google_drive_service.service_account.Credentials.from_service_account_file",
         return_value=mock_credentials,
-    ), patch("google_drive_service.build", return_value=mock_service), patch(
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
         "os.path.exists", return_value=True
     ), patch(
-        "google_drive_service.FirestoreService"
+        "google_drive_service.create_status_store"
     ):
         google_drive_service = GoogleDriveService(
             folder_id, credentials_path="mock/path.json"
@@ -381,6 +735,44 @@ def test_move_file():
         assert result == [destination_folder_id]
 
 
+def test_move_file_with_known_parents_skips_get():
+    folder_id = "test_folder_id"
+    destination_folder_id = "destination_folder_id"
+    file_id = "test_file_id"
+    mock_service = MagicMock()
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "os.path.exists", return_value=True
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+        google_drive_service = GoogleDriveService(
+            folder_id, credentials_path="mock/path.json"
+        )
+
+        mock_service.files.return_value.update.return_value.execute.return_value = {
+            "id": file_id,
+            "parents": [destination_folder_id],
+        }
+
+        result = google_drive_service.move_file(
+            file_id, destination_folder_id, previous_parents=["parent_a", "parent_b"]
+        )
+
+        mock_service.files.return_value.get.assert_not_called()
+        mock_service.files.return_value.update.assert_called_once_with(
+            fileId=file_id,
+            addParents=destination_folder_id,
+            removeParents="parent_a,parent_b",
+            fields="id, parents",
+        )
+        assert result == [destination_folder_id]
+
+
 def test_move_file_error():
     folder_id = "test_folder_id"
     destination_folder_id = "destination_folder_id"
@@ -391,10 +783,12 @@ def test_move_file_error():
     with patch(
         "google_drive_service.service_account.Credentials.from_service_account_file",
         return_value=mock_credentials,
-    ), patch("google_drive_service.build", return_value=mock_service), patch(
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
         "os.path.exists", return_value=True
     ), patch(
-        "google_drive_service.FirestoreService"
+        "google_drive_service.create_status_store"
     ):
         google_drive_service = GoogleDriveService(
             folder_id, credentials_path="mock/path.json"
@@ -430,10 +824,12 @@ def test_move_file_to_current_parent():
     with patch(
         "google_drive_service.service_account.Credentials.from_service_account_file",
         return_value=mock_credentials,
-    ), patch("google_drive_service.build", return_value=mock_service), patch(
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
         "os.path.exists", return_value=True
     ), patch(
-        "google_drive_service.FirestoreService"
+        "google_drive_service.create_status_store"
     ):
         google_drive_service = GoogleDriveService(
             folder_id, credentials_path="mock/path.json"
@@ -482,10 +878,12 @@ def test_move_file_nonexistent_destination():
     with patch(
         "google_drive_service.service_account.Credentials.from_service_account_file",
         return_value=mock_credentials,
-    ), patch("google_drive_service.build", return_value=mock_service), patch(
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
         "os.path.exists", return_value=True
     ), patch(
-        "google_drive_service.FirestoreService"
+        "google_drive_service.create_status_store"
     ):
         google_drive_service = GoogleDriveService(
             folder_id, credentials_path="mock/path.json"
@@ -521,3 +919,582 @@ def test_move_file_nonexistent_destination():
 
         # Function should return None on error
         assert result is None
+
+
+def test_iter_changed_files_full_listing_then_changes(tmp_path):
+    folder_id = "ingest"
+    state_path = str(tmp_path / "changes.json")
+    mock_service = MagicMock()
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+        google_drive_service = GoogleDriveService(folder_id, credentials_path=__file__)
+
+        # First run: no token stored, so list everything and store a token
+        mock_service.changes.return_value.getStartPageToken.return_value.execute.return_value = {
+            "startPageToken": "token_1"
+        }
+        mock_service.files.return_value.list.return_value.execute.side_effect = [
+            {"files": [{"id": "sub", "name": "sub", "mimeType": FOLDER_MIME_TYPE}]},
+            {"files": [{"id": "1", "name": "a.cr3", "mimeType": "image/x-canon-cr3"}]},
+        ]
+
+        files = list(google_drive_service.iter_changed_files(state_path=state_path))
+        assert [file["id"] for file in files] == ["sub", "1"]
+        assert not os.path.exists(state_path)
+        assert google_drive_service.commit_changes_state()
+
+        # Second run: only changes below the ingest folder are returned
+        mock_service.changes.return_value.list.return_value.execute.return_value = {
+            "newStartPageToken": "token_2",
+            "changes": [
+                {
+                    "fileId": "2",
+                    "file": {
+                        "id": "2",
+                        "name": "b.cr3",
+                        "mimeType": "image/x-canon-cr3",
+                        "parents": ["sub"],
+                    },
+                },
+                {
+                    "fileId": "3",
+                    "file": {
+                        "id": "3",
+                        "name": "c.cr3",
+                        "mimeType": "image/x-canon-cr3",
+                        "parents": ["elsewhere"],
+                    },
+                },
+                {"fileId": "4", "removed": True},
+            ],
+        }
+        mock_service.files.return_value.get.return_value.execute.return_value = {
+            "id": "elsewhere",
+            "parents": ["root"],
+        }
+
+        files = list(google_drive_service.iter_changed_files(state_path=state_path))
+        assert [file["id"] for file in files] == ["2"]
+        google_drive_service.commit_changes_state()
+        mock_service.changes.return_value.list.assert_called_once()
+        assert (
+            mock_service.changes.return_value.list.call_args.kwargs["pageToken"]
+            == "token_1"
+        )
+
+        with open(state_path) as f:
+            assert json.load(f)["page_token"] == "token_2"
+
+
+def test_iter_changed_files_does_not_relist_after_partial_changes(tmp_path):
+    state_path = str(tmp_path / "changes.json")
+    with open(state_path, "w") as f:
+        json.dump(
+            {
+                "folder_id": "ingest",
+                "page_token": "token_1",
+                "folder_ids": ["ingest"],
+                "last_full_scan": datetime.now().timestamp(),
+            },
+            f,
+        )
+    mock_service = MagicMock()
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+        google_drive_service = GoogleDriveService("ingest", credentials_path=__file__)
+
+        # The second page of changes fails after the first was yielded
+        mock_service.changes.return_value.list.return_value.execute.side_effect = [
+            {
+                "nextPageToken": "token_2",
+                "changes": [
+                    {
+                        "fileId": "1",
+                        "file": {
+                            "id": "1",
+                            "name": "a.cr3",
+                            "mimeType": "image/x-canon-cr3",
+                            "parents": ["ingest"],
+                        },
+                    }
+                ],
+            },
+            HttpError(httplib2.Response({"status": 400}), b"bad token"),
+        ]
+
+        files = list(google_drive_service.iter_changed_files(state_path=state_path))
+
+        assert [file["id"] for file in files] == ["1"]
+        mock_service.files.return_value.list.assert_not_called()
+        assert not google_drive_service.commit_changes_state()
+        with open(state_path) as f:
+            assert json.load(f)["page_token"] == "token_1"
+
+
+def test_iter_changed_files_does_not_store_token_after_partial_listing(tmp_path):
+    state_path = str(tmp_path / "changes.json")
+    mock_service = MagicMock()
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+        google_drive_service = GoogleDriveService("ingest", credentials_path=__file__)
+
+        mock_service.changes.return_value.getStartPageToken.return_value.execute.return_value = {
+            "startPageToken": "token_1"
+        }
+        # Listing the subfolder fails after the ingest folder was listed
+        mock_service.files.return_value.list.return_value.execute.side_effect = [
+            {"files": [{"id": "sub", "name": "sub", "mimeType": FOLDER_MIME_TYPE}]},
+            Exception("backend error"),
+        ]
+
+        files = list(google_drive_service.iter_changed_files(state_path=state_path))
+
+        assert [file["id"] for file in files] == ["sub"]
+        assert not google_drive_service.commit_changes_state()
+        assert not os.path.exists(state_path)
+
+
+def test_iter_files_uses_listing_cache(tmp_path):
+    folder_id = "ingest"
+    mock_service = MagicMock()
+    cache = FolderListingCache(str(tmp_path / "cache.json"))
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+        google_drive_service = GoogleDriveService(folder_id, credentials_path=__file__)
+
+        mock_service.files.return_value.get.return_value.execute.return_value = {
+            "modifiedTime": "2025-01-01T00:00:00.000Z"
+        }
+        mock_service.files.return_value.list.return_value.execute.side_effect = [
+            {
+                "files": [
+                    {
+                        "id": "sub",
+                        "name": "sub",
+                        "mimeType": FOLDER_MIME_TYPE,
+                        "modifiedTime": "2025-01-01T00:00:00.000Z",
+                    }
+                ]
+            },
+            {"files": [{"id": "1", "name": "a.cr3", "mimeType": "image/x-canon-cr3"}]},
+            # Second walk: current subfolder times for the cached root listing
+            {"files": [{"id": "sub", "modifiedTime": "2025-01-01T00:00:00.000Z"}]},
+        ]
+
+        first = list(google_drive_service.iter_files(cache=cache))
+        second = list(google_drive_service.iter_files(cache=cache))
+
+        assert first == second
+        # The second walk is served from the cache
+        assert mock_service.files.return_value.list.call_count == 3
+        assert cache.stats() == {"hits": 2, "misses": 2, "entries": 2}
+
+
+def test_iter_files_relists_changed_subfolder_below_cached_parent(tmp_path):
+    folder_id = "ingest"
+    mock_service = MagicMock()
+    cache = FolderListingCache(str(tmp_path / "cache.json"))
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+        google_drive_service = GoogleDriveService(folder_id, credentials_path=__file__)
+
+        # The ingest folder itself never changes
+        mock_service.files.return_value.get.return_value.execute.return_value = {
+            "modifiedTime": "2025-01-01T00:00:00.000Z"
+        }
+        shoot = {
+            "id": "shoot1",
+            "name": "shoot1",
+            "mimeType": FOLDER_MIME_TYPE,
+            "modifiedTime": "2025-01-01T00:00:00.000Z",
+        }
+        a = {"id": "1", "name": "a.cr3", "mimeType": "image/x-canon-cr3"}
+        b = {"id": "2", "name": "b.cr3", "mimeType": "image/x-canon-cr3"}
+        mock_service.files.return_value.list.return_value.execute.side_effect = [
+            {"files": [shoot]},
+            {"files": [a]},
+            # b.cr3 lands in shoot1, moving only shoot1's modifiedTime
+            {"files": [{"id": "shoot1", "modifiedTime": "2025-01-02T00:00:00.000Z"}]},
+            {"files": [a, b]},
+        ]
+
+        list(google_drive_service.iter_files(cache=cache))
+        second = list(google_drive_service.iter_files(cache=cache))
+
+        assert [file["id"] for file in second] == ["shoot1", "1", "2"]
+        assert cache.stats() == {"hits": 1, "misses": 3, "entries": 2}
+
+
+def test_move_files_batch_reports_per_file_results():
+    mock_service = MagicMock()
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "os.path.exists", return_value=True
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+        google_drive_service = GoogleDriveService(
+            "ingest", credentials_path="mock/path.json"
+        )
+
+        batches = []
+
+        def new_batch(callback):
+            batch = MagicMock()
+            added = []
+            batch.add.side_effect = lambda request, request_id: added.append(request_id)
+
+            def execute():
+                for request_id in added:
+                    if request_id == "bad":
+                        callback(request_id, None, Exception("403"))
+                    else:
+                        callback(request_id, {"parents": ["archive"]}, None)
+
+            batch.execute.side_effect = execute
+            batches.append(added)
+            return batch
+
+        mock_service.new_batch_http_request.side_effect = new_batch
+
+        files = [
+            {"id": "a", "name": "a.cr3", "parents": ["ingest"]},
+            {"id": "bad", "name": "bad.cr3", "parents": ["ingest"]},
+            {"id": "c", "name": "c.cr3", "parents": ["ingest"]},
+        ]
+        results = google_drive_service.move_files_batch(files, "archive", batch_size=2)
+
+        assert results == {"a": True, "bad": False, "c": True}
+        assert batches == [["a", "bad"], ["c"]]
+        mock_service.files.return_value.get.assert_not_called()
+        mock_service.files.return_value.update.assert_any_call(
+            fileId="a",
+            addParents="archive",
+            removeParents="ingest",
+            fields="id, parents",
+        )
+
+
+def test_download_file_parallel_ranges(tmp_path):
+    content = bytes(range(256)) * 40  # 10240 bytes
+    destination = str(tmp_path / "raw" / "large.cr3")
+    mock_service = MagicMock()
+    requested_ranges = []
+
+    def get_media(fileId):
+        request = MagicMock()
+        request.headers = {}
+
+        def execute():
+            start, end = request.headers["Range"][len("bytes=") :].split("-")
+            requested_ranges.append((int(start), int(end)))
+            return content[int(start) : int(end) + 1]
+
+        request.execute.side_effect = execute
+        return request
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+        google_drive_service = GoogleDriveService("ingest", credentials_path=__file__)
+        mock_service.files.return_value.get_media.side_effect = get_media
+
+        success = google_drive_service.download_file(
+            "file_id",
+            destination,
+            size=str(len(content)),
+            part_size=4096,
+            max_workers=3,
+            parallel_threshold=8192,
+        )
+
+    assert success is True
+    with open(destination, "rb") as f:
+        assert f.read() == content
+    assert sorted(requested_ranges) == [(0, 4095), (4096, 8191), (8192, 10239)]
+
+
+def test_download_file_parallel_skips_completed_ranges(tmp_path):
+    content = bytes(range(256)) * 40  # 10240 bytes
+    destination = str(tmp_path / "large.cr3")
+    mock_service = MagicMock()
+
+    # The first range was completed by an earlier, interrupted attempt
+    with open(f"{destination}.part", "wb") as f:
+        f.write(content[:4096])
+        f.truncate(len(content))
+    with open(f"{destination}.part.json", "w") as f:
+        json.dump(
+            {
+                "file_id": "file_id",
+                "size": len(content),
+                "md5Checksum": None,
+                "part_size": 4096,
+                "completed_ranges": [0],
+            },
+            f,
+        )
+
+    requested_ranges = []
+
+    def get_media(fileId):
+        request = MagicMock()
+        request.headers = {}
+
+        def execute():
+            start, end = request.headers["Range"][len("bytes=") :].split("-")
+            requested_ranges.append((int(start), int(end)))
+            return content[int(start) : int(end) + 1]
+
+        request.execute.side_effect = execute
+        return request
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
+    ):
+        google_drive_service = GoogleDriveService("ingest", credentials_path=__file__)
+        mock_service.files.return_value.get_media.side_effect = get_media
+
+        success = google_drive_service.download_file(
+            "file_id",
+            destination,
+            size=len(content),
+            part_size=4096,
+            max_workers=2,
+            parallel_threshold=8192,
+        )
+
+    assert success is True
+    assert sorted(requested_ranges) == [(4096, 8191), (8192, 10239)]
+    with open(destination, "rb") as f:
+        assert f.read() == content
+
+
+def test_download_file_retries_after_md5_mismatch(tmp_path):
+    content = b"raw image data"
+    destination = str(tmp_path / "image.cr3")
+    mock_service = MagicMock()
+    responses = iter([b"raw image dat\x00", content])
+
+    def downloader_factory(f, request):
+        mock_downloader = MagicMock()
+
+        def next_chunk():
+            f.write(next(responses))
+            return None, True
+
+        mock_downloader.next_chunk.side_effect = next_chunk
+        return mock_downloader
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
+    ), patch(
+        "google_drive_service.MediaIoBaseDownload", side_effect=downloader_factory
+    ) as mock_downloader_cls:
+        google_drive_service = GoogleDriveService("ingest", credentials_path=__file__)
+
+        success = google_drive_service.download_file(
+            "file_id",
+            destination,
+            size=len(content),
+            md5_checksum=hashlib.md5(content).hexdigest(),
+        )
+
+    assert success is True
+    assert mock_downloader_cls.call_count == 2
+    with open(destination, "rb") as f:
+        assert f.read() == content
+
+
+def test_download_file_fails_on_persistent_size_mismatch(tmp_path):
+    destination = str(tmp_path / "image.cr3")
+    mock_service = MagicMock()
+
+    def downloader_factory(f, request):
+        mock_downloader = MagicMock()
+
+        def next_chunk():
+            f.write(b"truncated")
+            return None, True
+
+        mock_downloader.next_chunk.side_effect = next_chunk
+        return mock_downloader
+
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch(
+        "google_drive_service.build_drive_client", return_value=mock_service
+    ), patch(
+        "google_drive_service.create_status_store"
+    ), patch(
+        "google_drive_service.MediaIoBaseDownload", side_effect=downloader_factory
+    ):
+        google_drive_service = GoogleDriveService("ingest", credentials_path=__file__)
+
+        with pytest.raises(DownloadIntegrityError) as excinfo:
+            google_drive_service.download_file(
+                "file_id", destination, size=1000, integrity_retries=0
+            )
+
+    assert excinfo.value.field == "size"
+    # Neither the bad file nor its partial download is left behind
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_integrity_error_message():
+    error = DownloadIntegrityError("file_id", "size", 1000, 9)
+
+    assert error.file_id == "file_id"
+    assert str(error) == (
+        "Integrity check failed for file_id: expected size 1000, got 9"
+    )
+
+
+def test_drive_client_is_built_lazily():
+    with patch(
+        "google_drive_service.service_account.Credentials.from_service_account_file"
+    ), patch("google_drive_service.build_drive_client") as mock_build, patch(
+        "google_drive_service.create_status_store"
+    ), patch(
+        "google_drive_service.load_dotenv"
+    ) as mock_load_dotenv:
+        google_drive_service = GoogleDriveService("ingest", credentials_path=__file__)
+
+        # An explicit credentials path needs neither .env nor a Drive client yet
+        mock_load_dotenv.assert_not_called()
+        mock_build.assert_not_called()
+
+        assert google_drive_service.service is google_drive_service.service
+        mock_build.assert_called_once()
+
+
+def test_build_drive_client_parses_discovery_document_once():
+    with patch(
+        "google_drive_service.discovery_cache.get_static_doc",
+        wraps=google_drive_service_module.discovery_cache.get_static_doc,
+    ) as mock_get_static_doc, patch("google_drive_service._discovery_document", None):
+        first = build_drive_client(http=MagicMock())
+        second = build_drive_client(http=MagicMock())
+
+    assert first is not second
+    assert hasattr(first, "files")
+    mock_get_static_doc.assert_called_once_with("drive", "v3")
+
+
+def test_move_files_batch_retries_throttled_calls():
+    mock_service = MagicMock()
+    google_drive_service = make_service(mock_service)
+
+    batches = []
+    throttled = HttpError(
+        MagicMock(status=403),
+        json.dumps(
+            {"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}
+        ).encode(),
+    )
+
+    def new_batch(callback):
+        batch = MagicMock()
+        added = []
+        batch.add.side_effect = lambda request, request_id: added.append(request_id)
+
+        def execute():
+            for request_id in added:
+                if request_id == "b" and len(batches) == 1:
+                    callback(request_id, None, throttled)
+                else:
+                    callback(request_id, {"parents": ["archive"]}, None)
+
+        batch.execute.side_effect = execute
+        batches.append(added)
+        return batch
+
+    mock_service.new_batch_http_request.side_effect = new_batch
+    files = [
+        {"id": "a", "name": "a.cr3", "parents": ["ingest"]},
+        {"id": "b", "name": "b.cr3", "parents": ["ingest"]},
+    ]
+
+    with patch("google_drive_service.time.sleep") as mock_sleep:
+        results = google_drive_service.move_files_batch(files, "archive")
+
+    assert results == {"a": True, "b": True}
+    assert batches == [["a", "b"], ["b"]]
+    mock_sleep.assert_called_once()
+
+
+def test_drive_calls_retry_rate_limit_errors():
+    mock_service = MagicMock()
+    google_drive_service = make_service(mock_service)
+
+    mock_service.about.return_value.get.return_value.execute.side_effect = [
+        HttpError(MagicMock(status=429), b"Too many requests"),
+        HttpError(MagicMock(status=503), b"Backend error"),
+        {"storageQuota": {"limit": "100", "usage": "25"}},
+    ]
+
+    with patch("rate_limiter.time.sleep") as mock_sleep:
+        quota = google_drive_service.get_storage_quota()
+
+    assert quota["usage_percentage"] == 25
+    assert mock_sleep.call_count == 2
+
+
+def test_enable_status_cache_shares_one_cache():
+    google_drive_service = make_service(MagicMock())
+    mock_firestore_service = MagicMock()
+    google_drive_service.firestore_service = mock_firestore_service
+    mock_firestore_service.get_file_status.return_value = {"status": "uploaded"}
+
+    status_cache = google_drive_service.enable_status_cache()
+
+    assert google_drive_service.enable_status_cache() is status_cache
+    assert google_drive_service.is_file_uploaded("file") is True
+    assert google_drive_service.get_file_status("file") == {"status": "uploaded"}
+    mock_firestore_service.get_file_status.assert_called_once_with("file")
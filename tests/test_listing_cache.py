@@ -0,0 +1,79 @@
+import json
+from unittest.mock import patch
+
+from listing_cache import FolderListingCache
+
+QUERY = "('folder' in parents) and trashed = false"
+CHILDREN = [{"id": "1", "name": "a.cr3", "mimeType": "image/x-canon-cr3"}]
+
+
+def test_get_hit_when_modified_time_matches(tmp_path):
+    cache = FolderListingCache(str(tmp_path / "cache.json"))
+    cache.put("folder", "2025-01-01T00:00:00.000Z", QUERY, CHILDREN)
+
+    assert cache.get("folder", "2025-01-01T00:00:00.000Z", QUERY) == CHILDREN
+    assert cache.stats() == {"hits": 1, "misses": 0, "entries": 1}
+
+
+def test_get_miss_when_modified_time_moved(tmp_path):
+    cache = FolderListingCache(str(tmp_path / "cache.json"))
+    cache.put("folder", "2025-01-01T00:00:00.000Z", QUERY, CHILDREN)
+
+    assert cache.get("folder", "2025-01-02T00:00:00.000Z", QUERY) is None
+    assert cache.get("folder", "2025-01-01T00:00:00.000Z", "other query") is None
+    assert cache.get("other_folder", "2025-01-01T00:00:00.000Z", QUERY) is None
+    assert cache.stats()["misses"] == 3
+
+
+def test_get_miss_when_entry_expired(tmp_path):
+    cache = FolderListingCache(str(tmp_path / "cache.json"), max_age=60)
+
+    with patch("listing_cache.time.time", return_value=1000):
+        cache.put("folder", "2025-01-01T00:00:00.000Z", QUERY, CHILDREN)
+
+    with patch("listing_cache.time.time", return_value=1061):
+        assert cache.get("folder", "2025-01-01T00:00:00.000Z", QUERY) is None
+
+
+def test_remove_files_drops_moved_records(tmp_path):
+    cache = FolderListingCache(str(tmp_path / "cache.json"))
+    moved = {"id": "2", "name": "b.cr3", "mimeType": "image/x-canon-cr3"}
+    children = CHILDREN + [moved]
+    cache.put("folder", "2025-01-01T00:00:00.000Z", QUERY, children)
+
+    assert cache.remove_files("folder", ["2", "3"]) == 1
+    assert cache.remove_files("other_folder", ["1"]) == 0
+    assert cache.get("folder", "2025-01-01T00:00:00.000Z", QUERY) == CHILDREN
+
+
+def test_save_and_reload(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = FolderListingCache(path)
+    cache.put("folder", "2025-01-01T00:00:00.000Z", QUERY, CHILDREN)
+    cache.save()
+
+    reloaded = FolderListingCache(path)
+    assert reloaded.get("folder", "2025-01-01T00:00:00.000Z", QUERY) == CHILDREN
+
+
+def test_invalidate(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = FolderListingCache(path)
+    cache.put("a", "2025-01-01T00:00:00.000Z", QUERY, CHILDREN)
+    cache.put("b", "2025-01-01T00:00:00.000Z", QUERY, CHILDREN)
+
+    assert cache.invalidate("a") == 1
+    assert cache.invalidate("missing") == 0
+    assert cache.invalidate() == 1
+
+    with open(path) as f:
+        assert json.load(f) == {}
+
+
+def test_corrupt_cache_file_is_ignored(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text("not json")
+
+    cache = FolderListingCache(str(path))
+
+    assert cache.stats()["entries"] == 0
@@ -4,12 +4,37 @@ from unittest.mock import MagicMock, patch
 
 # Patch sys.modules so we can import main.py even if dependencies are missing
 sys.modules["google_drive_service"] = MagicMock()
+sys.modules["listing_cache"] = MagicMock()
 sys.modules["log_config"] = MagicMock()
 sys.modules["raw_converter"] = MagicMock()
 sys.modules["synology_service"] = MagicMock()
 sys.modules["utils"] = MagicMock()
 
 import main as main_mod
+import work_partitioner
+from test_work_partitioner import FakeWorkers
+from work_partitioner import WorkPartitioner
+
+
+def convert_inline(converter):
+    """Make a mocked converter's convert_many call convert for each job in turn."""
+
+    def convert_many(jobs):
+        for job in jobs:
+            try:
+                converted = converter.convert(
+                    job["file_path"],
+                    job["output_dir"],
+                    job["file_id"],
+                    already_marked=job["already_marked"],
+                )
+            except Exception as e:
+                yield job, False, e
+            else:
+                yield job, converted, None
+
+    converter.convert_many.side_effect = convert_many
+    return converter
 
 
 class TestStatusCases(unittest.TestCase):
@@ -39,7 +64,7 @@ class TestStatusCases(unittest.TestCase):
         self.env_patch.stop()
         self.uname_patch.stop()
 
-    def run_main_with_status(self, status_value):
+    def run_main_with_status(self, status_value, claimed=True):
         # Patch all external dependencies
         with patch("main.load_dotenv"), patch("main.get_logger"), patch(
             "main.clean_download_directories", return_value=(0, 0)
@@ -48,21 +73,24 @@ class TestStatusCases(unittest.TestCase):
         ) as mock_drive_service_cls, patch(
             "main.RawFileConverter"
         ) as mock_converter_cls, patch(
-            "main.move_to_archive"
+            "main.move_files_to_archive"
         ) as mock_move_to_archive:
 
             # Setup mocks
             mock_synology.return_value.get_api_info.return_value = {}
             mock_synology.return_value.upload.return_value = True
             mock_drive_service = MagicMock()
-            mock_drive_service.list_files.return_value = [
+            mock_drive_service.iter_files.return_value = [
                 {"id": "file1", "name": "test1.cr3"},
                 {"id": "file2", "name": "test2.arw"},
             ]
-            # get_file_status returns the test value for each file
-            mock_drive_service.get_file_status.return_value = status_value
+            # get_file_statuses returns the test value for each file
+            mock_drive_service.get_file_statuses.side_effect = lambda ids: {
+                file_id: status_value for file_id in ids
+            }
+            mock_drive_service.mark_file_as_processing.return_value = claimed
             mock_drive_service_cls.return_value = mock_drive_service
-            mock_converter_cls.return_value = MagicMock()
+            mock_converter_cls.return_value = convert_inline(MagicMock())
 
             # Run main
             main_mod.main()
@@ -74,7 +102,12 @@ class TestStatusCases(unittest.TestCase):
         )
         # Should skip processing, so mark_file_as_processing should not be called
         self.assertFalse(mock_drive_service.mark_file_as_processing.called)
-        self.assertFalse(mock_move_to_archive.called)
+        # Uploaded files still in the ingest folder are archived
+        mock_move_to_archive.assert_called_once()
+        self.assertEqual(
+            [file["id"] for file in mock_move_to_archive.call_args.args[1]],
+            ["file1", "file2"],
+        )
 
     def test_status_processed(self):
         mock_drive_service, mock_move_to_archive = self.run_main_with_status(
@@ -90,6 +123,18 @@ class TestStatusCases(unittest.TestCase):
         self.assertFalse(mock_drive_service.mark_file_as_processing.called)
         self.assertFalse(mock_move_to_archive.called)
 
+    def test_status_processing_lease_expired(self):
+        mock_drive_service, mock_move_to_archive = self.run_main_with_status(
+            {"status": "processing", "lease_until": "2000-01-01T00:00:00+00:00"}
+        )
+        # A claim whose lease ran out is taken over
+        self.assertTrue(mock_drive_service.mark_file_as_processing.called)
+
+    def test_claim_lost_to_another_machine(self):
+        mock_drive_service, _ = self.run_main_with_status(None, claimed=False)
+        # Nothing is downloaded for a file another machine claimed first
+        self.assertFalse(mock_drive_service.download_file.called)
+
     def test_status_failed(self):
         mock_drive_service, mock_move_to_archive = self.run_main_with_status(
             {"status": "failed"}
@@ -132,7 +177,7 @@ class TestDownloadCases(unittest.TestCase):
         self.env_patch.stop()
         self.uname_patch.stop()
 
-    def run_main_with_download_result(self, download_success=True):
+    def run_main_with_download_result(self, download_success=True, download_error=None):
         with patch("main.load_dotenv"), patch("main.get_logger"), patch(
             "main.clean_download_directories", return_value=(0, 0)
         ), patch("main.SynologyService") as mock_synology, patch(
@@ -140,7 +185,7 @@ class TestDownloadCases(unittest.TestCase):
         ) as mock_drive_service_cls, patch(
             "main.RawFileConverter"
         ) as mock_converter_cls, patch(
-            "main.move_to_archive"
+            "main.move_files_to_archive"
         ) as mock_move_to_archive, patch(
             "os.path.exists"
         ) as mock_exists:
@@ -148,14 +193,17 @@ class TestDownloadCases(unittest.TestCase):
             mock_synology.return_value.get_api_info.return_value = {}
             mock_synology.return_value.upload.return_value = True
             mock_drive_service = MagicMock()
-            mock_drive_service.list_files.return_value = [
+            mock_drive_service.iter_files.return_value = [
                 {"id": "file1", "name": "test1.cr3"},
             ]
-            # get_file_status returns None so file is processed
-            mock_drive_service.get_file_status.return_value = None
+            # get_file_statuses returns None so file is processed
+            mock_drive_service.get_file_statuses.side_effect = lambda ids: {
+                file_id: None for file_id in ids
+            }
             mock_drive_service.download_file.return_value = download_success
+            mock_drive_service.download_file.side_effect = download_error
             mock_drive_service_cls.return_value = mock_drive_service
-            mock_converter_cls.return_value = MagicMock()
+            mock_converter_cls.return_value = convert_inline(MagicMock())
 
             def exists_side_effect(path):
                 if path.endswith(".dng"):
@@ -173,6 +221,21 @@ class TestDownloadCases(unittest.TestCase):
         self.assertTrue(mock_drive_service.mark_file_as_failed.called)
         self.assertTrue(mock_drive_service.download_file.called)
 
+    def test_corrupt_download_is_marked_failed(self):
+        class IntegrityError(Exception):
+            pass
+
+        with patch("main.DownloadIntegrityError", IntegrityError):
+            mock_drive_service = self.run_main_with_download_result(
+                download_error=IntegrityError("md5Checksum mismatch")
+            )
+
+        kwargs = mock_drive_service.mark_file_as_failed.call_args.kwargs
+        self.assertEqual(kwargs["file_id"], "file1")
+        self.assertIn("Corrupt download", kwargs["error_message"])
+        # The run carries on and still commits its status writes
+        mock_drive_service.flush_status_writes.assert_called_once()
+
     def test_download_file_success(self):
         mock_drive_service = self.run_main_with_download_result(download_success=True)
         # Should not call mark_file_as_failed if download succeeds
@@ -207,7 +270,9 @@ class TestConversionCases(unittest.TestCase):
         self.env_patch.stop()
         self.uname_patch.stop()
 
-    def run_main_with_conversion_result(self, convert_success=True):
+    def run_main_with_conversion_result(
+        self, convert_success=True, convert_error=None, upload_error=None
+    ):
         with patch("main.load_dotenv"), patch("main.get_logger"), patch(
             "main.clean_download_directories", return_value=(0, 0)
         ), patch("main.SynologyService") as mock_synology, patch(
@@ -215,23 +280,27 @@ class TestConversionCases(unittest.TestCase):
         ) as mock_drive_service_cls, patch(
             "main.RawFileConverter"
         ) as mock_converter_cls, patch(
-            "main.move_to_archive"
+            "main.move_files_to_archive"
         ) as mock_move_to_archive, patch(
             "os.path.exists"
         ) as mock_exists:
 
             mock_synology.return_value.get_api_info.return_value = {}
             mock_synology.return_value.upload.return_value = True
+            mock_synology.return_value.upload.side_effect = upload_error
             mock_drive_service = MagicMock()
-            mock_drive_service.list_files.return_value = [
+            mock_drive_service.iter_files.return_value = [
                 {"id": "file1", "name": "test1.cr3"},
             ]
-            mock_drive_service.get_file_status.return_value = {"status": "failed"}
+            mock_drive_service.get_file_statuses.side_effect = lambda ids: {
+                file_id: {"status": "failed"} for file_id in ids
+            }
             mock_drive_service.download_file.return_value = True
             mock_drive_service_cls.return_value = mock_drive_service
             mock_converter = MagicMock()
             mock_converter.convert.return_value = convert_success
-            mock_converter_cls.return_value = mock_converter
+            mock_converter.convert.side_effect = convert_error
+            mock_converter_cls.return_value = convert_inline(mock_converter)
 
             def exists_side_effect(path):
                 if path.endswith(".dng"):
@@ -261,6 +330,30 @@ class TestConversionCases(unittest.TestCase):
         self.assertTrue(mock_converter.convert.called)
         self.assertFalse(mock_move_to_archive.called)
 
+    def test_conversion_error_does_not_stop_the_run(self):
+        mock_drive_service, mock_converter, mock_move_to_archive = (
+            self.run_main_with_conversion_result(
+                convert_error=RuntimeError("Error converting")
+            )
+        )
+        # convert marks the file as failed itself before raising
+        self.assertFalse(mock_drive_service.mark_file_as_failed.called)
+        self.assertFalse(mock_move_to_archive.called)
+        mock_converter.shutdown.assert_called_once()
+        mock_drive_service.flush_status_writes.assert_called_once()
+
+    def test_converted_file_not_uploaded_is_failed_on_abort(self):
+        mock_drive_service, mock_converter, mock_move_to_archive = (
+            self.run_main_with_conversion_result(upload_error=OSError("NAS gone"))
+        )
+        # The file is marked processed but was never uploaded, so the next
+        # run must be able to claim it again
+        mock_drive_service.mark_file_as_failed.assert_called_once()
+        kwargs = mock_drive_service.mark_file_as_failed.call_args.kwargs
+        self.assertEqual(kwargs["file_id"], "file1")
+        self.assertIn("Run stopped", kwargs["error_message"])
+        self.assertFalse(mock_move_to_archive.called)
+
     def test_dng_file_already_exists(self):
         with patch("main.load_dotenv"), patch("main.get_logger"), patch(
             "main.clean_download_directories", return_value=(0, 0)
@@ -269,7 +362,7 @@ class TestConversionCases(unittest.TestCase):
         ) as mock_drive_service_cls, patch(
             "main.RawFileConverter"
         ) as mock_converter_cls, patch(
-            "main.move_to_archive"
+            "main.move_files_to_archive"
         ) as mock_move_to_archive, patch(
             "os.path.exists"
         ) as mock_exists:
@@ -277,14 +370,16 @@ class TestConversionCases(unittest.TestCase):
             mock_synology.return_value.get_api_info.return_value = {}
             mock_synology.return_value.upload.return_value = True
             mock_drive_service = MagicMock()
-            mock_drive_service.list_files.return_value = [
+            mock_drive_service.iter_files.return_value = [
                 {"id": "file1", "name": "test1.cr3"},
             ]
-            mock_drive_service.get_file_status.return_value = {"status": "failed"}
+            mock_drive_service.get_file_statuses.side_effect = lambda ids: {
+                file_id: {"status": "failed"} for file_id in ids
+            }
             mock_drive_service.download_file.return_value = True
             mock_drive_service_cls.return_value = mock_drive_service
             mock_converter = MagicMock()
-            mock_converter_cls.return_value = mock_converter
+            mock_converter_cls.return_value = convert_inline(mock_converter)
 
             def exists_side_effect(path):
                 if path.endswith(".dng"):
@@ -326,7 +421,9 @@ class TestUploadCases(unittest.TestCase):
         self.env_patch.stop()
         self.uname_patch.stop()
 
-    def run_main_with_upload_result(self, upload_success=True, dng_file_exists=True):
+    def run_main_with_upload_result(
+        self, upload_success=True, dng_file_exists=True, files=None
+    ):
         with patch("main.load_dotenv"), patch("main.get_logger"), patch(
             "main.clean_download_directories", return_value=(0, 0)
         ), patch("main.SynologyService") as mock_synology_cls, patch(
@@ -334,7 +431,7 @@ class TestUploadCases(unittest.TestCase):
         ) as mock_drive_service_cls, patch(
             "main.RawFileConverter"
         ) as mock_converter_cls, patch(
-            "main.move_to_archive"
+            "main.move_files_to_archive"
         ) as mock_move_to_archive, patch(
             "os.path.exists"
         ) as mock_exists:
@@ -345,16 +442,25 @@ class TestUploadCases(unittest.TestCase):
             mock_synology_cls.return_value = mock_synology
 
             mock_drive_service = MagicMock()
-            mock_drive_service.list_files.return_value = [
+            mock_drive_service.iter_files.return_value = files or [
                 {"id": "file1", "name": "test1.cr3"},
             ]
-            mock_drive_service.get_file_status.return_value = {"status": "failed"}
+            mock_drive_service.iter_files_breadth_first.return_value = (
+                mock_drive_service.iter_files.return_value
+            )
+            mock_drive_service.iter_changed_files.return_value = (
+                mock_drive_service.iter_files.return_value
+            )
+            mock_drive_service.get_file_statuses.side_effect = lambda ids: {
+                file_id: {"status": "failed"} for file_id in ids
+            }
             mock_drive_service.download_file.return_value = True
             mock_drive_service_cls.return_value = mock_drive_service
+            self.mock_synology_cls = mock_synology_cls
 
             mock_converter = MagicMock()
             mock_converter.convert.return_value = True
-            mock_converter_cls.return_value = mock_converter
+            mock_converter_cls.return_value = convert_inline(mock_converter)
 
             # Patch os.path.exists for dng_file_path
             def exists_side_effect(path):
@@ -383,6 +489,36 @@ class TestUploadCases(unittest.TestCase):
         self.assertTrue(mock_drive_service.mark_file_as_failed.called)
         self.assertTrue(mock_synology.upload.called)
 
+    def test_breadth_first_discovery(self):
+        with patch.dict("os.environ", {"DRIVE_DISCOVERY": "breadth_first"}):
+            mock_drive_service, mock_synology = self.run_main_with_upload_result()
+
+        mock_drive_service.iter_files_breadth_first.assert_called_once_with(
+            raw_only=True
+        )
+        mock_drive_service.iter_files.assert_not_called()
+        self.assertTrue(mock_synology.upload.called)
+
+    def test_changes_discovery_commits_token_after_processing(self):
+        with patch.dict("os.environ", {"DRIVE_DISCOVERY": "changes"}):
+            mock_drive_service, mock_synology = self.run_main_with_upload_result(
+                upload_success=False
+            )
+
+        mock_drive_service.iter_changed_files.assert_called_once()
+        self.assertTrue(mock_synology.upload.called)
+        mock_drive_service.commit_changes_state.assert_called_once()
+
+    def test_synology_service_created_once(self):
+        mock_drive_service, mock_synology = self.run_main_with_upload_result(
+            files=[
+                {"id": "file1", "name": "test1.cr3"},
+                {"id": "file2", "name": "test2.cr3"},
+            ]
+        )
+        self.assertEqual(mock_synology.upload.call_count, 2)
+        self.mock_synology_cls.assert_called_once_with("firebase_creds_path")
+
     def test_dng_file_missing(self):
         mock_drive_service, mock_synology = self.run_main_with_upload_result(
             upload_success=True, dng_file_exists=False
@@ -395,3 +531,102 @@ class TestUploadCases(unittest.TestCase):
 
 if __name__ == "__main__":
     unittest.main()
+
+
+class TestArchiveFiles(unittest.TestCase):
+    def test_moved_files_are_dropped_from_cached_listings(self):
+        listing_cache = MagicMock()
+        files = [
+            {"id": "a", "name": "a.cr3", "parents": ["shoot1"]},
+            {"id": "b", "name": "b.cr3", "parents": ["shoot1"]},
+            {"id": "c", "name": "c.cr3", "parents": ["shoot2"]},
+        ]
+
+        with patch(
+            "main.move_files_to_archive",
+            return_value={"a": True, "b": False, "c": True},
+        ):
+            main_mod.archive_files(MagicMock(), files, "archive", listing_cache)
+
+        self.assertEqual(
+            [call.args for call in listing_cache.remove_files.call_args_list],
+            [("shoot1", ["a"]), ("shoot2", ["c"])],
+        )
+        listing_cache.save.assert_called_once()
+
+
+class TestIterPendingFiles(unittest.TestCase):
+    def test_statuses_are_looked_up_in_bulk_per_chunk(self):
+        drive_service = MagicMock()
+        statuses = {"a": {"status": "uploaded"}, "c": {"status": "failed"}}
+        drive_service.get_file_statuses.side_effect = lambda ids: {
+            file_id: statuses.get(file_id) for file_id in ids
+        }
+        files = [{"id": file_id, "name": f"{file_id}.cr3"} for file_id in "abcde"]
+
+        pending = list(main_mod.iter_pending_files(drive_service, files, chunk_size=2))
+
+        self.assertEqual([file["id"] for file in pending], ["b", "c", "d", "e"])
+        self.assertEqual(
+            [call.args[0] for call in drive_service.get_file_statuses.call_args_list],
+            [["a", "b"], ["c", "d"], ["e"]],
+        )
+        drive_service.get_file_status.assert_not_called()
+
+    def test_idle_worker_steals_files_buffered_by_a_busy_worker(self):
+        workers = FakeWorkers()
+        busy = WorkPartitioner(workers, "mac-1")
+        idle = WorkPartitioner(workers, "mac-2")
+        busy.heartbeat()
+        idle.heartbeat()
+        busy.heartbeat()
+
+        drive_service = MagicMock()
+        drive_service.get_file_statuses.side_effect = lambda ids: {
+            file_id: None for file_id in ids
+        }
+        listing = [{"id": f"file{i}", "name": f"file{i}.cr3"} for i in range(100)]
+
+        # The busy worker has listed everything but only finished one file
+        busy_pending = main_mod.iter_pending_files(
+            drive_service, busy.assign(listing), chunk_size=10
+        )
+        busy_files = list(busy_pending)
+        busy.complete(busy_files[0]["id"])
+        busy.heartbeat()
+        self.assertGreater(
+            workers.documents["mac-1"]["backlog"], work_partitioner.STEAL_MIN_BACKLOG
+        )
+
+        idle.heartbeat()
+        idle_files = list(
+            main_mod.iter_pending_files(
+                drive_service, idle.assign(listing), chunk_size=10
+            )
+        )
+
+        stolen = [file for file in idle_files if idle.owner(file["id"]) == "mac-1"]
+        self.assertTrue(stolen)
+        self.assertEqual(stolen[0], busy_files[-1])
+
+    def test_uploaded_files_are_queued_for_archiving(self):
+        drive_service = MagicMock()
+        statuses = {
+            "a": {"status": "uploaded"},
+            "b": {"status": "archived"},
+            "c": {"status": "processed"},
+        }
+        drive_service.get_file_statuses.side_effect = lambda ids: {
+            file_id: statuses.get(file_id) for file_id in ids
+        }
+        files = [{"id": file_id, "name": f"{file_id}.cr3"} for file_id in "abcd"]
+        archive_queue = []
+
+        pending = list(
+            main_mod.iter_pending_files(
+                drive_service, files, chunk_size=2, archive_queue=archive_queue
+            )
+        )
+
+        self.assertEqual([file["id"] for file in pending], ["d"])
+        self.assertEqual([file["id"] for file in archive_queue], ["a", "b"])
@@ -0,0 +1,136 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from rate_limiter import (
+    ConcurrencyController,
+    DriveRateLimiter,
+    TokenBucket,
+    is_retryable,
+    is_throttled,
+)
+
+
+def http_error(status, reason=None, headers=None):
+    resp = MagicMock(status=status)
+    resp.get.side_effect = (headers or {}).get
+    content = b"error"
+    if reason:
+        content = json.dumps({"error": {"errors": [{"reason": reason}]}}).encode()
+    return HttpError(resp, content)
+
+
+@pytest.mark.parametrize(
+    "error,throttled,retryable",
+    [
+        (http_error(429), True, True),
+        (http_error(403, "rateLimitExceeded"), True, True),
+        (http_error(403, "userRateLimitExceeded"), True, True),
+        (http_error(403, "insufficientFilePermissions"), False, False),
+        (http_error(500), False, True),
+        (http_error(503), False, True),
+        (http_error(404), False, False),
+        (ConnectionError("reset"), False, True),
+        (ValueError("bad"), False, False),
+    ],
+)
+def test_error_classification(error, throttled, retryable):
+    assert is_throttled(error) is throttled
+    assert is_retryable(error) is retryable
+
+
+def test_token_bucket_waits_for_refill():
+    clock = [0.0]
+
+    def sleep(seconds):
+        clock[0] += seconds
+
+    with patch("rate_limiter.time.monotonic", side_effect=lambda: clock[0]), patch(
+        "rate_limiter.time.sleep", side_effect=sleep
+    ):
+        bucket = TokenBucket(rate=10, capacity=2)
+        assert bucket.acquire(1) == 0
+        assert bucket.acquire(1) == 0
+        waited = bucket.acquire(1)
+
+    assert waited == pytest.approx(0.1)
+    assert clock[0] == pytest.approx(0.1)
+
+
+def test_execute_retries_with_backoff_then_succeeds():
+    limiter = DriveRateLimiter(rate=1e9)
+    controller = ConcurrencyController(4)
+    call = MagicMock(side_effect=[http_error(429), http_error(500), "ok"])
+
+    with patch("rate_limiter.time.sleep") as mock_sleep:
+        assert limiter.execute(call, "files.list", controller=controller) == "ok"
+
+    assert call.call_count == 3
+    assert mock_sleep.call_count == 2
+    assert controller.limit == 2
+
+
+def test_execute_does_not_retry_permanent_errors():
+    limiter = DriveRateLimiter(rate=1e9)
+    call = MagicMock(side_effect=http_error(404))
+
+    with patch("rate_limiter.time.sleep") as mock_sleep:
+        with pytest.raises(HttpError):
+            limiter.execute(call, "files.get")
+
+    call.assert_called_once()
+    mock_sleep.assert_not_called()
+
+
+def test_execute_gives_up_after_max_retries():
+    limiter = DriveRateLimiter(rate=1e9, max_retries=2)
+    call = MagicMock(side_effect=http_error(503))
+
+    with patch("rate_limiter.time.sleep"):
+        with pytest.raises(HttpError):
+            limiter.execute(call, "files.list")
+
+    assert call.call_count == 3
+
+
+def test_backoff_is_jittered_and_honours_retry_after():
+    limiter = DriveRateLimiter(base_delay=1, max_delay=8)
+
+    for attempt in range(6):
+        assert 0 <= limiter.backoff(attempt) <= min(8, 2**attempt)
+
+    assert limiter.backoff(0, http_error(429, headers={"retry-after": "5"})) >= 5
+
+
+def test_concurrency_controller_aimd():
+    changes = []
+    controller = ConcurrencyController(8, on_change=changes.append, cooldown=0)
+
+    controller.on_throttle()
+    controller.on_throttle()
+    assert controller.limit == 2
+
+    for _ in range(2):
+        controller.on_success()
+    assert controller.limit == 3
+    for _ in range(3):
+        controller.on_success()
+    assert controller.limit == 4
+    assert changes == [4, 2, 3, 4]
+
+
+def test_concurrency_controller_cooldown_and_bounds():
+    controller = ConcurrencyController(8, min_limit=2, cooldown=60)
+
+    controller.on_throttle()
+    controller.on_throttle()
+    assert controller.limit == 4
+
+    controller = ConcurrencyController(2, min_limit=2, cooldown=0)
+    controller.on_throttle()
+    assert controller.limit == 2
+    for _ in range(10):
+        controller.on_success()
+    assert controller.limit == 2
@@ -1,4 +1,5 @@
 import os
+import threading
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -23,7 +24,7 @@ def test_init_with_service(mock_firestore_service):
 
 def test_init_creates_service():
     """Test initializing without a service creates a new FirestoreService."""
-    with patch("raw_converter.FirestoreService") as mock_firestore_cls:
+    with patch("raw_converter.create_status_store") as mock_firestore_cls:
         mock_service = MagicMock()
         mock_firestore_cls.return_value = mock_service
 
@@ -134,7 +135,7 @@ def test_convert_missing_converter():
     output_dir = "/tmp/output"
     file_id = "test_file_id"
 
-    with patch("raw_converter.FirestoreService") as mock_firestore_cls:
+    with patch("raw_converter.create_status_store") as mock_firestore_cls:
         mock_service = MagicMock()
         mock_service.is_uploaded.return_value = False
         mock_service.is_processed.return_value = False
@@ -156,7 +157,7 @@ def test_convert_successful():
     output_dir = "/tmp/output"
     file_id = "test_file_id"
 
-    with patch("raw_converter.FirestoreService") as mock_firestore_cls:
+    with patch("raw_converter.create_status_store") as mock_firestore_cls:
         mock_service = MagicMock()
         mock_service.is_uploaded.return_value = False
         mock_service.is_processed.return_value = False
@@ -194,7 +195,7 @@ def test_convert_failure():
     output_dir = "/tmp/output"
     file_id = "test_file_id"
 
-    with patch("raw_converter.FirestoreService") as mock_firestore_cls:
+    with patch("raw_converter.create_status_store") as mock_firestore_cls:
         mock_service = MagicMock()
         mock_service.is_uploaded.return_value = False
         mock_service.is_processed.return_value = False
@@ -222,9 +223,9 @@ def test_convert_failure():
             # Should mark as failed
             mock_service.mark_as_failed.assert_called_once()
             # Check error message
-            args = mock_service.mark_as_failed.call_args[0]
-            assert args[0] == file_id
-            assert "Conversion error" in args[1]
+            args = mock_service.mark_as_failed.call_args
+            assert args[0][0] == file_id
+            assert "Conversion error" in args[1]["error_message"]
 
 
 def test_mark_as_failed(mock_firestore_service):
@@ -240,7 +241,7 @@ def test_mark_as_failed(mock_firestore_service):
 
     assert result is True
     mock_firestore_service.mark_as_failed.assert_called_once_with(
-        file_id, error_message, machine_id
+        file_id, machine_id=machine_id, error_message=error_message
     )
 
 
@@ -250,7 +251,7 @@ def test_convert_dng_file_not_found():
     output_dir = "/tmp/output"
     file_id = "test_file_id"
 
-    with patch("raw_converter.FirestoreService") as mock_firestore_cls:
+    with patch("raw_converter.create_status_store") as mock_firestore_cls:
         mock_service = MagicMock()
         mock_service.is_uploaded.return_value = False
         mock_service.is_processed.return_value = False
@@ -280,9 +281,9 @@ def test_convert_dng_file_not_found():
             # Should mark as failed with appropriate message
             mock_service.mark_as_failed.assert_called_once()
 
-            call_args = mock_service.mark_as_failed.call_args[0]
-            assert call_args[0] == file_id
-            assert "DNG file not found" in call_args[1]
+            call_args = mock_service.mark_as_failed.call_args
+            assert call_args[0][0] == file_id
+            assert "DNG file not found" in call_args[1]["error_message"]
 
             # Should not mark as processed
             mock_service.mark_as_processed.assert_not_called()
@@ -308,3 +309,113 @@ def test_convert_skip_if_uploaded(mock_firestore_service):
     # Should not mark as processing or processed
     mock_firestore_service.mark_as_processing.assert_not_called()
     mock_firestore_service.mark_as_processed.assert_not_called()
+
+
+def test_convert_many_runs_conversions_concurrently(mock_firestore_service):
+    """Test convert_many keeps max_workers conversions running at once."""
+    converter = RawFileConverter(
+        firestore_service=mock_firestore_service, max_workers=3
+    )
+    barrier = threading.Barrier(3, timeout=5)
+
+    def convert(file_path, output_dir, file_id, already_marked):
+        # Only passes once three conversions run at the same time
+        barrier.wait()
+        return True
+
+    jobs = [
+        {"file_path": f"/tmp/{i}.cr3", "output_dir": "/tmp/out", "file_id": str(i)}
+        for i in range(6)
+    ]
+    with patch.object(converter, "convert", side_effect=convert):
+        results = list(converter.convert_many(jobs))
+    converter.shutdown()
+
+    assert sorted(job["file_id"] for job, _, _ in results) == [str(i) for i in range(6)]
+    assert all(converted is True and error is None for _, converted, error in results)
+    assert converter.job_status("0") == "converted"
+
+
+def test_convert_many_pulls_jobs_as_slots_free_up(mock_firestore_service):
+    """Test convert_many does not take more jobs than it can run."""
+    converter = RawFileConverter(
+        firestore_service=mock_firestore_service, max_workers=2
+    )
+    taken = []
+
+    def jobs():
+        for i in range(5):
+            taken.append(i)
+            yield {"file_path": f"/tmp/{i}.cr3", "output_dir": "/tmp/out"}
+
+    with patch.object(converter, "convert", return_value=True):
+        stream = converter.convert_many(jobs())
+        next(stream)
+        assert len(taken) <= 3
+        assert len(list(stream)) == 4
+    converter.shutdown()
+
+
+def test_convert_many_reports_errors_per_job(mock_firestore_service):
+    """Test a failing conversion is reported without stopping the others."""
+    converter = RawFileConverter(
+        firestore_service=mock_firestore_service, max_workers=2
+    )
+
+    def convert(file_path, output_dir, file_id, already_marked):
+        if file_id == "bad":
+            raise RuntimeError("Error converting")
+        return file_id != "skipped"
+
+    jobs = [
+        {
+            "file_path": f"/tmp/{file_id}.cr3",
+            "output_dir": "/tmp/out",
+            "file_id": file_id,
+        }
+        for file_id in ("good", "bad", "skipped")
+    ]
+    with patch.object(converter, "convert", side_effect=convert):
+        results = {
+            job["file_id"]: (converted, error)
+            for job, converted, error in converter.convert_many(jobs)
+        }
+    converter.shutdown()
+
+    assert results["good"] == (True, None)
+    assert results["skipped"] == (False, None)
+    assert results["bad"][0] is False
+    assert isinstance(results["bad"][1], RuntimeError)
+    assert converter.job_status("good") == "converted"
+    assert converter.job_status("bad") == "failed"
+    assert converter.job_status("skipped") == "skipped"
+    assert converter.job_status("unknown") is None
+
+
+def test_convert_many_finishes_running_jobs_when_source_fails(
+    mock_firestore_service,
+):
+    """Test conversions already running are yielded before a source error."""
+    converter = RawFileConverter(
+        firestore_service=mock_firestore_service, max_workers=2
+    )
+
+    def jobs():
+        yield {"file_path": "/tmp/0.cr3", "output_dir": "/tmp/out", "file_id": "0"}
+        raise ConnectionError("claim failed")
+
+    results = []
+    with patch.object(converter, "convert", return_value=True):
+        with pytest.raises(ConnectionError):
+            for job, converted, error in converter.convert_many(jobs()):
+                results.append((job["file_id"], converted, error))
+    converter.shutdown()
+
+    assert results == [("0", True, None)]
+
+
+def test_max_workers_defaults_to_environment(mock_firestore_service):
+    """Test CONVERT_WORKERS sets the pool size."""
+    with patch.dict(os.environ, {"CONVERT_WORKERS": "5"}):
+        converter = RawFileConverter(firestore_service=mock_firestore_service)
+    assert converter.max_workers == 5
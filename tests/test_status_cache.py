@@ -0,0 +1,78 @@
+from unittest.mock import MagicMock
+
+from status_cache import RunStatusCache
+
+
+def make_cache(statuses):
+    firestore_service = MagicMock()
+    firestore_service.get_file_status.side_effect = lambda file_id: statuses.get(
+        file_id
+    )
+    firestore_service.get_file_statuses.side_effect = lambda file_ids: {
+        file_id: statuses.get(file_id) for file_id in file_ids
+    }
+    return RunStatusCache(firestore_service), firestore_service
+
+
+def test_each_document_is_read_once():
+    cache, firestore_service = make_cache({"a": {"status": "failed"}})
+
+    assert cache.get_file_status("a") == {"status": "failed"}
+    assert cache.is_uploaded("a") is False
+    assert cache.is_processed("a") is False
+    assert cache.get_file_status("missing") is None
+    assert cache.get_file_status("missing") is None
+
+    assert firestore_service.get_file_status.call_count == 2
+    assert cache.stats() == {"hits": 3, "misses": 2, "entries": 2}
+
+
+def test_bulk_lookup_only_reads_uncached_documents():
+    cache, firestore_service = make_cache(
+        {"a": {"status": "uploaded"}, "b": {"status": "failed"}}
+    )
+    cache.get_file_status("a")
+
+    statuses = cache.get_file_statuses(["a", "b", "c"])
+
+    assert statuses == {
+        "a": {"status": "uploaded"},
+        "b": {"status": "failed"},
+        "c": None,
+    }
+    firestore_service.get_file_statuses.assert_called_once_with(["b", "c"])
+    assert cache.is_uploaded("a") is True
+    firestore_service.get_file_status.assert_called_once_with("a")
+
+
+def test_writes_update_the_cached_status():
+    cache, firestore_service = make_cache({"a": {"status": "failed", "retry_count": 1}})
+    cache.get_file_statuses(["a"])
+
+    firestore_service.mark_as_processing.return_value = True
+    assert cache.mark_as_processing("a", "machine") is True
+    assert cache.get_file_status("a")["status"] == "processing"
+
+    cache.mark_as_failed("a", "machine", "error", defer=True)
+    assert cache.get_file_status("a")["retry_count"] == 2
+    firestore_service.mark_as_failed.assert_called_once_with(
+        "a", "machine", "error", defer=True
+    )
+
+    cache.mark_as_uploaded("a", "machine", {"dng_dest": "/nas"})
+    assert cache.is_uploaded("a") is True
+    assert cache.get_file_status("a")["dng_dest"] == "/nas"
+
+    firestore_service.get_file_status.assert_not_called()
+    firestore_service.get_file_statuses.assert_called_once()
+
+
+def test_lost_claim_forgets_the_cached_status():
+    cache, firestore_service = make_cache({"a": None})
+    cache.get_file_status("a")
+    firestore_service.mark_as_processing.return_value = False
+
+    assert cache.mark_as_processing("a", "machine") is False
+    cache.get_file_status("a")
+
+    assert firestore_service.get_file_status.call_count == 2
@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+from status_compaction import (
+    COMPACTION_BATCH_SIZE,
+    archive_shard,
+    compact_uploaded_statuses,
+)
+
+
+def make_doc(file_id, data):
+    doc = MagicMock()
+    doc.id = file_id
+    doc.to_dict.return_value = data
+    return doc
+
+
+def make_collection(docs, page_size=COMPACTION_BATCH_SIZE):
+    db = MagicMock()
+    collection = MagicMock()
+    collection.id = "processed_files"
+
+    pages = {}
+    for start in range(0, len(docs), page_size):
+        pages[docs[start - 1].id if start else None] = docs[start : start + page_size]
+
+    query = collection.where.return_value.order_by.return_value.limit.return_value
+    query.stream.side_effect = lambda: iter(pages.get(None, []))
+    query.start_after.side_effect = lambda last: MagicMock(
+        stream=lambda: iter(pages.get(last.id, []))
+    )
+    return db, collection
+
+
+def days_ago(days):
+    return (datetime.now() - timedelta(days=days)).isoformat()
+
+
+def test_archive_shard_is_stable_per_day():
+    assert archive_shard("file", "2026-01-02") == archive_shard("file", "2026-01-02")
+    assert archive_shard("file", "2026-01-02").startswith("2026-01-02-")
+
+
+def test_old_uploaded_documents_are_compacted():
+    old = make_doc(
+        "old",
+        {
+            "status": "uploaded",
+            "processed_at": days_ago(40),
+            "converted_filename": "old.dng",
+            "error_message": "dropped",
+        },
+    )
+    recent = make_doc("recent", {"status": "uploaded", "processed_at": days_ago(1)})
+    db, collection = make_collection([old, recent])
+
+    assert compact_uploaded_statuses(db, collection, older_than_days=30) == 1
+
+    status_filter = collection.where.call_args.kwargs["filter"]
+    assert (status_filter.field_path, status_filter.op_string, status_filter.value) == (
+        "status",
+        "==",
+        "uploaded",
+    )
+
+    db.collection.assert_called_once_with("processed_files_archive")
+    batch = db.batch.return_value
+    batch.commit.assert_called_once()
+    assert batch.set.call_count == 2
+
+    tombstone_ref, tombstone = batch.set.call_args_list[0].args
+    assert tombstone_ref is old.reference
+    assert tombstone["status"] == "archived"
+    assert tombstone["expire_at"] > datetime.now(timezone.utc) + timedelta(days=300)
+    assert "converted_filename" not in tombstone
+
+    _, summary = batch.set.call_args_list[1].args
+    assert batch.set.call_args_list[1].kwargs == {"merge": True}
+    day = datetime.fromisoformat(old.to_dict()["processed_at"]).date().isoformat()
+    assert summary["day"] == day
+    assert summary["files"]["old"]["converted_filename"] == "old.dng"
+    assert "error_message" not in summary["files"]["old"]
+    db.collection.return_value.document.assert_called_once_with(
+        tombstone["archive_shard"]
+    )
+
+
+def test_dry_run_writes_nothing():
+    db, collection = make_collection(
+        [make_doc("old", {"status": "uploaded", "processed_at": days_ago(40)})]
+    )
+
+    assert compact_uploaded_statuses(db, collection, dry_run=True) == 1
+    db.batch.assert_not_called()
+
+
+def test_large_collections_are_compacted_in_batches():
+    docs = [
+        make_doc(f"f{i}", {"status": "uploaded", "processed_at": days_ago(40)})
+        for i in range(450)
+    ]
+    db, collection = make_collection(docs)
+
+    assert compact_uploaded_statuses(db, collection) == 450
+    assert db.batch.return_value.commit.call_count == 3
+
+    query = collection.where.return_value.order_by.return_value.limit.return_value
+    collection.where.return_value.order_by.assert_called_once_with("__name__")
+    assert [call.args[0] for call in query.start_after.call_args_list] == [
+        docs[199],
+        docs[399],
+    ]
+
+
+def test_pages_without_old_documents_are_skipped():
+    docs = [
+        make_doc(f"f{i}", {"status": "uploaded", "processed_at": days_ago(1)})
+        for i in range(3)
+    ] + [make_doc("old", {"status": "uploaded", "processed_at": days_ago(40)})]
+    db, collection = make_collection(docs, page_size=3)
+
+    with patch("status_compaction.COMPACTION_BATCH_SIZE", 3):
+        assert compact_uploaded_statuses(db, collection) == 1
+
+    batch = db.batch.return_value
+    batch.commit.assert_called_once()
+    assert batch.set.call_args_list[0].args[0] is docs[3].reference
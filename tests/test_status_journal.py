@@ -0,0 +1,179 @@
+from unittest.mock import MagicMock
+
+import pytest
+from google.cloud import firestore
+
+from status_journal import StatusJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = StatusJournal(path=str(tmp_path / "journal.db"), sync_interval=3600)
+    yield journal
+    journal.stop()
+
+
+def make_collection(remote=None):
+    remote = remote or {}
+    db = MagicMock()
+    collection = MagicMock()
+    collection.id = "processed_files"
+
+    def document(file_id):
+        doc_ref = MagicMock()
+        doc_ref.id = file_id
+        return doc_ref
+
+    def get_all(doc_refs):
+        for doc_ref in doc_refs:
+            doc = MagicMock()
+            doc.id = doc_ref.id
+            doc.exists = doc_ref.id in remote
+            doc.to_dict.return_value = remote.get(doc_ref.id)
+            yield doc
+
+    collection.document.side_effect = document
+    db.get_all.side_effect = get_all
+    return db, collection
+
+
+def test_journal_uses_wal_mode(journal):
+    mode = journal.conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+
+
+def test_record_answers_local_lookups(journal):
+    journal.record("processed_files", "a", {"status": "failed"}, {"retry_count": 1})
+    journal.record("processed_files", "a", {"status": "failed"}, {"retry_count": 1})
+
+    assert journal.lookup("processed_files", "a") == (
+        True,
+        {"status": "failed", "retry_count": 2},
+    )
+    assert journal.lookup("processed_files", "b") == (False, None)
+    assert journal.pending_count() == 2
+
+
+def test_sync_coalesces_and_clears_pushed_entries(journal):
+    db, collection = make_collection()
+    journal.record("processed_files", "a", {"status": "failed"}, {"retry_count": 1})
+    journal.record("processed_files", "a", {"status": "uploaded", "dng_dest": "/nas"})
+    journal.record("processed_files", "b", {"status": "processed"})
+
+    assert journal.sync(db, collection) == 3
+
+    batch = db.batch.return_value
+    assert batch.set.call_count == 2
+    doc_ref, data = batch.set.call_args_list[0].args
+    assert doc_ref.id == "a"
+    assert data == {
+        "status": "uploaded",
+        "dng_dest": "/nas",
+        "retry_count": firestore.Increment(1),
+    }
+    assert batch.set.call_args_list[0].kwargs == {"merge": True}
+    batch.commit.assert_called_once()
+    assert journal.pending_count() == 0
+
+
+def test_sync_of_one_file_leaves_others_pending(journal):
+    db, collection = make_collection()
+    journal.record("processed_files", "a", {"status": "failed"})
+    journal.record("processed_files", "b", {"status": "uploaded"})
+
+    assert journal.sync(db, collection, "a") == 1
+
+    doc_ref, _ = db.batch.return_value.set.call_args.args
+    assert doc_ref.id == "a"
+    assert journal.pending_count() == 1
+    assert journal.lookup("processed_files", "b") == (True, {"status": "uploaded"})
+
+
+def test_failed_sync_keeps_entries(journal):
+    db, collection = make_collection()
+    db.batch.return_value.commit.side_effect = ConnectionError("offline")
+    journal.record("processed_files", "a", {"status": "uploaded"})
+
+    with pytest.raises(ConnectionError):
+        journal.sync(db, collection)
+
+    assert journal.pending_count() == 1
+    db.batch.return_value.commit.side_effect = None
+    assert journal.sync(db, collection) == 1
+    assert journal.pending_count() == 0
+
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "journal.db")
+    first = StatusJournal(path=path)
+    first.record("processed_files", "a", {"status": "uploaded"})
+    first.conn.close()
+
+    second = StatusJournal(path=path)
+    db, collection = make_collection()
+    second.start(db, collection)
+
+    db.batch.return_value.set.assert_called_once()
+    assert second.pending_count() == 0
+    second.stop()
+
+
+def test_reconcile_takes_remote_state_for_synced_files(journal):
+    db, collection = make_collection(
+        {"a": {"status": "uploaded", "machine_id": "other"}}
+    )
+    journal.put("processed_files", "a", {"status": "failed"})
+    journal.put("processed_files", "gone", {"status": "failed"})
+
+    journal.reconcile(db, collection)
+
+    assert journal.lookup("processed_files", "a") == (
+        True,
+        {"status": "uploaded", "machine_id": "other"},
+    )
+    assert journal.lookup("processed_files", "gone") == (False, None)
+
+
+def test_put_keeps_unpushed_local_status(journal):
+    journal.record("processed_files", "a", {"status": "uploaded"})
+    journal.put("processed_files", "a", {"status": "processing"})
+
+    assert journal.lookup("processed_files", "a") == (True, {"status": "uploaded"})
+
+
+def test_sync_drops_settled_statuses(journal):
+    db, collection = make_collection()
+    journal.record("processed_files", "done", {"status": "uploaded"})
+    journal.record("processed_files", "retry", {"status": "failed"})
+    journal.put("processed_files", "claimed", {"status": "processing"})
+
+    journal.sync(db, collection)
+
+    assert journal.lookup("processed_files", "done") == (False, None)
+    assert journal.lookup("processed_files", "retry")[0] is True
+    assert journal.lookup("processed_files", "claimed")[0] is True
+
+
+def test_settled_status_is_kept_until_pushed(journal):
+    db, collection = make_collection()
+    db.batch.return_value.commit.side_effect = ConnectionError("offline")
+    journal.record("processed_files", "done", {"status": "uploaded"})
+
+    with pytest.raises(ConnectionError):
+        journal.sync(db, collection)
+
+    assert journal.lookup("processed_files", "done") == (
+        True,
+        {"status": "uploaded"},
+    )
+
+
+def test_reconcile_only_reads_files_in_flight(journal):
+    db, collection = make_collection()
+    journal.record("processed_files", "done", {"status": "uploaded"})
+    journal.record("processed_files", "retry", {"status": "failed"})
+
+    journal.reconcile(db, collection)
+
+    (doc_refs,) = db.get_all.call_args.args
+    assert [doc_ref.id for doc_ref in doc_refs] == ["retry"]
@@ -0,0 +1,102 @@
+from unittest.mock import MagicMock, patch
+
+from status_mirror import StatusMirror
+
+
+def make_change(kind, file_id, data=None):
+    change = MagicMock()
+    change.type.name = kind
+    change.document.id = file_id
+    change.document.to_dict.return_value = data or {}
+    return change
+
+
+def start_mirror(**kwargs):
+    collection = MagicMock()
+    mirror = StatusMirror(collection, **kwargs)
+    watch = collection.on_snapshot.return_value
+    if kwargs.get("non_terminal_only"):
+        watch = collection.where.return_value.on_snapshot.return_value
+    watch.is_active = True
+
+    def deliver(*changes):
+        mirror._on_snapshot([], list(changes), "2025-01-01T00:00:00Z")
+
+    return mirror, collection, watch, deliver
+
+
+def test_lookup_answers_from_snapshot():
+    mirror, collection, watch, deliver = start_mirror()
+    deliver(make_change("ADDED", "a", {"status": "uploaded"}))
+    assert mirror.start(timeout=0) is True
+
+    assert mirror.lookup("a") == (True, {"status": "uploaded"})
+    assert mirror.lookup("missing") == (True, None)
+
+    deliver(
+        make_change("MODIFIED", "a", {"status": "failed"}),
+        make_change("ADDED", "b", {"status": "processing"}),
+    )
+    assert mirror.lookup("a") == (True, {"status": "failed"})
+    assert mirror.lookup("b") == (True, {"status": "processing"})
+
+    deliver(make_change("REMOVED", "b"))
+    assert mirror.lookup("b") == (True, None)
+
+
+def test_lookup_unknown_until_synced():
+    mirror, collection, watch, deliver = start_mirror()
+
+    assert mirror.start(timeout=0) is False
+    assert mirror.lookup("a") == (False, None)
+    assert mirror.staleness() is None
+
+
+def test_lookup_falls_back_when_listener_disconnects():
+    mirror, collection, watch, deliver = start_mirror()
+    deliver(make_change("ADDED", "a", {"status": "uploaded"}))
+    mirror.start(timeout=0)
+
+    watch.is_active = False
+
+    assert mirror.is_live() is False
+    assert mirror.lookup("a") == (False, None)
+
+
+def test_lookup_falls_back_when_stale():
+    mirror, collection, watch, deliver = start_mirror(max_staleness=60)
+    with patch("status_mirror.time.monotonic", return_value=100.0):
+        deliver(make_change("ADDED", "a", {"status": "uploaded"}))
+        mirror.start(timeout=0)
+
+    with patch("status_mirror.time.monotonic", return_value=130.0):
+        assert mirror.staleness() == 30.0
+        assert mirror.lookup("a") == (True, {"status": "uploaded"})
+
+    with patch("status_mirror.time.monotonic", return_value=200.0):
+        assert mirror.lookup("a") == (False, None)
+
+
+def test_non_terminal_only_mirror():
+    mirror, collection, watch, deliver = start_mirror(non_terminal_only=True)
+    deliver(make_change("ADDED", "a", {"status": "processing"}))
+    mirror.start(timeout=0)
+
+    collection.where.assert_called_once()
+    assert mirror.lookup("a") == (True, {"status": "processing"})
+    # Terminal or unknown files are not in the subset and must be read directly
+    assert mirror.lookup("other") == (False, None)
+
+    mirror.put("a", {"status": "uploaded"})
+    assert mirror.lookup("a") == (False, None)
+
+
+def test_stop_unsubscribes():
+    mirror, collection, watch, deliver = start_mirror()
+    deliver()
+    mirror.start(timeout=0)
+
+    mirror.stop()
+
+    watch.unsubscribe.assert_called_once()
+    assert mirror.lookup("a") == (False, None)
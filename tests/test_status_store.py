@@ -0,0 +1,185 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from firestore_service import FirestoreService, clear_firestore_clients
+from status_store import (
+    InMemoryStatusStore,
+    LocalStatusStore,
+    SQLiteStatusStore,
+    StatusStore,
+    create_status_store,
+)
+
+# The Firestore store joins the suite when an emulator is available
+EMULATOR = os.environ.get("FIRESTORE_EMULATOR_HOST") and os.environ.get(
+    "FIREBASE_CREDENTIALS_PATH"
+)
+
+
+@pytest.fixture(
+    params=[
+        "memory",
+        "sqlite",
+        pytest.param(
+            "firestore",
+            marks=pytest.mark.skipif(
+                not EMULATOR, reason="FIRESTORE_EMULATOR_HOST not set"
+            ),
+        ),
+    ]
+)
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield InMemoryStatusStore()
+    elif request.param == "sqlite":
+        yield SQLiteStatusStore(path=str(tmp_path / "status.db"))
+    else:
+        clear_firestore_clients()
+        service = FirestoreService(collection_name=f"conformance_{time.time_ns()}")
+        yield service
+        service.stop_heartbeat()
+
+
+def test_stores_implement_the_protocol(store):
+    for name in StatusStore.__dict__:
+        if not name.startswith("_"):
+            assert callable(getattr(store, name)), name
+
+
+def test_unknown_file_has_no_status(store):
+    assert store.get_file_status("unknown") is None
+    assert store.is_processed("unknown") is False
+    assert store.is_uploaded("unknown") is False
+
+
+def test_claim_is_exclusive(store):
+    assert store.mark_as_processing("file", "machine-a") is True
+    assert store.mark_as_processing("file", "machine-b") is False
+
+    status = store.get_file_status("file")
+    assert status["status"] == "processing"
+    assert status["machine_id"] == "machine-a"
+    assert datetime.fromisoformat(status["lease_until"]) > datetime.now(timezone.utc)
+
+
+@pytest.mark.parametrize("mark", ["mark_as_uploaded", "mark_as_processed"])
+def test_done_file_cannot_be_claimed_again(store, mark):
+    assert store.mark_as_processing("file", "machine-a") is True
+    getattr(store, mark)("file", "machine-a")
+    store.flush()
+
+    assert store.mark_as_processing("file", "machine-b") is False
+    assert store.get_file_status("file")["status"] != "processing"
+
+
+def test_expired_claim_can_be_taken_over(store):
+    assert store.mark_as_processing("file", "machine-a", lease_seconds=-1) is True
+    assert store.mark_as_processing("file", "machine-b") is True
+    assert store.get_file_status("file")["machine_id"] == "machine-b"
+
+
+def test_renew_lease_only_for_the_holder(store):
+    store.mark_as_processing("file", "machine-a", lease_seconds=60)
+    before = datetime.fromisoformat(store.get_file_status("file")["lease_until"])
+
+    assert store.renew_lease("file", "machine-b") is False
+    assert store.renew_lease("file", "machine-a", lease_seconds=600) is True
+    after = datetime.fromisoformat(store.get_file_status("file")["lease_until"])
+    assert after - before > timedelta(seconds=500)
+
+
+def test_final_statuses(store):
+    store.mark_as_processing("processed", "machine")
+    store.mark_as_processed("processed", "machine", {"note": "ok"})
+    store.mark_as_uploaded("uploaded", "machine", {"dng_dest": "/nas"})
+    store.flush()
+
+    assert store.is_processed("processed") is True
+    assert store.is_uploaded("processed") is False
+    assert store.get_file_status("processed")["note"] == "ok"
+    assert store.is_uploaded("uploaded") is True
+    assert store.get_file_status("uploaded")["dng_dest"] == "/nas"
+
+
+def test_failures_are_counted_and_kept_across_claims(store):
+    store.mark_as_failed("file", "machine", "first")
+    store.mark_as_processing("file", "machine")
+    store.mark_as_failed("file", "machine", "second")
+    store.flush()
+
+    status = store.get_file_status("file")
+    assert status["status"] == "failed"
+    assert status["retry_count"] == 2
+    assert status["error_message"] == "second"
+
+
+def test_bulk_lookup(store):
+    store.mark_as_uploaded("a", "machine")
+    store.mark_as_failed("b", "machine")
+    store.flush()
+
+    statuses = store.get_file_statuses(["a", "b", "c", "a"])
+
+    assert set(statuses) == {"a", "b", "c"}
+    assert statuses["a"]["status"] == "uploaded"
+    assert statuses["b"]["status"] == "failed"
+    assert statuses["c"] is None
+
+
+def test_latency_benchmark(store, capsys):
+    """Time each operation; run with -s to see the per-backend figures."""
+    iterations = 50
+    operations = {
+        "mark_as_processing": lambda i: store.mark_as_processing(f"f{i}", "m"),
+        "mark_as_uploaded": lambda i: store.mark_as_uploaded(f"f{i}", "m"),
+        "get_file_status": lambda i: store.get_file_status(f"f{i}"),
+        "get_file_statuses": lambda i: store.get_file_statuses(
+            [f"f{j}" for j in range(i, i + 10)]
+        ),
+    }
+
+    with capsys.disabled():
+        print(f"\n{type(store).__name__}")
+        for name, operation in operations.items():
+            start = time.perf_counter()
+            for i in range(iterations):
+                operation(i)
+            elapsed = time.perf_counter() - start
+            print(f"  {name:<20} {elapsed / iterations * 1000:8.3f} ms/op")
+
+    assert store.is_uploaded("f0") is True
+
+
+def test_create_status_store_from_configuration(tmp_path, monkeypatch):
+    monkeypatch.setenv("STATUS_STORE", "memory")
+    assert isinstance(create_status_store(), InMemoryStatusStore)
+
+    monkeypatch.setenv("STATUS_STORE", "sqlite")
+    monkeypatch.setenv("STATUS_STORE_PATH", str(tmp_path / "status.db"))
+    store = create_status_store(collection_name="other")
+    assert isinstance(store, SQLiteStatusStore)
+    assert store.collection_name == "other"
+
+    with pytest.raises(ValueError, match="Unknown status store"):
+        create_status_store(backend="redis")
+
+
+def test_sqlite_store_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "status.db")
+    first = SQLiteStatusStore(path=path)
+    second = SQLiteStatusStore(path=path)
+
+    assert first.mark_as_processing("file", "machine-a") is True
+    assert second.mark_as_processing("file", "machine-b") is False
+
+
+def test_local_store_must_implement_storage_methods():
+    class ReadOnlyStore(LocalStatusStore):
+        def _read(self, file_ids):
+            return {}
+
+    with pytest.raises(TypeError):
+        ReadOnlyStore()
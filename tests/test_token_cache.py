@@ -0,0 +1,129 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import token_cache as token_cache_module
+from token_cache import TokenCache
+
+
+def make_credentials(token=None, expiry=None):
+    credentials = MagicMock()
+    credentials.service_account_email = "robot@example.iam.gserviceaccount.com"
+    credentials.scopes = ["https://www.googleapis.com/auth/drive"]
+    credentials.token = token
+    credentials.expiry = expiry
+    return credentials
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def test_store_and_apply_roundtrip(tmp_path):
+    path = str(tmp_path / "tokens.json")
+    cache = TokenCache(path)
+    expiry = utcnow().replace(microsecond=0) + timedelta(hours=1)
+
+    cache.store(make_credentials("token-1", expiry))
+
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    credentials = make_credentials()
+    assert cache.apply(credentials) is True
+    assert credentials.token == "token-1"
+    assert credentials.expiry == expiry
+
+
+def test_apply_ignores_token_close_to_expiry(tmp_path):
+    cache = TokenCache(str(tmp_path / "tokens.json"), refresh_margin=300)
+    cache.store(make_credentials("token-1", utcnow() + timedelta(seconds=60)))
+
+    credentials = make_credentials()
+    assert cache.apply(credentials) is False
+    assert credentials.token is None
+
+
+def test_apply_ignores_cache_readable_by_others(tmp_path):
+    path = str(tmp_path / "tokens.json")
+    cache = TokenCache(path)
+    cache.store(make_credentials("token-1", utcnow() + timedelta(hours=1)))
+    os.chmod(path, 0o644)
+
+    assert cache.apply(make_credentials()) is False
+
+
+def test_tokens_are_keyed_by_scopes(tmp_path):
+    path = str(tmp_path / "tokens.json")
+    cache = TokenCache(path)
+    cache.store(make_credentials("token-1", utcnow() + timedelta(hours=1)))
+
+    other = make_credentials()
+    other.scopes = ["https://www.googleapis.com/auth/datastore"]
+    assert cache.apply(other) is False
+
+    with open(path) as f:
+        assert len(json.load(f)) == 1
+
+
+@patch("token_cache.google.auth.transport.requests.Request")
+def test_ensure_fresh_reuses_cached_token(mock_request, tmp_path):
+    cache = TokenCache(str(tmp_path / "tokens.json"))
+    cache.store(make_credentials("token-1", utcnow() + timedelta(hours=1)))
+
+    credentials = make_credentials()
+    cache.ensure_fresh(credentials)
+
+    credentials.refresh.assert_not_called()
+    assert credentials.token == "token-1"
+    assert cache.tracked == [credentials]
+
+
+@patch("token_cache.google.auth.transport.requests.Request")
+def test_ensure_fresh_refreshes_and_stores(mock_request, tmp_path):
+    cache = TokenCache(str(tmp_path / "tokens.json"))
+    credentials = make_credentials()
+
+    def refresh(request):
+        credentials.token = "token-2"
+        credentials.expiry = utcnow() + timedelta(hours=1)
+
+    credentials.refresh.side_effect = refresh
+
+    cache.ensure_fresh(credentials)
+
+    credentials.refresh.assert_called_once()
+    restored = make_credentials()
+    assert cache.apply(restored) is True
+    assert restored.token == "token-2"
+
+
+def test_background_refresh_refreshes_tracked_credentials(tmp_path):
+    cache = TokenCache(str(tmp_path / "tokens.json"))
+    credentials = make_credentials("token-1", utcnow() + timedelta(hours=1))
+    cache.ensure_fresh(credentials)
+
+    # Simulate the token running out while the worker is idle
+    credentials.expiry = utcnow() + timedelta(seconds=10)
+    with patch.object(cache, "apply", return_value=False):
+        with patch("token_cache.google.auth.transport.requests.Request"):
+            cache.start_background_refresh(interval=0.01)
+            for _ in range(100):
+                if credentials.refresh.called:
+                    break
+                cache.stop_event.wait(0.01)
+            cache.stop_background_refresh()
+
+    credentials.refresh.assert_called()
+
+
+@pytest.mark.parametrize("value,enabled", [("1", True), ("0", False), (None, False)])
+def test_get_token_cache_is_opt_in(value, enabled, monkeypatch):
+    monkeypatch.setattr(token_cache_module, "_token_cache", None)
+    if value is None:
+        monkeypatch.delenv("TOKEN_CACHE", raising=False)
+    else:
+        monkeypatch.setenv("TOKEN_CACHE", value)
+
+    assert (token_cache_module.get_token_cache() is not None) is enabled
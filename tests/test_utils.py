@@ -408,11 +408,40 @@ class TestProcessFile:
         # Verify
         assert result is False
         mock_drive_service.download_file.assert_called_once_with(
-            "file123", "/tmp/download/test.cr3"
+            "file123", "/tmp/download/test.cr3", size=None, md5_checksum=None
         )
         mock_drive_service.mark_file_as_failed.assert_called_once()
         mock_converter.convert.assert_not_called()
 
+    def test_process_file_corrupt_download(self, mock_drive_service):
+        """Test a download that fails its integrity check marks the file failed"""
+        mock_drive_service.is_file_uploaded.return_value = False
+        mock_drive_service.is_file_processed.return_value = False
+        mock_drive_service.get_file_status.return_value = None
+        mock_drive_service.mark_file_as_processing.return_value = True
+        mock_drive_service.download_file.side_effect = utils.DownloadIntegrityError(
+            "file123", "md5Checksum", "abc", "def"
+        )
+        mock_converter = MagicMock()
+        test_file = {"id": "file123", "name": "test.cr3"}
+
+        result = utils.process_file(
+            mock_drive_service,
+            mock_converter,
+            test_file,
+            "test-machine",
+            "/tmp/download",
+            "/tmp/output",
+            "dng_folder_id",
+        )
+
+        assert result is False
+        error_msg = mock_drive_service.mark_file_as_failed.call_args.kwargs[
+            "error_message"
+        ]
+        assert error_msg.startswith("Corrupt download of test.cr3")
+        mock_converter.convert.assert_not_called()
+
     def test_process_file_conversion_failure(self, mock_drive_service):
         """Test handling file conversion failure"""
         # Setup mocks
@@ -512,6 +541,34 @@ class TestProcessFile:
             },
         )
 
+    def test_process_file_resumes_pending_upload(self, mock_drive_service, tmp_path):
+        """Test that an interrupted upload is resumed without reconverting"""
+        mock_drive_service.is_file_uploaded.return_value = False
+        mock_drive_service.is_file_processed.return_value = False
+        mock_drive_service.get_file_status.return_value = None
+        mock_drive_service.mark_file_as_processing.return_value = True
+        mock_drive_service.upload_file.return_value = "uploaded_dng_id"
+        mock_converter = MagicMock()
+        (tmp_path / "test.dng").write_bytes(b"dng")
+        (tmp_path / "test.dng.upload.json").write_text("{}")
+
+        result = utils.process_file(
+            mock_drive_service,
+            mock_converter,
+            {"id": "file123", "name": "test.cr3"},
+            "test-machine",
+            "/tmp/download",
+            str(tmp_path),
+            "dng_folder_id",
+        )
+
+        assert result is True
+        mock_drive_service.download_file.assert_not_called()
+        mock_converter.convert.assert_not_called()
+        mock_drive_service.upload_file.assert_called_once_with(
+            str(tmp_path / "test.dng"), "dng_folder_id"
+        )
+
     def test_process_file_exception(self, mock_drive_service):
         """Test handling unexpected exceptions during processing"""
         # Setup mocks
@@ -1017,7 +1074,7 @@ class TestMoveToArchive:
         assert result is True
         mock_drive_service.get_file_status.assert_called_once_with("file123")
         mock_drive_service.move_file.assert_called_once_with(
-            "file123", "archive_folder_id"
+            "file123", "archive_folder_id", previous_parents=None
         )
 
     def test_move_to_archive_not_uploaded(self, mock_drive_service):
@@ -1052,7 +1109,7 @@ class TestMoveToArchive:
         assert result is False
         mock_drive_service.get_file_status.assert_called_once_with("file123")
         mock_drive_service.move_file.assert_called_once_with(
-            "file123", "archive_folder_id"
+            "file123", "archive_folder_id", previous_parents=None
         )
 
     def test_move_to_archive_status_none(self, mock_drive_service):
@@ -1082,3 +1139,46 @@ class TestMoveToArchive:
         mock_drive_service.get_file_status.return_value = {"status": "uploaded"}
         with pytest.raises(KeyError):
             utils.move_to_archive(mock_drive_service, test_file, "archive_folder_id")
+
+
+class TestMoveFilesToArchive:
+    """Tests for move_files_to_archive function"""
+
+    def test_move_files_to_archive_retries_failures(self, mock_drive_service):
+        """Files that fail in the batch are retried individually"""
+        mock_drive_service.move_files_batch.return_value = {"a": True, "b": False}
+        mock_drive_service.move_file.return_value = ["archive_folder_id"]
+        files = [
+            {"id": "a", "name": "a.cr3", "parents": ["ingest"]},
+            {"id": "b", "name": "b.cr3", "parents": ["ingest"]},
+        ]
+
+        results = utils.move_files_to_archive(
+            mock_drive_service, files, "archive_folder_id"
+        )
+
+        assert results == {"a": True, "b": True}
+        mock_drive_service.get_file_status.assert_not_called()
+        mock_drive_service.move_files_batch.assert_called_once_with(
+            files, "archive_folder_id"
+        )
+        mock_drive_service.move_file.assert_called_once_with(
+            "b", "archive_folder_id", previous_parents=["ingest"]
+        )
+
+    def test_move_files_to_archive_reports_retry_failure(self, mock_drive_service):
+        """A file that fails both in the batch and on retry is reported as failed"""
+        mock_drive_service.move_files_batch.side_effect = Exception("Network error")
+        mock_drive_service.move_file.return_value = None
+        files = [{"id": "a", "name": "a.cr3", "parents": ["ingest"]}]
+
+        results = utils.move_files_to_archive(
+            mock_drive_service, files, "archive_folder_id"
+        )
+
+        assert results == {"a": False}
+
+    def test_move_files_to_archive_empty(self, mock_drive_service):
+        """Nothing is sent to Drive when there is nothing to archive"""
+        assert utils.move_files_to_archive(mock_drive_service, [], "archive") == {}
+        mock_drive_service.move_files_batch.assert_not_called()
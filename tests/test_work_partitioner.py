@@ -0,0 +1,173 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from work_partitioner import HashRing, WorkPartitioner
+
+
+class FakeWorkers:
+    """Worker registry collection backed by a dictionary."""
+
+    def __init__(self):
+        self.documents = {}
+
+    def document(self, worker_id):
+        doc_ref = MagicMock()
+        doc_ref.set.side_effect = lambda data: self.documents.__setitem__(
+            worker_id, data
+        )
+        doc_ref.delete.side_effect = lambda: self.documents.pop(worker_id, None)
+        return doc_ref
+
+    def stream(self):
+        for worker_id, data in list(self.documents.items()):
+            doc = MagicMock()
+            doc.id = worker_id
+            doc.to_dict.return_value = data
+            yield doc
+
+    def add_worker(self, worker_id, age=0, backlog=0, listing_done=True):
+        heartbeat_at = datetime.now(timezone.utc) - timedelta(seconds=age)
+        self.documents[worker_id] = {
+            "machine_id": worker_id,
+            "heartbeat_at": heartbeat_at,
+            "backlog": backlog,
+            "listing_done": listing_done,
+        }
+
+
+def files(count):
+    return [{"id": f"file{i}", "name": f"file{i}.cr3"} for i in range(count)]
+
+
+def test_ring_spreads_files_evenly():
+    ring = HashRing(["a", "b", "c"])
+    counts = Counter(ring.owner(f"file{i}") for i in range(3000))
+
+    assert set(counts) == {"a", "b", "c"}
+    assert min(counts.values()) > 600
+
+
+def test_ring_only_moves_files_of_removed_worker():
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b"])
+
+    for i in range(1000):
+        file_id = f"file{i}"
+        if before.owner(file_id) != "c":
+            assert after.owner(file_id) == before.owner(file_id)
+
+
+def test_workers_split_the_listing():
+    workers = FakeWorkers()
+    first = WorkPartitioner(workers, "mac-1")
+    second = WorkPartitioner(workers, "mac-2")
+    first.heartbeat()
+    second.heartbeat()
+    first.heartbeat()
+
+    listing = files(200)
+    taken_by_first = {file["id"] for file in first.assign(listing)}
+    taken_by_second = {file["id"] for file in second.assign(listing)}
+
+    assert taken_by_first.isdisjoint(taken_by_second)
+    assert taken_by_first | taken_by_second == {file["id"] for file in listing}
+
+
+def test_own_files_are_yielded_while_listing():
+    workers = FakeWorkers()
+    workers.add_worker("mac-2")
+    partitioner = WorkPartitioner(workers, "mac-1")
+    partitioner.heartbeat()
+
+    listed = []
+
+    def listing():
+        for file in files(100):
+            listed.append(file)
+            yield file
+
+    first = next(partitioner.assign(listing()))
+
+    assert partitioner.owner(first["id"]) == "mac-1"
+    assert listed[-1] is first
+    assert len(listed) < 100
+
+
+def test_stale_worker_partition_is_reassigned():
+    workers = FakeWorkers()
+    workers.add_worker("mac-2", age=600)
+    partitioner = WorkPartitioner(workers, "mac-1", stale_after=120)
+    partitioner.heartbeat()
+
+    assert len(list(partitioner.assign(files(50)))) == 50
+
+
+def test_idle_worker_steals_from_end_of_overloaded_partition():
+    workers = FakeWorkers()
+    workers.add_worker("mac-2", backlog=40)
+    partitioner = WorkPartitioner(workers, "mac-1")
+    partitioner.heartbeat()
+
+    listing = files(100)
+    assigned = list(partitioner.assign(listing))
+
+    assert len(assigned) == 100
+    others = [file for file in listing if partitioner.owner(file["id"]) == "mac-2"]
+    own_count = len(listing) - len(others)
+    assert assigned[own_count] == others[-1]
+
+
+def test_no_stealing_from_worker_without_backlog():
+    workers = FakeWorkers()
+    workers.add_worker("mac-2", backlog=0)
+    partitioner = WorkPartitioner(workers, "mac-1")
+    partitioner.heartbeat()
+
+    assigned = list(partitioner.assign(files(100)))
+
+    assert 0 < len(assigned) < 100
+    assert all(partitioner.owner(file["id"]) == "mac-1" for file in assigned)
+
+
+def test_no_stealing_from_worker_still_listing():
+    workers = FakeWorkers()
+    workers.add_worker("mac-2", backlog=40, listing_done=False)
+    partitioner = WorkPartitioner(workers, "mac-1")
+    partitioner.heartbeat()
+
+    assigned = list(partitioner.assign(files(100)))
+
+    assert 0 < len(assigned) < 100
+    assert all(partitioner.owner(file["id"]) == "mac-1" for file in assigned)
+
+
+def test_heartbeat_publishes_backlog_and_stop_deregisters():
+    workers = FakeWorkers()
+    partitioner = WorkPartitioner(workers, "mac-1", heartbeat_interval=3600)
+    partitioner.start()
+    assert workers.documents["mac-1"]["backlog"] == 0
+
+    assignment = partitioner.assign(files(5))
+    first = next(assignment)
+    next(assignment)
+    partitioner.complete(first["id"])
+    partitioner.heartbeat()
+    # The second file is still being handled
+    assert workers.documents["mac-1"]["backlog"] == 1
+    assert workers.documents["mac-1"]["listing_done"] is False
+
+    remaining = list(assignment)
+    partitioner.heartbeat()
+    # Handing out files does not complete them
+    assert workers.documents["mac-1"]["backlog"] == 4
+    assert workers.documents["mac-1"]["listing_done"] is True
+
+    for file in files(5):
+        partitioner.complete(file["id"])
+    partitioner.heartbeat()
+    assert len(remaining) == 3
+    assert workers.documents["mac-1"]["backlog"] == 0
+
+    partitioner.stop()
+    assert "mac-1" not in workers.documents